@@ -0,0 +1,74 @@
+"""Interned amenity vocabulary and the hotel -> amenity join table, kept in sync by SQLite triggers"""
+import string
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Hotel.amenities holds "WiFi, Pool, Spa" or a JSON array; either way it becomes a JSON array
+# for json_each. Commas never appear inside JSON escapes, so splitting the quoted string is safe.
+_SPLIT = ("CASE WHEN json_valid({col}) AND json_type({col}) = 'array' THEN {col} "
+          "ELSE '[' || replace(json_quote({col}), ',', '\",\"') || ']' END")
+# Trimmed, ASCII-lower-cased names; normalize_amenity() folds query values the same way
+_NAME = "lower(trim(value))"
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+TRIGGERS = ("hotel_amenities_ai", "hotel_amenities_ad", "hotel_amenities_au")
+
+
+def normalize_amenity(name: str) -> str:
+    """Fold a name like SQLite's lower(trim()), so it matches the interned vocabulary"""
+    return name.strip(" ").translate(_ASCII_LOWER)
+
+
+# The trigger statements skip duplicates themselves rather than with INSERT OR IGNORE: an upsert
+# (INSERT ... ON CONFLICT) on hotels overrides the conflict policy of statements in its triggers
+
+def _intern(row: str, source: str = "") -> str:
+    """Add a row's new amenity names to the vocabulary"""
+    split = _SPLIT.format(col=f"{row}.amenities")
+    return (f"INSERT INTO amenities(name) SELECT DISTINCT {_NAME} FROM {source}json_each({split}) "
+            f"WHERE {_NAME} != '' AND NOT EXISTS (SELECT 1 FROM amenities WHERE amenities.name = {_NAME})")
+
+
+def _link(row: str, source: str = "") -> str:
+    """Join a row, whose links were cleared, to its amenity ids"""
+    split = _SPLIT.format(col=f"{row}.amenities")
+    return (f"INSERT INTO hotel_amenities(hotel_id, amenity_id) SELECT DISTINCT {row}.id, amenities.id "
+            f"FROM {source}json_each({split}) JOIN amenities ON amenities.name = {_NAME}")
+
+
+_DDL = [
+    f"CREATE TRIGGER hotel_amenities_ai AFTER INSERT ON hotels "
+    f"WHEN new.amenities IS NOT NULL BEGIN {_intern('new')}; {_link('new')}; END",
+    "CREATE TRIGGER hotel_amenities_ad AFTER DELETE ON hotels BEGIN "
+    "DELETE FROM hotel_amenities WHERE hotel_id = old.id; END",
+    f"CREATE TRIGGER hotel_amenities_au AFTER UPDATE OF id, amenities ON hotels BEGIN "
+    f"DELETE FROM hotel_amenities WHERE hotel_id = old.id; "
+    f"{_intern('new')} AND new.amenities IS NOT NULL; {_link('new')} WHERE new.amenities IS NOT NULL; END",
+]
+
+
+def ensure_amenity_index(engine: Engine):
+    """(Re)create the sync triggers, filling the join table from existing rows if they were missing"""
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        # Replaced every time, so databases pick up changes to the trigger bodies
+        for trigger in TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        for statement in _DDL:
+            conn.execute(text(statement))
+        if not set(TRIGGERS) <= existing:
+            _rebuild(conn)
+
+
+def rebuild_amenity_index(engine: Engine):
+    """Re-derive the join table from Hotel.amenities, e.g. after writes with triggers disabled"""
+    with engine.begin() as conn:
+        _rebuild(conn)
+
+
+def _rebuild(conn):
+    conn.execute(text("DELETE FROM hotel_amenities"))
+    conn.execute(text(_intern("hotels", "hotels, ") + " AND hotels.amenities IS NOT NULL"))
+    conn.execute(text(_link("hotels", "hotels, ") + " WHERE hotels.amenities IS NOT NULL"))
@@ -0,0 +1,134 @@
+"""
+Latency of structured hotel filters (amenities all-of / any-of, min rating,
+price range) at 100k hotels: loading ORM rows and matching amenity strings in
+Python (previous) vs the interned amenity join table and indexed SQL behind
+with_filters, for a page of results and for the id set chat ranks within.
+
+Usage (from backend/):
+    python -m benchmarks.bench_amenity_filters --rows 100000 --requests 50
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session
+
+from amenities import ensure_amenity_index, normalize_amenity
+from database import Base, Hotel, apply_sqlite_pragmas
+from models import RecommendationFilters
+from recommendations import CategoryQuery, fetch_ids_sync, fetch_recommendations_sync, with_filters
+
+AMENITIES = ["WiFi", "Pool", "Spa", "Restaurant", "Fitness Center", "Business Center", "Onsen", "Garden",
+             "Tea Ceremony", "Mountain Views", "Hiking Trails", "City Views", "Rooftop Terrace", "Concierge",
+             "Bar", "Breakfast", "Air Conditioning", "Beach Access", "Kids Club", "Sauna", "Casino", "Ski Storage",
+             "Pet Friendly", "Parking", "Airport Shuttle", "Laundry", "Room Service", "Jacuzzi", "Tennis Court",
+             "Golf Course", "Library", "Bike Rental", "Harbour Views", "Rooftop Bar", "Turkish Bath", "Vineyard"]
+CITIES = [(f"City{i}", f"Country{i % 40}") for i in range(200)]
+
+SCENARIOS = {
+    "amenities_all": (None, RecommendationFilters(amenities_all=["Onsen", "Spa"])),
+    "amenities_any": (None, RecommendationFilters(amenities_any=["Rooftop Terrace", "Sauna", "Casino"])),
+    "rating_price": (None, RecommendationFilters(min_rating=4.5, max_price=150)),
+    "city_combined": ("City7", RecommendationFilters(amenities_all=["Pool"], min_rating=4.0, max_price=300)),
+}
+
+
+def synthetic_hotels(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    # Skewed popularity, like real amenity lists: WiFi everywhere, vineyards rare
+    weights = [1.0 / (rank + 1) for rank in range(len(AMENITIES))]
+    for i in range(n):
+        city, country = rng.choice(CITIES)
+        amenities = set(rng.choices(AMENITIES, weights, k=6))
+        yield {"name": f"Hotel {i}", "city": city, "country": country, "price_per_night": round(rng.uniform(50, 500), 2),
+               "rating": round(rng.uniform(3, 5), 1), "description": "Comfortable rooms",
+               "amenities": ", ".join(sorted(amenities)), "image_url": "", "address": f"{i} Main St"}
+
+
+def previous(db: Session, location, filters: RecommendationFilters, limit: int):
+    """ORM rows in the location, amenity strings split and matched in Python"""
+    query = db.query(Hotel)
+    if location:
+        query = query.filter(Hotel.city.in_([location]) | Hotel.country.in_([location]))
+    wanted_all = {normalize_amenity(a) for a in filters.amenities_all or []}
+    wanted_any = {normalize_amenity(a) for a in filters.amenities_any or []}
+    matched = []
+    for hotel in query:
+        amenities = {normalize_amenity(a) for a in (hotel.amenities or "").split(",")}
+        if wanted_all and not wanted_all <= amenities:
+            continue
+        if wanted_any and not wanted_any & amenities:
+            continue
+        if filters.min_rating is not None and (hotel.rating or 0) < filters.min_rating:
+            continue
+        if filters.min_price is not None and hotel.price_per_night < filters.min_price:
+            continue
+        if filters.max_price is not None and hotel.price_per_night > filters.max_price:
+            continue
+        matched.append(hotel)
+    matched.sort(key=lambda hotel: (-(hotel.rating or 0.0), hotel.id))
+    return [hotel.id for hotel in matched[:limit]] if limit else {hotel.id for hotel in matched}
+
+
+def scope(location, filters: RecommendationFilters) -> CategoryQuery:
+    query = CategoryQuery(cities=[location], countries=[location]) if location else CategoryQuery()
+    return with_filters({"hotel": query}, filters)["hotel"]
+
+
+def indexed_page(db: Session, location, filters: RecommendationFilters, limit: int):
+    page = fetch_recommendations_sync(db, {"hotel": replace(scope(location, filters), limit=limit)})
+    return [hotel["id"] for hotel in page["hotel"]]
+
+
+def indexed_ids(db: Session, location, filters: RecommendationFilters, limit: int):
+    return fetch_ids_sync(db, "hotel", scope(location, filters))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+        Base.metadata.create_all(engine)
+        ensure_amenity_index(engine)
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            # The sync triggers intern the amenities and fill the join table as rows go in
+            conn.execute(insert(Hotel), list(synthetic_hotels(args.rows)))
+        print(json.dumps({"rows": args.rows, "load_s": round(time.perf_counter() - start, 2)}), flush=True)
+
+        with Session(engine) as db:
+            for name, (location, filters) in SCENARIOS.items():
+                # Every path must select the same hotels
+                expected_page = previous(db, location, filters, args.limit)
+                assert indexed_page(db, location, filters, args.limit) == expected_page, name
+                assert indexed_ids(db, location, filters, 0) == previous(db, location, filters, 0), name
+                matches = len(previous(db, location, filters, 0))
+                for label, fn, limit in (("previous_page", previous, args.limit), ("indexed_page", indexed_page, args.limit),
+                                         ("previous_ids", previous, 0), ("indexed_ids", indexed_ids, 0)):
+                    latencies = []
+                    for _ in range(args.requests):
+                        start = time.perf_counter()
+                        fn(db, location, filters, limit)
+                        latencies.append(time.perf_counter() - start)
+                        db.expunge_all()
+                    ms = np.array(latencies) * 1000
+                    print(json.dumps({"scenario": name, "matches": matches, "path": label,
+                                      "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                                      "p99_ms": round(float(np.percentile(ms, 99)), 3)}), flush=True)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
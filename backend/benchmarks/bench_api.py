@@ -0,0 +1,265 @@
+"""
+Offline load-test suite for the recommendation API: /api/travel-plan,
+/api/chat and /api/recommendations/day/{day}.
+
+For every --rows size it builds (or reuses from --work-dir) a synthetic
+catalog with that many rows per table (benchmarks/synthetic_catalog.py) and
+serves it with the fake encoder (benchmarks/fake_encoder.py), so nothing is
+downloaded and the same seed gives the same catalog, requests and rankings.
+Each endpoint then runs closed-loop at every --concurrency level, in two modes:
+
+in-process: the ASGI app in a child process, called through
+httpx.ASGITransport without sockets or HTTP parsing; measures the app alone.
+uvicorn: a real uvicorn server, driven over keep-alive connections from
+client threads.
+
+Each run reports requests/sec, p50/p95/p99 latency, errors and the peak RSS
+of the process serving the app so far, one JSON line at a time. --output
+writes every result with the commit measured; --compare prints the change
+from an earlier output.
+
+Usage (from backend/):
+    python -m benchmarks.bench_api --rows 1000 100000 --concurrency 1 16 64 --output before.json
+    python -m benchmarks.bench_api --rows 1000 100000 --concurrency 1 16 64 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+from benchmarks.bench_db import run_client
+from benchmarks.bench_startup import wait_for
+from benchmarks.synthetic_catalog import TERMS, ensure_catalog, locations, popularity
+from catalog_import import peak_rss_mib
+
+MODES = ("in-process", "uvicorn")
+ENDPOINTS = ("travel-plan", "chat", "day")
+# Distinct requests per endpoint; request i of a run is REQUESTS[i % REQUEST_MIX]
+REQUEST_MIX = 1000
+PLANS = ["{days}-day trip to {city}", "{days} days in {city} and {other}", "A week in {country}",
+         "Weekend in {city}, then {days} days in {other}"]
+MESSAGES = ["something {term}", "I love {term} and {other_term}", "more {term} please",
+            "cheaper, with {term}", "{term} for the whole family"]
+
+
+def request_mix(endpoint: str, seed: int = 0, count: int = REQUEST_MIX) -> list:
+    """(method, path, body, headers) of the requests a run cycles through; popular cities come up more"""
+    rng = random.Random(f"{endpoint}-{seed}")
+    places, weights = locations(seed), popularity()
+    requests = []
+    for _ in range(count):
+        (city, country, _), (other, _, _) = rng.choices(places, cum_weights=weights, k=2)
+        plan = rng.choice(PLANS).format(days=rng.randint(2, 10), city=city, other=other, country=country)
+        if endpoint == "travel-plan":
+            requests.append(("POST", "/api/travel-plan", json.dumps({"plan": plan}),
+                             {"Content-Type": "application/json"}))
+        elif endpoint == "chat":
+            term, other_term = rng.sample(TERMS, 2)
+            message = rng.choice(MESSAGES).format(term=term, other_term=other_term)
+            requests.append(("POST", "/api/chat", json.dumps({"message": message, "current_plan": plan}),
+                             {"Content-Type": "application/json"}))
+        else:
+            path = f"/api/recommendations/day/{rng.randint(1, 7)}?locations={quote(city)},{quote(country)}"
+            requests.append(("GET", path, None, {}))
+    return requests
+
+
+def summary(latencies: list, errors: int, seconds: float) -> dict:
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / seconds, 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2)}
+
+
+async def in_process_level(client, requests: list, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    async def worker(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            method, path, body, headers = requests[i % len(requests)]
+            i += concurrency
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, content=body, headers=headers)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return summary(latencies, len(errors), time.perf_counter() - start)
+
+
+async def run_in_process(args, results):
+    import httpx
+
+    # Imported here, after the parent set TRAVEL_AGENT_DB and the encoder factory
+    import main
+
+    await main.app.router.startup()
+    try:
+        await asyncio.to_thread(main.model.wait, args.ready_timeout)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            for endpoint in args.endpoints:
+                requests = request_mix(endpoint, args.seed)
+                await in_process_level(client, requests, 4, 1.0)  # Warm up caches
+                for concurrency in args.concurrency:
+                    row = {"endpoint": endpoint, "concurrency": concurrency}
+                    row.update(await in_process_level(client, requests, concurrency, args.duration))
+                    # ru_maxrss would include the parent's peak: it survives exec, VmHWM doesn't
+                    row["peak_rss_mib"] = vm_hwm_mib(os.getpid()) or peak_rss_mib()
+                    results.put(row)
+    finally:
+        await main.app.router.shutdown()
+
+
+def in_process_child(env: dict, args, results):
+    os.environ.update(env)
+    try:
+        asyncio.run(run_in_process(args, results))
+    finally:
+        results.put(None)
+
+
+def in_process(env: dict, args):
+    """Rows of an in-process run, as the child process reports them"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=in_process_child, args=(env, args, results))
+    child.start()
+    try:
+        while (row := results.get()) is not None:
+            yield row
+    finally:
+        child.join()
+
+
+def vm_hwm_mib(pid: int):
+    """High-water RSS of a process since it started its program (Linux); None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def uvicorn_level(port: int, requests: list, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(run_client, port, lambda i: requests[i % len(requests)], deadline, n, latencies, errors)
+    return summary(latencies, len(errors), time.perf_counter() - start)
+
+
+def uvicorn(env: dict, args):
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                               "--log-level", "warning"], env={**os.environ, **env})
+    try:
+        if wait_for(args.port, "/api/ready", start, 200, args.ready_timeout) is None:
+            sys.exit("server did not get ready")
+        for endpoint in args.endpoints:
+            requests = request_mix(endpoint, args.seed)
+            uvicorn_level(args.port, requests, 4, 1.0)  # Warm up connections and caches
+            for concurrency in args.concurrency:
+                row = {"endpoint": endpoint, "concurrency": concurrency}
+                row.update(uvicorn_level(args.port, requests, concurrency, args.duration))
+                row["peak_rss_mib"] = vm_hwm_mib(server.pid)
+                yield row
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def key(row: dict) -> tuple:
+    return row["mode"], row["rows"], row["endpoint"], row["concurrency"]
+
+
+def compare(results: list, baseline_path: str):
+    """Change of each result against the same run in an earlier --output file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {key(row): row for row in baseline["results"]}
+    for row in results:
+        old = before.get(key(row))
+        if old is None:
+            continue
+        change = {"mode": row["mode"], "rows": row["rows"], "endpoint": row["endpoint"],
+                  "concurrency": row["concurrency"], "baseline": baseline.get("commit")}
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mib"):
+            if row.get(metric) is not None and old.get(metric):
+                change[f"{metric}_change_pct"] = round((row[metric] / old[metric] - 1) * 100, 1)
+        print(json.dumps(change), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10_000], help="catalog rows per table")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep catalogs here and reuse them (default: a temporary directory)")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="write all results to this JSON file")
+    parser.add_argument("--compare", help="an earlier --output file to compare against")
+    args = parser.parse_args()
+
+    report = {"commit": git_commit(), "python": sys.version.split()[0],
+              "started": datetime.now(timezone.utc).isoformat(timespec="seconds"), "args": vars(args),
+              "results": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or tmp
+        os.makedirs(work_dir, exist_ok=True)
+        for rows in args.rows:
+            env = {"TRAVEL_AGENT_DB": ensure_catalog(work_dir, rows, args.seed),
+                   "ENCODER_MODEL_FACTORY": "benchmarks.fake_encoder:FakeEncoder"}
+            for mode in args.modes:
+                for row in (in_process if mode == "in-process" else uvicorn)(env, args):
+                    row = {"mode": mode, "rows": rows, **row}
+                    report["results"].append(row)
+                    print(json.dumps(row), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        compare(report["results"], args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Bookings under contention: --processes worker processes (like uvicorn
+workers), each running --clients concurrent requests against one SQLite file.
+
+throughput: clients book random hotel nights for --duration seconds; reports
+bookings/sec, p50/p99 latency and lock timeouts (503).
+last_room: all clients race for the --rooms rooms of the same night, for
+--rounds nights. Compares bookings.reserve with read-then-write (read the
+count, then write count + 1), and checks rooms sold against bookings stored.
+idempotent: every request is sent twice at once with the same
+Idempotency-Key, like a double click; only one booking may be stored.
+
+Usage (from backend/):
+    python -m benchmarks.bench_bookings --processes 4 --clients 16 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import date
+
+import numpy as np
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from bookings import BOOKING_CAPACITY, BookingError, booking_dates, new_booking_id, replay, reserve
+from database import Base, Booking, Inventory, _connect_args, apply_sqlite_pragmas
+
+HOTELS = 1000
+RACE_HOTEL = 1
+FIRST_DAY = date(2030, 1, 1)
+
+
+async def read_then_write(db, item_id: int, day: str) -> bool:
+    """The check-then-act booking a conditional UPDATE replaces"""
+    row = (await db.execute(select(Inventory.capacity, Inventory.booked).where(
+        Inventory.item_type == "hotel", Inventory.item_id == item_id, Inventory.date == day))).one_or_none()
+    capacity, booked = row if row else (BOOKING_CAPACITY["hotel"], 0)
+    if booked >= capacity:
+        return False
+    await db.execute(text(
+        "INSERT INTO inventory (item_type, item_id, date, capacity, booked) "
+        "VALUES ('hotel', :item_id, :date, :capacity, :booked) "
+        "ON CONFLICT (item_type, item_id, date) DO UPDATE SET booked = excluded.booked"),
+        {"item_id": item_id, "date": day, "capacity": capacity, "booked": booked + 1})
+    db.add(Booking(id=new_booking_id(), item_type="hotel", item_id=item_id, date=day, created_at=day))
+    await db.commit()
+    return True
+
+
+async def client(sessions, scenario: str, mode: str, deadline: float, days: list, rng: random.Random, stats: dict):
+    if scenario == "last_room":
+        # One attempt per night, as every client races for the same rooms
+        for day in days:
+            async with sessions() as db:
+                await attempt(stats, lambda: read_then_write(db, RACE_HOTEL, day) if mode == "read_then_write"
+                              else reserve(db, "hotel", RACE_HOTEL, [day], message="bench"))
+        return
+    while time.perf_counter() < deadline:
+        day = rng.choice(days)
+        hotel = rng.randint(1, HOTELS)
+        if scenario == "throughput":
+            async with sessions() as db:
+                await attempt(stats, lambda: reserve(db, "hotel", hotel, [day], message="bench"))
+        else:
+            key = uuid.uuid4().hex
+            stats["keys"] += 1
+            await asyncio.gather(*(idempotent_request(sessions, hotel, day, key, stats) for _ in range(2)))
+
+
+async def idempotent_request(sessions, hotel: int, day: str, key: str, stats: dict):
+    async with sessions() as db:
+        async def book():
+            if await replay(db, key, key) is not None:
+                stats["replayed"] += 1
+                return True
+            booking, replayed = await reserve(db, "hotel", hotel, [day], message="bench", idempotency_key=key,
+                                              fingerprint=key)
+            stats["replayed"] += replayed
+            return True
+        await attempt(stats, book)
+
+
+async def attempt(stats: dict, call):
+    start = time.perf_counter()
+    try:
+        outcome = "ok" if await call() is not False else "sold_out"
+    except BookingError as e:
+        outcome = {409: "sold_out", 503: "busy"}.get(e.status_code, "error")
+    except Exception as e:
+        print(f"Booking failed: {e}")
+        outcome = "error"
+    stats[outcome] += 1
+    stats["latencies"].append(time.perf_counter() - start)
+
+
+async def run_clients(db_path: str, scenario: str, mode: str, clients: int, duration: float, days: list,
+                      seed: int, start_at: float) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", connect_args=_connect_args(),
+                                 poolclass=AsyncAdaptedQueuePool, pool_size=clients, max_overflow=clients)
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    stats = {"ok": 0, "sold_out": 0, "busy": 0, "error": 0, "replayed": 0, "keys": 0, "latencies": []}
+    # Processes start together, so they contend from the first request
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(sessions, scenario, mode, deadline, days, random.Random(seed * 1000 + n), stats)
+                           for n in range(clients)))
+    await engine.dispose()
+    return stats
+
+
+def worker(args):
+    return asyncio.run(run_clients(*args))
+
+
+def setup(db_path: str, rooms: int, rounds: int) -> list:
+    """Create the tables and the last rooms of the race nights; returns those nights"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(engine, tables=[Inventory.__table__, Booking.__table__])
+    race_days = booking_dates(FIRST_DAY, rounds)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO inventory VALUES ('hotel', :item_id, :date, :capacity, 0)"),
+                     [{"item_id": RACE_HOTEL, "date": day, "capacity": rooms} for day in race_days])
+    engine.dispose()
+    return race_days
+
+
+def audit(db_path: str) -> dict:
+    """Bookings stored against the units the inventory says were taken"""
+    conn = sqlite3.connect(db_path)
+    stored, units = conn.execute("SELECT count(*), coalesce(sum(quantity * nights), 0) FROM bookings").fetchone()
+    booked = conn.execute("SELECT coalesce(sum(booked), 0) FROM inventory").fetchone()[0]
+    conn.close()
+    return {"bookings_stored": stored, "units_stored": units, "units_booked": booked}
+
+
+def run(scenario: str, mode: str, args, tmp: str) -> dict:
+    db_path = os.path.join(tmp, f"{scenario}_{mode}.db")
+    race_days = setup(db_path, args.rooms, args.rounds)
+    # Throughput and idempotency book random hotels over the 30 nights after the race nights
+    days = race_days if scenario == "last_room" else booking_dates(FIRST_DAY, args.rounds + 30)[args.rounds:]
+    # Leaves the spawned processes time to import
+    start_at = time.time() + 3.0
+    jobs = [(db_path, scenario, mode, args.clients, args.duration, days, seed, start_at)
+            for seed in range(args.processes)]
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        results = pool.map(worker, jobs)
+    latencies = [latency for stats in results for latency in stats["latencies"]]
+    totals = {key: sum(stats[key] for stats in results) for key in ("ok", "sold_out", "busy", "error", "replayed")}
+    row = {"scenario": scenario, "mode": mode, "processes": args.processes, "clients": args.clients, **totals,
+           "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1) if latencies else None,
+           "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1) if latencies else None}
+    found = audit(db_path)
+    if scenario == "last_room":
+        # Every stored booking beyond the rooms that were left is a room sold twice
+        row.update(rooms=args.rooms * args.rounds, rooms_sold=found["units_booked"],
+                   bookings_stored=found["bookings_stored"],
+                   double_bookings=max(0, found["bookings_stored"] - args.rooms * args.rounds))
+    else:
+        # Units taken without a booking, or bookings that never took their units
+        row.update(bookings_per_sec=round(found["bookings_stored"] / args.duration, 1),
+                   bookings_stored=found["bookings_stored"],
+                   unaccounted_units=abs(found["units_booked"] - found["units_stored"]))
+        if scenario == "idempotent":
+            keys = sum(stats["keys"] for stats in results)
+            row.update(keys=keys, double_bookings=max(0, found["bookings_stored"] - keys))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent requests per process")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rooms", type=int, default=1, help="rooms left on each night of the last_room race")
+    parser.add_argument("--rounds", type=int, default=20, help="nights raced for in last_room")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario, mode in (("throughput", "bookings"), ("last_room", "read_then_write"),
+                               ("last_room", "bookings"), ("idempotent", "bookings")):
+            print(json.dumps(run(scenario, mode, args, tmp)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Time to bring catalog embeddings and the chat vector index up to date after an
+update of 1% of the hotels: previous (EmbeddingStore.build over the whole
+catalog, then a new k-means index) vs catching up from the catalog change log
+(EmbeddingStore.sync and CatalogIndex reassigning only changed rows), for a
+text update (re-encoded), a price-only update (no re-encoding) and deletes.
+
+The encoder is benchmarks.fake_encoder, sleeping --encode-ms per row,
+roughly what all-MiniLM-L6-v2 costs on a CPU.
+
+Usage (from backend/):
+    python -m benchmarks.bench_catalog_changes --rows 10000 100000 --fraction 0.01
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import Session
+
+from benchmarks.bench_amenity_filters import synthetic_hotels
+from benchmarks.fake_encoder import FakeEncoder
+from changes import changes_since, ensure_change_log
+from database import Base, Hotel, apply_sqlite_pragmas
+from embedding_store import EmbeddingStore
+from vector_index import CatalogIndex
+
+UPDATES = {
+    "text": "UPDATE hotels SET description = description || ' Renovated {n}' WHERE id % :step = 0",
+    "price": "UPDATE hotels SET price_per_night = price_per_night + {n} WHERE id % :step = 0",
+    "delete": "DELETE FROM hotels WHERE id % :step = 1",
+}
+
+
+class CountingEncoder:
+    """The shared fake encoder as the store's encode function, counting the rows it encodes"""
+
+    def __init__(self, dim: int, ms_per_row: float):
+        self.model = FakeEncoder(dimensions=dim, ms_per_text=ms_per_row)
+        self.rows = 0
+
+    def __call__(self, texts):
+        self.rows += len(texts)
+        return self.model.encode(texts)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(rows: int, fraction: float, dim: int, ms_per_row: float, tmp: str):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, f'{rows}.db')}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    ensure_change_log(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Hotel), list(synthetic_hotels(rows)))
+
+    # The initial embeddings aren't timed, so they cost nothing to encode
+    encode = CountingEncoder(dim, 0.0)
+    # previous: the store rebuilt from the whole catalog, the index from scratch
+    previous_store = EmbeddingStore(os.path.join(tmp, f"{rows}_previous"), encode)
+    # change log: the store syncs from its catalog version, the index is updated in place
+    store = EmbeddingStore(os.path.join(tmp, f"{rows}_changes"), encode)
+    index = CatalogIndex(store)
+    # Another worker's view of the same files, caught up from the journal
+    reader = EmbeddingStore(store.matrix_path[:-len(".npy")], encode)
+    with Session(engine) as db:
+        previous_store.build(db)
+        store.sync(db)
+    index.get("hotel")
+    encode.model.ms_per_text = ms_per_row
+
+    step = round(1 / fraction)
+    for n, (name, statement) in enumerate(UPDATES.items()):
+        with engine.begin() as conn:
+            changed = conn.execute(text(statement.format(n=n)), {"step": step}).rowcount
+        with Session(engine) as db:
+            encode.rows = 0
+            previous = timed(lambda: (previous_store.build(db), CatalogIndex(previous_store).get("hotel")))
+            previous_encoded, encode.rows = encode.rows, 0
+            delta = changes_since(db.connection(), store.synced_version)
+            sync = timed(lambda: store.sync(db))
+            update = timed(lambda: index.get("hotel"))
+        # Both paths must end up with the same vectors
+        expected_ids, expected = previous_store.snapshot("hotel")
+        ids, vectors = index.get("hotel").vectors_for(set(expected_ids.tolist()))
+        assert len(index.get("hotel")) == len(expected_ids), name
+        assert np.array_equal(expected_ids, ids) and np.allclose(expected, vectors), name
+        reader_ids, reader_vectors = reader.snapshot("hotel")
+        assert np.array_equal(expected_ids, reader_ids) and np.allclose(expected, reader_vectors), name
+        print(json.dumps({"rows": rows, "update": name, "changed_rows": changed, "delta_rows": len(delta),
+                          "previous_s": round(previous, 3), "previous_encoded": previous_encoded,
+                          "changes_sync_s": round(sync, 3), "changes_index_s": round(update, 3),
+                          "changes_encoded": encode.rows}), flush=True)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--fraction", type=float, default=0.01, help="share of the hotels each update touches")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--encode-ms", type=float, default=2.0, help="simulated encoding cost per row")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            run(rows, args.fraction, args.dim, args.encode_ms, tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Rows/sec and peak memory of loading a hotel feed: per-row ORM adds with one
+commit at the end, as populate_sample_data did (previous), vs the streaming
+catalog_import pipeline from JSON Lines and CSV, with the indexes and sync
+triggers kept or deferred, and re-importing the same feed as upserts.
+
+Each path runs in a fresh process against a new database with the app's
+schema, indexes and triggers, so peak RSS is its own.
+
+Usage (from backend/):
+    python -m benchmarks.bench_catalog_import --rows 1000000 --previous-rows 100000
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from amenities import ensure_amenity_index
+from benchmarks.bench_amenity_filters import synthetic_hotels
+from catalog_import import import_file, peak_rss_mib, read_feed
+from changes import ensure_change_log
+from database import Base, Hotel, apply_sqlite_pragmas, ensure_indexes
+from fulltext import ensure_fulltext_index
+
+
+def write_feeds(directory: str, n: int):
+    """The same synthetic hotels as hotels.jsonl and hotels.csv, with supplier ids"""
+    jsonl_path, csv_path = os.path.join(directory, "hotels.jsonl"), os.path.join(directory, "hotels.csv")
+    with open(jsonl_path, "w") as jsonl_file, open(csv_path, "w", newline="") as csv_file:
+        writer = None
+        for i, hotel in enumerate(synthetic_hotels(n)):
+            hotel = {"supplier_id": f"H{i}", **hotel}
+            jsonl_file.write(json.dumps(hotel) + "\n")
+            if writer is None:
+                writer = csv.DictWriter(csv_file, fieldnames=list(hotel))
+                writer.writeheader()
+            writer.writerow(hotel)
+    return jsonl_path, csv_path
+
+
+def app_engine(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    ensure_indexes(engine)
+    ensure_fulltext_index(engine)
+    ensure_amenity_index(engine)
+    ensure_change_log(engine)
+    return engine
+
+
+def previous(engine, feed: str, rows: int):
+    """db.add per row and a single commit, after reading every row into memory"""
+    records = [raw for _, raw in read_feed(feed)][:rows]
+    with Session(engine) as db:
+        for record in records:
+            db.add(Hotel(**record))
+        db.commit()
+    return len(records)
+
+
+def run_path(name: str, feed: str, rows: int, db_path: str, results):
+    engine = app_engine(db_path)
+    reports = []
+    start = time.perf_counter()
+    if name == "previous":
+        written = previous(engine, feed, rows)
+        reports.append((name, written, time.perf_counter() - start))
+    else:
+        defer = name.endswith("deferred")
+        stats = import_file(engine, "hotel", feed, defer_indexes=defer)
+        assert stats.rejected == 0, stats.errors[:3]
+        reports.append((name, stats.written, stats.seconds))
+        if name == "jsonl_deferred":
+            # Every row conflicts on its supplier id: a full update pass with the indexes live
+            stats = import_file(engine, "hotel", feed)
+            reports.append(("jsonl_reimport_upsert", stats.written, stats.seconds))
+    engine.dispose()
+    results.put([{"path": path, "rows": written, "seconds": round(seconds, 2),
+                  "rows_per_sec": round(written / seconds), "peak_rss_mib": peak_rss_mib()}
+                 for path, written, seconds in reports])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--previous-rows", type=int, default=100_000, help="rows for the per-row ORM path")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        jsonl_path, csv_path = write_feeds(tmp, args.rows)
+        print(json.dumps({"rows": args.rows, "feed_mib": round(os.path.getsize(jsonl_path) / 2**20, 1),
+                          "write_feeds_s": round(time.perf_counter() - start, 1)}), flush=True)
+        paths = (("previous", jsonl_path, args.previous_rows), ("jsonl", jsonl_path, args.rows),
+                 ("jsonl_deferred", jsonl_path, args.rows), ("csv_deferred", csv_path, args.rows))
+        for i, (name, feed, rows) in enumerate(paths):
+            results = context.Queue()
+            process = context.Process(target=run_path, args=(name, feed, rows, os.path.join(tmp, f"{i}.db"), results))
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise SystemExit(f"{name} failed")
+            reports = results.get()
+            for report in reports:
+                print(json.dumps(report), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Checkout calls against the Flowglad stand-in (benchmarks/flowglad_stub.py):
+previous (blocking requests.post in an async endpoint, a new connection per
+call, no timeout) vs the pooled FlowgladClient.
+
+Both run as endpoints of one small app next to GET /ping. For each scenario
+--concurrency clients call checkout back to back while one client pings;
+ping latency shows how long checkout calls hold up the event loop.
+
+Scenarios: slow (every call takes --latency-ms), flaky (30% of calls fail
+with 503), down (every call fails after --latency-ms), hang (calls never
+answer; previous is skipped, it would wait forever).
+
+Usage (from backend/):
+    python -m benchmarks.bench_checkout --concurrency 16 --duration 5
+"""
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from benchmarks.bench_startup import wait_for
+from flowglad import CircuitBreaker, FlowgladClient, FlowgladError
+
+SCENARIOS = {
+    "slow": {"error_rate": 0.0, "hang": False},
+    "flaky": {"error_rate": 0.3, "hang": False},
+    "down": {"error_rate": 1.0, "hang": False},
+    "hang": {"error_rate": 0.0, "hang": True},
+}
+PAYLOAD = {"checkoutSession": {"type": "product", "priceSlug": "hotel_booking", "outputName": "Hotel Booking #1"}}
+
+
+def bench_app(stub_url: str, read_timeout: float) -> FastAPI:
+    app = FastAPI()
+    client = FlowgladClient(base_url=stub_url, read_timeout=read_timeout, breaker=CircuitBreaker(reset_seconds=2))
+    app.state.client = client
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/previous")
+    async def previous():
+        """The previous endpoint's call: blocking, no timeout, no pooling"""
+        try:
+            response = requests.post(f"{stub_url}/api/v1/checkout-sessions", json=PAYLOAD,
+                                     headers={"Authorization": "sk_test"})
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.HTTPError as e:
+            return JSONResponse({"detail": e.response.text}, status_code=e.response.status_code)
+
+    @app.post("/pooled")
+    async def pooled():
+        try:
+            return await client.create_checkout_session(PAYLOAD)
+        except FlowgladError as e:
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code)
+
+    return app
+
+
+def call(port: int, method: str, path: str, deadline: float, latencies: list, statuses: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, "{}" if method == "POST" else None, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+        except OSError:
+            statuses.append(0)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        latencies.append(time.perf_counter() - start)
+        if path == "/ping":
+            time.sleep(0.01)
+    conn.close()
+
+
+def stub_config(port: int, **changes):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("POST", "/_stub/config", json.dumps(changes), {"Content-Type": "application/json"})
+    conn.getresponse().read()
+    conn.close()
+
+
+def percentile_ms(values: list, q: float):
+    return round(float(np.percentile(np.array(values) * 1000, q)), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--read-timeout", type=float, default=1.0, help="FlowgladClient read timeout for the run")
+    parser.add_argument("--stub-port", type=int, default=8790)
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.flowglad_stub", "--port", str(args.stub_port),
+                             "--latency-ms", str(args.latency_ms)])
+    server = uvicorn.Server(uvicorn.Config(bench_app(f"http://127.0.0.1:{args.stub_port}", args.read_timeout),
+                                           host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        start = time.perf_counter()
+        wait_for(args.stub_port, "/_stub/stats", start, 200, 30)
+        wait_for(args.port, "/ping", start, 200, 30)
+        for scenario, config in SCENARIOS.items():
+            for path in ("/previous", "/pooled"):
+                if scenario == "hang" and path == "/previous":
+                    continue
+                stub_config(args.stub_port, **config)
+                # Let an open breaker from the last run reset
+                time.sleep(2.5)
+                deadline = time.perf_counter() + args.duration
+                latencies, statuses, ping_latencies, ping_statuses = [], [], [], []
+                with ThreadPoolExecutor(args.concurrency + 1) as pool:
+                    for _ in range(args.concurrency):
+                        pool.submit(call, args.port, "POST", path, deadline, latencies, statuses)
+                    pool.submit(call, args.port, "GET", "/ping", deadline, ping_latencies, ping_statuses)
+                print(json.dumps({
+                    "scenario": scenario, "path": path.strip("/"), "checkouts": len(statuses),
+                    "ok": sum(status == 200 for status in statuses),
+                    "checkouts_per_sec": round(len(statuses) / args.duration, 1),
+                    "checkout_p50_ms": percentile_ms(latencies, 50), "checkout_p99_ms": percentile_ms(latencies, 99),
+                    "ping_p50_ms": percentile_ms(ping_latencies, 50), "ping_p99_ms": percentile_ms(ping_latencies, 99),
+                }), flush=True)
+        # Release the calls still hanging, which the stub's shutdown would wait for
+        stub_config(args.stub_port, hang=False)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Closed-loop load test for the database-bound endpoints: `/api/travel-plan`
+and `/api/recommendations/day/{day}`.
+
+Starts uvicorn on the app in --app-dir (so a checkout of an older revision
+can be measured the same way), then runs every endpoint at every
+concurrency level and prints one JSON line per run.
+
+Usage (from backend/):
+    python -m benchmarks.bench_db --concurrency 1 16 128 --duration 10
+    git worktree add /tmp/before HEAD~1 && python -m benchmarks.bench_db --app-dir /tmp/before/backend
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_startup import wait_for
+
+PLANS = [
+    "7-day trip to Japan, Tokyo and Kyoto",
+    "5 days in Paris",
+    "A week in Europe: Rome, Paris and London",
+    "3-day trip to Hakone",
+    "10 days in Thailand",
+]
+DAY_LOCATIONS = ["Tokyo,Japan", "Paris,France", "Rome,Italy", "", "Bangkok,Thailand"]
+
+
+def travel_plan_request(i: int):
+    body = json.dumps({"plan": PLANS[i % len(PLANS)]})
+    return "POST", "/api/travel-plan", body, {"Content-Type": "application/json"}
+
+
+def day_request(i: int):
+    locations = DAY_LOCATIONS[i % len(DAY_LOCATIONS)]
+    path = f"/api/recommendations/day/{i % 7 + 1}" + (f"?locations={locations}" if locations else "")
+    return "GET", path, None, {}
+
+
+ENDPOINTS = {"travel-plan": travel_plan_request, "day": day_request}
+
+
+def run_client(port: int, make_request, deadline: float, offset: int, latencies: list, errors: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    i = offset
+    while time.perf_counter() < deadline:
+        method, path, body, headers = make_request(i)
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            continue
+        if response.status != 200:
+            errors.append(response.status)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run_level(port: int, endpoint: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(run_client, port, ENDPOINTS[endpoint], deadline, n, latencies, errors)
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=".", help="backend directory to serve main:app from")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=["travel-plan", "day"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.abspath(args.app_dir),
+         "--port", str(args.port), "--log-level", "warning"],
+        cwd=os.path.abspath(args.app_dir),
+    )
+    try:
+        if wait_for(args.port, "/", start, 200, 120) is None:
+            sys.exit("server did not start")
+        for endpoint in args.endpoints:
+            run_level(args.port, endpoint, 4, 1.0)  # Warm up connections and caches
+            for concurrency in args.concurrency:
+                print(json.dumps(run_level(args.port, endpoint, concurrency, args.duration)), flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
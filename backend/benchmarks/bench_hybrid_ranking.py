@@ -0,0 +1,122 @@
+"""
+Latency, vectors scored and precision of chat ranking: dense search over
+the vector index (previous) vs BM25 candidates from the FTS5 index re-ranked
+by embedding similarity (hybrid).
+
+The synthetic catalog gives every hotel two amenity terms out of a
+vocabulary split into three families of related terms; its embedding leans
+towards those terms' directions, which are close within a family, so dense
+search finds related rows but not reliably the ones that literally
+mention the term. A query asks for one term, and precision@k is the fraction of the
+top k that contain it.
+
+Usage (from backend/):
+    python -m benchmarks.bench_hybrid_ranking --rows 20000 --k 6
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session
+
+from database import Base, Hotel, apply_sqlite_pragmas
+from fulltext import bm25_candidates, ensure_fulltext_index, hybrid_scores
+from vector_index import VectorIndex, top_k
+
+TERMS = ["onsen", "rooftop", "pool", "spa", "sauna", "garden", "beach", "casino", "vineyard", "ski",
+         "hammock", "library", "observatory", "aquarium", "brewery", "yoga", "tennis", "golf", "marina",
+         "lagoon", "hot spring", "tatami", "fireplace", "balcony", "terrace", "jacuzzi", "gym", "bar",
+         "kitchenette", "playground"]
+FILLER = "Comfortable rooms with friendly staff close to the city centre and public transport."
+
+
+def synthetic_catalog(n: int, dim: int, seed: int = 0):
+    """Hotel rows and their embeddings: noise plus the directions of the row's terms"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    # Each third of TERMS is a family of terms sharing most of their direction
+    groups = np_rng.normal(size=(3, dim))
+    term_vectors = groups[np.arange(len(TERMS)) // (len(TERMS) // 3)] + 0.35 * np_rng.normal(size=(len(TERMS), dim))
+    rows, vectors = [], []
+    for i in range(n):
+        terms = rng.sample(range(len(TERMS)), 2)
+        amenities = ", ".join(TERMS[t] for t in terms)
+        rows.append({"id": i + 1, "name": f"Hotel {i}", "city": f"City{i % 200}", "country": f"Country{i % 40}",
+                     "price_per_night": rng.uniform(50, 500), "rating": rng.uniform(3, 5),
+                     "description": f"{FILLER} Guests love the {TERMS[terms[0]]}.", "amenities": amenities})
+        vectors.append(term_vectors[terms].sum(axis=0) * 0.5 + np_rng.normal(size=dim))
+    vectors = np.array(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return rows, vectors, term_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=200, help="BM25 candidates (HYBRID_CANDIDATES)")
+    parser.add_argument("--weight", type=float, default=0.3, help="HYBRID_LEXICAL_WEIGHT")
+    args = parser.parse_args()
+
+    rows, vectors, term_vectors = synthetic_catalog(args.rows, args.dim)
+    index = VectorIndex(np.arange(1, args.rows + 1), vectors)
+    texts = {row["id"]: f"{row['description']} {row['amenities']}".lower() for row in rows}
+    rng = np.random.default_rng(1)
+    queries = []
+    for _ in range(args.queries):
+        term = int(rng.integers(len(TERMS)))
+        query = term_vectors[term] + 0.5 * rng.normal(size=args.dim)
+        queries.append((TERMS[term], (query / np.linalg.norm(query)).astype(np.float32)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+        Base.metadata.create_all(engine)
+        assert ensure_fulltext_index(engine)
+        with engine.begin() as conn:
+            # Rows go in after the index exists, so the sync triggers populate it
+            conn.execute(insert(Hotel), rows)
+
+        def dense(db, term, query):
+            return index.search(query, args.k), len(index) if index.exact else None
+
+        def hybrid(db, term, query):
+            lexical = bm25_candidates(db, "hotel", term, [], args.candidates)
+            found, candidate_vectors = index.vectors_for({item_id for item_id, _ in lexical})
+            scores = dict(zip(found.tolist(), (candidate_vectors @ query).tolist()))
+            ranked = sorted(hybrid_scores(scores, lexical, args.weight), key=lambda pair: (-pair[1], pair[0]))
+            return ranked[:args.k], len(found)
+
+        with Session(engine) as db:
+            for name, fn in (("dense", dense), ("hybrid", hybrid)):
+                latencies, scored, precision = [], [], []
+                for term, query in queries:
+                    start = time.perf_counter()
+                    ranked, n_scored = fn(db, term, query)
+                    latencies.append(time.perf_counter() - start)
+                    if n_scored is None:
+                        # IVF: the members of the probed lists
+                        probes = top_k(index.centroids @ query, min(index.n_probe, len(index.lists)))
+                        n_scored = sum(len(index.lists[p]) for p in probes)
+                    scored.append(n_scored)
+                    precision.append(np.mean([term in texts[item_id] for item_id, _ in ranked]) if ranked else 0.0)
+                ms = np.array(latencies) * 1000
+                print(json.dumps({
+                    "rows": args.rows, "path": name,
+                    "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                    "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                    "vectors_scored": int(np.mean(scored)),
+                    f"precision@{args.k}": round(float(np.mean(precision)), 3),
+                }), flush=True)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
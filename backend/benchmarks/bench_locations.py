@@ -0,0 +1,76 @@
+"""
+Location extraction: the previous per-name substring loop against the
+Aho-Corasick automaton, for gazetteers of increasing size.
+
+Usage (from backend/):
+    python -m benchmarks.bench_locations --names 40 1000 10000
+"""
+import argparse
+import random
+import string
+import time
+
+from locations import LocationAutomaton
+
+PLANS = [
+    "I'm planning a 7-day trip to {a}, starting with three days in {b} exploring the old town, "
+    "plus a day trip to {c} for nature and an onsen.",
+    "We want to go to {a} and then {b} with my parents for two weeks",
+    "Make it more budget-friendly, maybe stay in {c} instead",
+    "Flying from {a} to {b}, I love museums, food markets and rooftop bars",
+]
+
+
+def synthetic_names(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        words = rng.choice((1, 1, 1, 2, 2, 3))
+        names.add(" ".join(
+            "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))).title()
+            for _ in range(words)
+        ))
+    return sorted(names)
+
+
+def substring_loop(names: list, text: str) -> list:
+    """The previous extract_locations: one `in` scan per gazetteer name"""
+    text_lower = text.lower()
+    return [name for name in names if name.lower() in text_lower]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, nargs="+", default=[40, 1000, 10000])
+    parser.add_argument("--texts", type=int, default=2000)
+    args = parser.parse_args()
+
+    for count in args.names:
+        names = synthetic_names(count)
+        rng = random.Random(1)
+        texts = [rng.choice(PLANS).format(a=rng.choice(names), b=rng.choice(names), c=rng.choice(names))
+                 for _ in range(args.texts)]
+
+        start = time.perf_counter()
+        automaton = LocationAutomaton()
+        for name in names:
+            automaton.add(name, name, "city")
+        automaton.search("")
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for text in texts:
+            substring_loop(names, text)
+        loop_us = (time.perf_counter() - start) * 1e6 / len(texts)
+
+        start = time.perf_counter()
+        for text in texts:
+            automaton.search(text)
+        automaton_us = (time.perf_counter() - start) * 1e6 / len(texts)
+
+        print(f"{count:>6} names  build {build_ms:8.1f} ms  substring loop {loop_us:9.1f} us/text  "
+              f"automaton {automaton_us:7.1f} us/text  ({loop_us / automaton_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Overhead of the request timing layer (metrics.py), instrumentation on vs off.
+
+spans: nanoseconds per span() block inside a timed request and outside one
+(the no-op every span is with METRICS_ENABLED=0), and the microseconds
+TimingMiddleware adds to a request of a bare ASGI app with chat's 8 spans,
+called in-process so that nothing else is measured.
+endpoints: serves main:app twice, with METRICS_ENABLED=1 and 0, and runs
+/api/travel-plan, /api/recommendations/day/{day} and /api/chat closed-loop
+at each --concurrency, alternating between the servers for --rounds rounds so
+drift affects both alike. Reports throughput and p50/p99 per mode, and the
+mean time per stage from the instrumented server's /metrics.
+
+Usage (from backend/):
+    python -m benchmarks.bench_metrics --duration 5 --rounds 3
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_db import day_request, run_client, travel_plan_request
+from benchmarks.bench_startup import wait_for
+from benchmarks.load_chat import MESSAGES
+from metrics import MetricsRegistry, RequestTimings, TimingMiddleware, _current, span
+
+# The stages /api/chat records on a ranked request
+CHAT_STAGES = ("parse", "parse", "encode", "db_ids", "db_fts", "rank", "page", "db_fetch", "serialize")
+
+
+def chat_request(i: int):
+    message, plan = MESSAGES[i % len(MESSAGES)]
+    body = json.dumps({"message": message, "current_plan": plan})
+    return "POST", "/api/chat", body, {"Content-Type": "application/json"}
+
+
+ENDPOINTS = {"travel-plan": travel_plan_request, "day": day_request, "chat": chat_request}
+
+
+def per_call_ns(fn, n: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - start) / n
+
+
+def bench_spans(n: int) -> list:
+    def one_span():
+        with span("stage"):
+            pass
+
+    def nested_span():
+        with span("outer"):
+            with span("inner"):
+                pass
+
+    rows = [{"case": "span_no_request", "ns_per_call": round(per_call_ns(one_span, n), 1)}]
+    token = _current.set(RequestTimings())
+    try:
+        rows.append({"case": "span_in_request", "ns_per_call": round(per_call_ns(one_span, n), 1)})
+        rows.append({"case": "nested_spans_in_request", "ns_per_call": round(per_call_ns(nested_span, n), 1)})
+    finally:
+        _current.reset(token)
+    return rows
+
+
+async def bare_app(scope, receive, send):
+    for stage in CHAT_STAGES:
+        with span(stage):
+            pass
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def bench_middleware(n: int) -> list:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    class Route:
+        path = "/api/chat"
+
+    scope = {"type": "http", "method": "POST", "path": "/api/chat", "headers": [], "route": Route()}
+    rows = []
+    for mode, app in (("off", bare_app), ("on", TimingMiddleware(bare_app, MetricsRegistry()))):
+        # Best of 5, so a scheduling hiccup doesn't land in one mode only
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                await app(scope, receive, send)
+            best = min(best, (time.perf_counter_ns() - start) / n)
+        rows.append({"case": f"request_{mode}", "us_per_request": round(best / 1000, 2)})
+    rows.append({"case": "middleware_overhead", "us_per_request": round(rows[1]["us_per_request"] -
+                                                                         rows[0]["us_per_request"], 2)})
+    return rows
+
+
+def run_level(port: int, endpoint: str, concurrency: int, duration: float) -> tuple:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(run_client, port, ENDPOINTS[endpoint], deadline, n, latencies, errors)
+    return latencies, len(errors)
+
+
+def stage_means(port: int) -> dict:
+    """Mean milliseconds per stage and endpoint, from /metrics"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/metrics")
+    text = conn.getresponse().read().decode()
+    conn.close()
+    sums, counts = {}, {}
+    for kind, endpoint, stage, value in re.findall(
+            r'^travel_agent_stage_duration_seconds_(sum|count)\{endpoint="([^"]*)",stage="([^"]*)"\} (\S+)$',
+            text, re.MULTILINE):
+        (sums if kind == "sum" else counts)[(endpoint, stage)] = float(value)
+    means = defaultdict(dict)
+    for key, total in sums.items():
+        if counts.get(key):
+            means[key[0]][key[1]] = round(total / counts[key] * 1000, 3)
+    return dict(means)
+
+
+def start_server(port: int, enabled: bool) -> subprocess.Popen:
+    env = {**os.environ, "METRICS_ENABLED": "1" if enabled else "0"}
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                             "--log-level", "warning"], env=env)
+
+
+def bench_endpoints(args) -> list:
+    ports = {"on": args.port, "off": args.port + 1}
+    servers = {}
+    rows = []
+    try:
+        start = time.perf_counter()
+        for mode, port in ports.items():
+            # One at a time: both servers create the schema of the same database at startup
+            servers[mode] = start_server(port, mode == "on")
+            if wait_for(port, "/", start, 200, args.ready_timeout) is None:
+                sys.exit(f"server on port {port} did not start")
+        for port in ports.values():
+            # Chat ranks semantically once the model is loaded
+            if wait_for(port, "/api/ready", start, 200, args.ready_timeout) is None:
+                print(json.dumps({"warning": f"model not ready on port {port}, chat ranks lexically"}), flush=True)
+        for endpoint in args.endpoints:
+            for port in ports.values():
+                run_level(port, endpoint, 4, 1.0)  # Warm up connections and caches
+            for concurrency in args.concurrency:
+                latencies = {mode: [] for mode in ports}
+                errors = {mode: 0 for mode in ports}
+                for _ in range(args.rounds):
+                    for mode, port in ports.items():
+                        found, failed = run_level(port, endpoint, concurrency, args.duration)
+                        latencies[mode] += found
+                        errors[mode] += failed
+                row = {"endpoint": endpoint, "concurrency": concurrency}
+                for mode in ports:
+                    ms = np.array(latencies[mode]) * 1000 if latencies[mode] else np.zeros(1)
+                    row.update({f"{mode}_rps": round(len(latencies[mode]) / (args.duration * args.rounds), 1),
+                                f"{mode}_p50_ms": round(float(np.percentile(ms, 50)), 2),
+                                f"{mode}_p99_ms": round(float(np.percentile(ms, 99)), 2),
+                                f"{mode}_errors": errors[mode]})
+                row["p50_overhead_pct"] = round((row["on_p50_ms"] / row["off_p50_ms"] - 1) * 100, 1)
+                rows.append(row)
+                print(json.dumps(row), flush=True)
+        rows.append({"stage_mean_ms": stage_means(ports["on"])})
+        print(json.dumps(rows[-1]), flush=True)
+    finally:
+        for server in servers.values():
+            server.terminate()
+            server.wait()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="calls per in-process measurement")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=["travel-plan", "day", "chat"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per mode and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8770, help="instrumented server; the other uses port + 1")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--skip-endpoints", action="store_true", help="only the in-process measurements")
+    args = parser.parse_args()
+
+    for row in bench_spans(args.iterations):
+        print(json.dumps(row), flush=True)
+    for row in asyncio.run(bench_middleware(args.iterations // 10)):
+        print(json.dumps(row), flush=True)
+    if not args.skip_endpoints:
+        bench_endpoints(args)
+
+
+if __name__ == "__main__":
+    main()
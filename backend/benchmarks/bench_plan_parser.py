@@ -0,0 +1,86 @@
+"""
+Travel plan parsing throughput: the previous extract_locations + extract_days
+pair against the single-pass TravelPlanParser, cold and with its cache warm.
+
+Usage (from backend/):
+    python -m benchmarks.bench_plan_parser --plans 5000
+"""
+import argparse
+import random
+import re
+import time
+
+from locations import LocationMatcher
+from plan_parser import TravelPlanParser
+
+CITIES = ["Tokyo", "Kyoto", "Hakone", "Paris", "Rome", "Barcelona", "London", "Berlin", "Amsterdam",
+          "Vienna", "Prague", "Dubai", "Singapore", "Bangkok", "Sydney", "New York", "Los Angeles",
+          "Istanbul", "Cairo", "Rio de Janeiro", "Buenos Aires"]
+COUNTRIES = ["Japan", "France", "Italy", "Spain", "UK", "Germany", "Netherlands", "Austria",
+             "Czech Republic", "UAE", "Thailand", "Australia", "USA", "Turkey", "Egypt", "Brazil", "Argentina"]
+REGIONS = ["Europe", "Asia", "America"]
+
+TEMPLATES = [
+    "I'm planning a {n}-day trip to {country}, starting with {w} days in {city} exploring the old town, "
+    "plus a day trip to {city2} for nature and an onsen.",
+    "{w} days in {city} for {p} people, budget ${b}",
+    "Two weeks across {region} with my parents, starting {month} {d}",
+    "We want {city} then {city2}, {n} days total, around {b} euros",
+    "A week in {country}, party of {p}, leaving 2026-{mm:02d}-{d:02d}",
+    "I want to go to {region}",
+]
+WORDS = ["two", "three", "four", "five", "seven", "ten"]
+MONTH_NAMES = ["January", "March", "May", "July", "September", "December"]
+
+
+def corpus(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [rng.choice(TEMPLATES).format(
+        n=rng.randint(2, 21), w=rng.choice(WORDS), p=rng.randint(1, 6), b=rng.randint(5, 80) * 100,
+        city=rng.choice(CITIES), city2=rng.choice(CITIES), country=rng.choice(COUNTRIES),
+        region=rng.choice(REGIONS), month=rng.choice(MONTH_NAMES), d=rng.randint(1, 28), mm=rng.randint(1, 12),
+    ) for _ in range(size)]
+
+
+def previous_parse(text: str) -> dict:
+    """The previous parse_travel_plan: substring loop plus up to three regex scans"""
+    text_lower = text.lower()
+    locations = [loc for loc in CITIES + COUNTRIES + REGIONS if loc.lower() in text_lower]
+    days = 1
+    for pattern in (r'(\d+)[-\s]day', r'(\d+)day', r'(\d+)\s+days?'):
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            days = int(match.group(1))
+            break
+    return {"locations": locations, "days": days}
+
+
+def rate(fn, texts) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=5000)
+    args = parser.parse_args()
+
+    texts = corpus(args.plans)
+    names = {name: (name, "city") for name in CITIES}
+    names.update({name: (name, "country") for name in COUNTRIES})
+    names.update({name: (name, "region") for name in REGIONS})
+    matcher = LocationMatcher.from_names(names)
+
+    print(f"{'previous (locations + days only)':<36} {rate(previous_parse, texts):10.0f} plans/s")
+    cold = TravelPlanParser(matcher, cache_size=0)
+    print(f"{'single pass, all fields, uncached':<36} {rate(cold.parse, texts):10.0f} plans/s")
+    warm = TravelPlanParser(matcher, cache_size=len(texts))
+    for text in texts:
+        warm.parse(text)
+    print(f"{'single pass, cache warm':<36} {rate(warm.parse, texts):10.0f} plans/s")
+
+
+if __name__ == "__main__":
+    main()
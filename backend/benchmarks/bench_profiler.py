@@ -0,0 +1,184 @@
+"""
+Cost of the sampling profiler (profiler.py): idle, per sample, and on live traffic.
+
+middleware: microseconds ProfilerMiddleware adds to a request of a bare ASGI
+app with no profile running (what every request pays once
+PROFILER_ADMIN_TOKEN is set), called in-process.
+sample: microseconds per stack sample with --threads threads parked in
+waits, as a threadpool has, with idle threads skipped (the default) and kept.
+endpoints: serves main:app on a synthetic catalog with the fake encoder and
+runs each endpoint closed-loop at each --concurrency, alternating rounds
+without and during a /admin/profile run at the default interval. Reports
+throughput and p50/p99 of both, and the top functions of the last profile.
+
+Usage (from backend/):
+    python -m benchmarks.bench_profiler --rows 10000 --duration 5 --rounds 3
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_api import request_mix
+from benchmarks.bench_db import run_client
+from benchmarks.bench_startup import wait_for
+from benchmarks.synthetic_catalog import ensure_catalog
+from profiler import Profile, Profiler, ProfilerMiddleware
+
+TOKEN = "bench"
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def bench_middleware(n: int) -> list:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/api/chat", "headers": []}
+    rows = []
+    for mode, app in (("without", bare_app), ("idle", ProfilerMiddleware(bare_app, Profiler()))):
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                await app(scope, receive, send)
+            best = min(best, (time.perf_counter_ns() - start) / n)
+        rows.append({"case": f"request_{mode}_middleware", "us_per_request": round(best / 1000, 3)})
+    rows.append({"case": "idle_middleware_overhead",
+                 "us_per_request": round(rows[1]["us_per_request"] - rows[0]["us_per_request"], 3)})
+    return rows
+
+
+def bench_sample(threads: int, n: int) -> list:
+    stop = threading.Event()
+    parked = [threading.Thread(target=stop.wait, daemon=True) for _ in range(threads)]
+    for thread in parked:
+        thread.start()
+    rows = []
+    try:
+        own = threading.get_ident()
+        for idle in (False, True):
+            profile = Profile(0.005, idle=idle)
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                profile._sample(own)
+            rows.append({"case": f"sample_{'with' if idle else 'skipping'}_idle_threads", "threads": threads + 1,
+                         "us_per_sample": round((time.perf_counter_ns() - start) / n / 1000, 2)})
+    finally:
+        stop.set()
+    return rows
+
+
+def admin_profile(port: int, seconds: float, result: dict):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=seconds + 30)
+    conn.request("POST", f"/admin/profile?seconds={seconds}&top=5", headers={"X-Admin-Token": TOKEN})
+    response = conn.getresponse()
+    result.update(status=response.status, body=json.loads(response.read()))
+    conn.close()
+
+
+def run_level(port: int, requests: list, concurrency: int, duration: float) -> tuple:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(run_client, port, lambda i: requests[i % len(requests)], deadline, n, latencies, errors)
+    return latencies, len(errors)
+
+
+def bench_endpoints(args) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or tmp
+        os.makedirs(work_dir, exist_ok=True)
+        env = {**os.environ, "TRAVEL_AGENT_DB": ensure_catalog(work_dir, args.rows, args.seed),
+               "ENCODER_MODEL_FACTORY": "benchmarks.fake_encoder:FakeEncoder", "PROFILER_ADMIN_TOKEN": TOKEN}
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                   "--log-level", "warning"], env=env)
+        try:
+            if wait_for(args.port, "/api/ready", start, 200, args.ready_timeout) is None:
+                sys.exit("server did not get ready")
+            for endpoint in args.endpoints:
+                requests = request_mix(endpoint, args.seed)
+                run_level(args.port, requests, 4, 1.0)  # Warm up connections and caches
+                for concurrency in args.concurrency:
+                    latencies = {"idle": [], "profiling": []}
+                    errors = {"idle": 0, "profiling": 0}
+                    profile = {}
+                    for _ in range(args.rounds):
+                        for mode in latencies:
+                            profiling = None
+                            if mode == "profiling":
+                                # The profile covers the whole round
+                                profile = {}
+                                profiling = threading.Thread(target=admin_profile,
+                                                             args=(args.port, args.duration + 0.5, profile))
+                                profiling.start()
+                                time.sleep(0.2)
+                            found, failed = run_level(args.port, requests, concurrency, args.duration)
+                            latencies[mode] += found
+                            errors[mode] += failed
+                            if profiling is not None:
+                                profiling.join()
+                    row = {"endpoint": endpoint, "concurrency": concurrency}
+                    for mode in latencies:
+                        ms = np.array(latencies[mode]) * 1000 if latencies[mode] else np.zeros(1)
+                        row.update({f"{mode}_rps": round(len(latencies[mode]) / (args.duration * args.rounds), 1),
+                                    f"{mode}_p50_ms": round(float(np.percentile(ms, 50)), 2),
+                                    f"{mode}_p99_ms": round(float(np.percentile(ms, 99)), 2),
+                                    f"{mode}_errors": errors[mode]})
+                    row["rps_change_pct"] = round((row["profiling_rps"] / row["idle_rps"] - 1) * 100, 1)
+                    body = profile.get("body", {})
+                    row["profile_samples"] = body.get("samples")
+                    row["top_functions"] = [f"{f['function']} {f['self_pct']}%" for f in body.get("functions", [])]
+                    rows.append(row)
+                    print(json.dumps(row), flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000, help="requests per in-process measurement")
+    parser.add_argument("--threads", type=int, default=40, help="parked threads while sampling")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic catalog rows per table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep the catalog here and reuse it")
+    parser.add_argument("--endpoints", nargs="+", choices=["travel-plan", "chat", "day"], default=["chat", "day"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per mode and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8785)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--skip-endpoints", action="store_true", help="only the in-process measurements")
+    args = parser.parse_args()
+
+    for row in asyncio.run(bench_middleware(args.iterations)):
+        print(json.dumps(row), flush=True)
+    for row in bench_sample(args.threads, args.samples):
+        print(json.dumps(row), flush=True)
+    if not args.skip_endpoints:
+        bench_endpoints(args)
+
+
+if __name__ == "__main__":
+    main()
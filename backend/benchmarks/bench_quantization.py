@@ -0,0 +1,51 @@
+"""
+Memory footprint, scoring latency and ranking agreement of float16 / int8
+embedding storage against the float32 baseline.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quantization --size 200000 --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_vector_index import synthetic_catalog
+from quantization import QuantizedVectors
+from vector_index import top_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--rerank", type=int, default=4, help="float32 re-rank of the top k * rerank")
+    args = parser.parse_args()
+
+    vectors = synthetic_catalog(args.size, args.dim, clusters=max(8, args.size // 500))
+    queries = synthetic_catalog(args.queries, args.dim, clusters=max(8, args.size // 500), seed=1)
+    baseline = [top_k(vectors @ q, args.k) for q in queries]
+
+    for dtype in ("float32", "float16", "int8"):
+        compact = QuantizedVectors(vectors, dtype)
+        for rerank in ((0,) if dtype == "float32" else (0, args.rerank)):
+            overlaps = []
+            start = time.perf_counter()
+            for q, truth in zip(queries, baseline):
+                scores = compact.scores(q)
+                if rerank:
+                    shortlist = top_k(scores, args.k * rerank)
+                    found = shortlist[top_k(vectors[shortlist] @ q, args.k)]
+                else:
+                    found = top_k(scores, args.k)
+                overlaps.append(len(set(found.tolist()) & set(truth.tolist())) / args.k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            label = dtype + (f"+rerank{rerank}" if rerank else "")
+            print(f"{label:<16} {compact.nbytes / 2**20:8.1f} MiB  {ms:8.2f} ms/query  "
+                  f"top-{args.k} overlap={np.mean(overlaps):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Per-request latency and allocations of the recommendation queries: three ORM
+queries plus getattr-based response building (previous) vs one projected
+UNION ALL statement mapped straight into response dicts.
+
+Runs against a synthetic catalog in a temporary SQLite file, with the same
+pragmas as the app, for the query shapes of /api/travel-plan (location
+filter, every match), /api/recommendations/day (location filter with LIMIT)
+and /api/chat (ranked ids).
+
+Usage (from backend/):
+    python -m benchmarks.bench_recommendation_queries --rows 5000 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database import Base, Hotel, Flight, Attraction, apply_sqlite_pragmas
+from models import HotelResponse, FlightResponse, AttractionResponse
+from recommendations import LOCATION_COLUMNS, SORT_ORDER, CategoryQuery, fetch_recommendations
+
+CITIES = [(f"City{i}", f"Country{i % 40}") for i in range(200)]
+TEXT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+
+
+def synthetic_rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    hotels, flights, attractions = [], [], []
+    for i in range(n):
+        city, country = rng.choice(CITIES)
+        hotels.append({"name": f"Hotel {i}", "city": city, "country": country, "price_per_night": rng.uniform(50, 500),
+                       "rating": rng.uniform(3, 5), "description": TEXT, "amenities": "WiFi, Pool, Spa, Restaurant",
+                       "image_url": "https://example.com/h.jpg", "address": f"{i} Main St", "booking_link": "https://example.com",
+                       "images": json.dumps(["https://example.com/1.jpg", "https://example.com/2.jpg"])})
+        origin, _ = rng.choice(CITIES)
+        flights.append({"airline": "Air", "flight_number": f"AB{i}", "origin": origin, "destination": city,
+                        "departure_airport": "Airport (AAA)", "arrival_airport": "Airport (BBB)",
+                        "departure_date": "2026-01-01", "departure_time": "08:00", "arrival_time": "12:00",
+                        "price": rng.uniform(100, 1500), "duration": "4h", "stops": rng.randint(0, 2),
+                        "flight_class": "Economy", "booking_link": "https://example.com"})
+        attractions.append({"name": f"Attraction {i}", "city": city, "country": country, "category": "culture",
+                            "description": TEXT, "price": rng.uniform(0, 80), "rating": rng.uniform(3, 5),
+                            "image_url": "https://example.com/a.jpg", "address": f"{i} Side St",
+                            "opening_hours": "9:00-17:00", "ticket_link": "https://example.com",
+                            "images": json.dumps(["https://example.com/1.jpg"])})
+    return hotels, flights, attractions
+
+
+async def previous(db, scenario: dict):
+    """Three ORM queries and the getattr-over-__fields__ response building, ordered like the projected path"""
+    results = {}
+    for item_type, model_cls, response_cls in (("hotel", Hotel, HotelResponse), ("flight", Flight, FlightResponse),
+                                               ("attraction", Attraction, AttractionResponse)):
+        query = scenario[item_type]
+        stmt = select(model_cls)
+        if query.ids is not None:
+            stmt = stmt.where(model_cls.id.in_(query.ids))
+        if query.cities is not None:
+            city_column, country_column = LOCATION_COLUMNS[item_type]
+            stmt = stmt.where(city_column.in_(query.cities) | country_column.in_(query.countries))
+        if query.ids is None:
+            # Same order the paged endpoints use
+            field, descending = SORT_ORDER[item_type]
+            sort = func.coalesce(getattr(model_cls, field), 0.0)
+            stmt = stmt.order_by(sort.desc() if descending else sort, model_cls.id)
+        if query.limit is not None:
+            stmt = stmt.limit(query.limit)
+        rows = (await db.scalars(stmt)).all()
+        if query.ids is not None:
+            by_id = {row.id: row for row in rows}
+            rows = [by_id[i] for i in query.ids if i in by_id]
+        results[item_type] = [response_cls(**{k: getattr(r, k) for k in response_cls.__fields__.keys()}) for r in rows]
+    return results
+
+
+async def projected(db, scenario: dict):
+    return await fetch_recommendations(db, scenario)
+
+
+def scenarios(n_rows: int, rng: random.Random):
+    def travel_plan():
+        locations = list(rng.choice(CITIES))
+        return {item_type: CategoryQuery(cities=locations[-1:], countries=locations)
+                for item_type in ("hotel", "flight", "attraction")}
+
+    def day():
+        locations = list(rng.choice(CITIES))
+        return {item_type: CategoryQuery(cities=locations, countries=locations, limit=limit)
+                for item_type, limit in (("hotel", 6), ("flight", 5), ("attraction", 6))}
+
+    def chat():
+        return {item_type: CategoryQuery(ids=rng.sample(range(1, n_rows + 1), k))
+                for item_type, k in (("hotel", 6), ("flight", 5), ("attraction", 6))}
+
+    return {"travel-plan": travel_plan, "day": day, "chat": chat}
+
+
+async def measure(session_factory, fn, make_scenario, requests: int) -> dict:
+    latencies, peaks, blocks = [], [], []
+    for _ in range(requests):
+        scenario = make_scenario()
+        async with session_factory() as db:
+            start = time.perf_counter()
+            await fn(db, scenario)
+            latencies.append(time.perf_counter() - start)
+    # Allocations are traced in a separate pass, since tracing slows every allocation down
+    tracemalloc.start()
+    for _ in range(min(requests, 100)):
+        scenario = make_scenario()
+        async with session_factory() as db:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            base, _ = tracemalloc.get_traced_memory()
+            result = await fn(db, scenario)
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            peaks.append(peak - base)
+            blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "lineno") if stat.count_diff > 0))
+            del result
+    tracemalloc.stop()
+    ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "peak_kib": round(float(np.mean(peaks)) / 1024, 1),
+        "live_blocks": int(np.mean(blocks)),
+    }
+
+
+async def run(rows: int, requests: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", poolclass=AsyncAdaptedQueuePool)
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for model_cls, data in zip((Hotel, Flight, Attraction), synthetic_rows(rows)):
+                await conn.execute(insert(model_cls), data)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        for name, make_scenario in scenarios(rows, random.Random(1)).items():
+            # Both paths must return the same responses
+            scenario = make_scenario()
+            async with session_factory() as db:
+                expected = {item_type: [item.model_dump() for item in items]
+                            for item_type, items in (await previous(db, scenario)).items()}
+                assert expected == await projected(db, scenario)
+            for label, fn in (("previous", previous), ("projected", projected)):
+                result = await measure(session_factory, fn, make_scenario, requests)
+                print(json.dumps({"scenario": name, "rows": rows, "path": label, **result}), flush=True)
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="rows per catalog table")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Hit ratio and latency of the response cache (cache.ResponseCache) on a replayed request log.
+
+Replays a log of /api/recommendations/day/{day} and /api/travel-plan requests
+against main:app on a synthetic catalog with the fake encoder, called
+in-process through httpx.ASGITransport, once per mode:
+
+off: RESPONSE_CACHE_MAX_BYTES=0, every request queries SQLite and encodes.
+on: the cache with --cache-bytes (each size is its own run).
+revalidate: the cache, and a client that sends If-None-Match with the ETag
+it last got for the same day page, so repeats come back as 304s (travel plans
+are POSTs, which don't revalidate).
+
+The log is --log (JSON Lines of {"method", "path", "body"}, e.g. taken from
+an access log) or --requests requests drawn from bench_api's request mix,
+where popular cities come up more. Reports the server's hit ratio,
+evictions and cached bytes, the share of 304s, and requests/sec and
+p50/p95/p99 overall and for hits and misses.
+
+Usage (from backend/):
+    python -m benchmarks.bench_response_cache --rows 10000 --requests 20000 --cache-bytes 1048576 33554432
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_api import request_mix
+from benchmarks.synthetic_catalog import ensure_catalog
+
+
+def generated_log(count: int, seed: int) -> list:
+    """count requests, half day pages and half travel plans, each drawn from bench_api's mix"""
+    rng = random.Random(seed)
+    mixes = [request_mix("day", seed), request_mix("travel-plan", seed)]
+    return [rng.choice(rng.choice(mixes))[:3] for _ in range(count)]
+
+
+def read_log(path: str) -> list:
+    with open(path) as f:
+        return [(entry["method"], entry["path"], entry.get("body")) for entry in map(json.loads, f) if entry]
+
+
+def percentiles(latencies: list) -> dict:
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3)}
+
+
+async def replay(log: list, concurrency: int, revalidate: bool) -> dict:
+    import httpx
+
+    # Imported here, after the parent set the catalog, encoder and cache size
+    import main
+
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            etags = {}
+            latencies = {"hit": [], "miss": []}
+            statuses = {}
+            next_request = 0
+
+            async def worker():
+                nonlocal next_request
+                while next_request < len(log):
+                    method, path, body = log[next_request]
+                    next_request += 1
+                    headers = {"Content-Type": "application/json"} if body else {}
+                    if revalidate and method == "GET" and (method, path, body) in etags:
+                        headers["If-None-Match"] = etags[(method, path, body)]
+                    hits = main.response_cache.hits
+                    start = time.perf_counter()
+                    response = await client.request(method, path, content=body, headers=headers)
+                    elapsed = time.perf_counter() - start
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    # A hit bumps the counter during the request; with concurrency > 1 this is approximate
+                    latencies["hit" if main.response_cache.hits > hits else "miss"].append(elapsed)
+                    if "etag" in response.headers:
+                        etags[(method, path, body)] = response.headers["etag"]
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            seconds = time.perf_counter() - start
+        every = latencies["hit"] + latencies["miss"]
+        row = {"requests": len(every), "rps": round(len(every) / seconds, 1), **percentiles(every),
+               "statuses": statuses, "not_modified_pct": round(statuses.get(304, 0) * 100 / len(every), 1)}
+        row.update({f"hit_{key}": value for key, value in percentiles(latencies["hit"]).items()})
+        row.update({f"miss_{key}": value for key, value in percentiles(latencies["miss"]).items()})
+        row["cache"] = main.response_cache.stats()
+        return row
+    finally:
+        await main.app.router.shutdown()
+
+
+def child(env: dict, log: list, concurrency: int, revalidate: bool, results):
+    os.environ.update(env)
+    results.put(asyncio.run(replay(log, concurrency, revalidate)))
+
+
+def run_mode(env: dict, log: list, concurrency: int, revalidate: bool) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=child, args=(env, log, concurrency, revalidate, results))
+    process.start()
+    row = results.get()
+    process.join()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic catalog rows per table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep the catalog here and reuse it")
+    parser.add_argument("--log", help="JSON Lines request log to replay instead of a generated one")
+    parser.add_argument("--requests", type=int, default=20_000, help="size of the generated log")
+    parser.add_argument("--cache-bytes", type=int, nargs="+", default=[32 * 2**20])
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    log = read_log(args.log) if args.log else generated_log(args.requests, args.seed)
+    print(json.dumps({"log_requests": len(log), "distinct": len(set(log))}), flush=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or tmp
+        os.makedirs(work_dir, exist_ok=True)
+        env = {"TRAVEL_AGENT_DB": ensure_catalog(work_dir, args.rows, args.seed),
+               "ENCODER_MODEL_FACTORY": "benchmarks.fake_encoder:FakeEncoder"}
+        runs = [("off", 0, False)]
+        runs += [("on", size, False) for size in args.cache_bytes]
+        runs += [("revalidate", size, True) for size in args.cache_bytes]
+        for mode, size, revalidate in runs:
+            row = run_mode({**env, "RESPONSE_CACHE_MAX_BYTES": str(size)}, log, args.concurrency, revalidate)
+            print(json.dumps({"mode": mode, "cache_bytes": size, **row}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
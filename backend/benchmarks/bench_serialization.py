@@ -0,0 +1,107 @@
+"""
+CPU time and peak memory of encoding a RecommendationsResponse with 100, 1k
+and 10k items.
+
+Compares the previous path (a response model per row built with getattr,
+then FastAPI re-validating and JSON-encoding the tree) with the trusted
+fast path: row dicts encoded by the stdlib encoder, by orjson, and by orjson
+with warm per-row fragments.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization --sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import serialization
+from benchmarks.bench_recommendation_queries import synthetic_rows
+from models import RecommendationsResponse, HotelResponse, FlightResponse, AttractionResponse
+from serialization import RowFragments, recommendations_json
+
+RESPONSE_FIELD = create_response_field(name="Response", type_=RecommendationsResponse)
+
+
+def catalog(n: int) -> dict:
+    """n items split across categories, as row dicts with ids"""
+    hotels, flights, attractions = synthetic_rows(n // 3 + 1)
+    rows = {}
+    for item_type, data, response_cls in (("hotel", hotels, HotelResponse), ("flight", flights, FlightResponse),
+                                          ("attraction", attractions, AttractionResponse)):
+        rows[item_type] = [{name: ({"id": i + 1, **row}).get(name) for name in response_cls.model_fields}
+                           for i, row in enumerate(data)]
+    rows["attraction"] = rows["attraction"][:n - len(rows["hotel"]) - len(rows["flight"])]
+    return rows
+
+
+def previous(rows: dict) -> bytes:
+    objects = {item_type: [SimpleNamespace(**row) for row in items] for item_type, items in rows.items()}
+    response = RecommendationsResponse(
+        hotels=[HotelResponse(**{k: getattr(h, k) for k in HotelResponse.model_fields.keys()}) for h in objects["hotel"]],
+        flights=[FlightResponse(**{k: getattr(f, k) for k in FlightResponse.model_fields.keys()}) for f in objects["flight"]],
+        attractions=[AttractionResponse(**{k: getattr(a, k) for k in AttractionResponse.model_fields.keys()})
+                     for a in objects["attraction"]],
+        days=3,
+        current_day=1,
+    )
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=response))
+    return JSONResponse(content).body
+
+
+def trusted(rows: dict, fragments=None) -> bytes:
+    return recommendations_json(rows, days=3, current_day=1, fragments=fragments)
+
+
+def stdlib(rows: dict) -> bytes:
+    orjson, serialization.orjson = serialization.orjson, None
+    try:
+        return trusted(rows)
+    finally:
+        serialization.orjson = orjson
+
+
+def measure(fn, rows: dict, repeat: int) -> dict:
+    fn(rows)
+    start = time.process_time()
+    for _ in range(repeat):
+        body = fn(rows)
+    cpu = (time.process_time() - start) / repeat
+    tracemalloc.start()
+    fn(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": round(cpu * 1000, 3), "peak_kib": round(peak / 1024, 1), "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rows = catalog(size)
+        fragments = RowFragments()
+        paths = {
+            "previous": previous,
+            "trusted_stdlib": stdlib,
+            "trusted_orjson": trusted,
+            "trusted_orjson_fragments": lambda r: trusted(r, fragments),
+        }
+        # Every path must produce the same document
+        expected = json.loads(previous(rows))
+        for name, fn in paths.items():
+            assert json.loads(fn(rows)) == {**expected, "session_id": None}, name
+        for name, fn in paths.items():
+            print(json.dumps({"items": size, "path": name, **measure(fn, rows, args.repeat)}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
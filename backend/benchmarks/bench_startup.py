@@ -0,0 +1,64 @@
+"""
+Startup latency: time from launching uvicorn to the first response byte on
+`/`, and to `/api/ready` reporting the model as loaded.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup --runs 3
+"""
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import time
+
+
+def first_byte(port: int, path: str) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read(1)
+        return response.status
+    finally:
+        conn.close()
+
+
+def wait_for(port: int, path: str, start: float, status: int, timeout: float):
+    while time.perf_counter() - start < timeout:
+        try:
+            if first_byte(port, path) == status:
+                return time.perf_counter() - start
+        except OSError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def run_once(port: int, timeout: float) -> dict:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+    )
+    try:
+        first = wait_for(port, "/", start, 200, timeout)
+        ready = wait_for(port, "/api/ready", start, 200, timeout)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_byte_s": first, "model_ready_s": ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    for run in range(args.runs):
+        print(json.dumps({"run": run, **run_once(args.port, args.timeout)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Recall vs latency of the IVF vector index against the exact chat ranking path.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_index --size 100000 --k 6
+"""
+import argparse
+import time
+
+import numpy as np
+
+from vector_index import VectorIndex, top_k
+
+
+def synthetic_catalog(size: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors grouped around random topics, like real catalog embeddings"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(clusters, dim))
+    vectors = topics[rng.integers(0, clusters, size)] + 0.6 * rng.normal(size=(size, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_sort(vectors: np.ndarray, query: np.ndarray, k: int) -> list:
+    """The previous /api/chat path: score everything, full Python sort"""
+    scored = list(zip(range(len(vectors)), vectors @ query))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return [i for i, _ in scored[:k]]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--filter-fraction", type=float, default=0.0,
+                        help="restrict each search to this fraction of ids (0 = no filter)")
+    args = parser.parse_args()
+
+    vectors = synthetic_catalog(args.size, args.dim, clusters=max(8, args.size // 500))
+    ids = np.arange(args.size)
+    queries = synthetic_catalog(args.queries, args.dim, clusters=max(8, args.size // 500), seed=1)
+    allowed = None
+    if args.filter_fraction:
+        rng = np.random.default_rng(2)
+        allowed = set(rng.choice(args.size, int(args.size * args.filter_fraction), replace=False).tolist())
+
+    start = time.perf_counter()
+    index = VectorIndex(ids, vectors)
+    print(f"build: {time.perf_counter() - start:.2f}s for {args.size} vectors ({len(index.lists)} lists)")
+
+    if allowed is None:
+        truth, sort_ms = timed(lambda q: exact_sort(vectors, q, args.k), queries)
+        print(f"{'exact list.sort':<22} recall@{args.k}=1.000  {sort_ms:8.3f} ms/query")
+    if allowed is None:
+        truth, exact_ms = timed(lambda q: top_k(vectors @ q, args.k).tolist(), queries)
+    else:
+        allowed_idx = np.array(sorted(allowed))
+        truth, exact_ms = timed(lambda q: allowed_idx[top_k(vectors[allowed_idx] @ q, args.k)].tolist(), queries)
+    print(f"{'exact argpartition':<22} recall@{args.k}=1.000  {exact_ms:8.3f} ms/query")
+
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        if n_probe > len(index.lists):
+            break
+        found, ms = timed(lambda q: [i for i, _ in index.search(q, args.k, allowed, n_probe=n_probe)], queries)
+        recall = np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+        print(f"{'ivf n_probe=' + str(n_probe):<22} recall@{args.k}={recall:.3f}  {ms:8.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Memory per worker and aggregate /api/chat throughput for 1, 2, 4 and 8
+uvicorn workers, with or without the shared encoder process.
+
+RSS counts shared pages (the memory-mapped embedding matrix, the model in
+each worker) once per process; PSS splits shared pages between the
+processes mapping them, so its sum is the real footprint. Linux only.
+
+Usage (from backend/):
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --shared-encoder
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+from benchmarks.bench_startup import wait_for
+from benchmarks.load_chat import run_level
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS and PSS of a process in kB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower() + "_kb"] = int(rest.split()[0])
+    return values
+
+
+def worker_pids(pid: int) -> list:
+    """uvicorn worker processes, or the server itself when it runs a single worker"""
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        pids = [int(child) for child in f.read().split()]
+    workers = []
+    for child in pids:
+        with open(f"/proc/{child}/cmdline", "rb") as f:
+            if b"resource_tracker" not in f.read():
+                workers.append(child)
+    return workers or [pid]
+
+
+def run(workers: int, port: int, address: str, concurrency: int, duration: float) -> dict:
+    env = dict(os.environ)
+    if address:
+        env["ENCODER_ADDRESS"] = address
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        start = time.perf_counter()
+        # Each worker loads independently; keep polling until several checks in a row pass
+        for _ in range(workers * 4):
+            if wait_for(port, "/api/ready", start, 200, timeout=600) is None:
+                raise RuntimeError("server did not become ready")
+        result = run_level(urlparse(f"http://127.0.0.1:{port}"), "/api/chat", concurrency, duration)
+        worker_memory = [memory_kb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "workers": workers,
+        "shared_encoder": bool(address),
+        "throughput_rps": result["throughput_rps"],
+        "p99_ms": result["p99_ms"],
+        "rss_kb_per_worker": [m["rss_kb"] for m in worker_memory],
+        "pss_kb_total": sum(m["pss_kb"] for m in worker_memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--shared-encoder", action="store_true",
+                        help="run encoder_server.py and point every worker at it")
+    parser.add_argument("--address", default="/tmp/travel_agent_encoder_bench.sock")
+    args = parser.parse_args()
+
+    encoder = None
+    if args.shared_encoder:
+        encoder = subprocess.Popen([sys.executable, "encoder_server.py", "--address", args.address])
+    try:
+        for workers in args.workers:
+            address = args.address if args.shared_encoder else None
+            result = run(workers, args.port, address, args.concurrency, args.duration)
+            if encoder is not None:
+                result["encoder_pss_kb"] = memory_kb(encoder.pid)["pss_kb"]
+            print(json.dumps(result))
+    finally:
+        if encoder is not None:
+            encoder.terminate()
+            encoder.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Failure handling of FlowgladClient against the Flowglad stand-in
+(benchmarks/flowglad_stub.py), checked by counting the calls the stub serves.
+
+Fails (exit status 1) unless:
+- the circuit breaker opens after FLOWGLAD_BREAKER_FAILURES consecutive
+  failures, then fails fast without calling, and a trial call closes it again;
+- a POST answered with 500, 502 or 504 is not sent again;
+- 429 and 503 are retried (honouring Retry-After) up to max_retries, and no
+  retry starts that would end past the deadline;
+- a call that never gets an answer fails with 504 after the read timeout,
+  and the POST is not sent again.
+
+Usage (from backend/):
+    python -m benchmarks.check_flowglad_client
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_checkout import PAYLOAD, stub_config
+from benchmarks.bench_startup import wait_for
+from flowglad import FLOWGLAD_BREAKER_FAILURES, CircuitBreaker, FlowgladClient, FlowgladError
+
+HEALTHY = {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "error_status": 503, "hang": False,
+           "fail_next": 0, "retry_after": None}
+
+
+def stub_calls(port: int) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", "/_stub/stats")
+    calls = json.loads(conn.getresponse().read()).get("calls", 0)
+    conn.close()
+    return calls
+
+
+async def checkout(client: FlowgladClient, port: int) -> tuple:
+    """(status, stub calls made, seconds) of one checkout call"""
+    before = stub_calls(port)
+    start = time.perf_counter()
+    try:
+        await client.create_checkout_session(PAYLOAD)
+        status = 200
+    except FlowgladError as e:
+        status = e.status_code
+    return status, stub_calls(port) - before, time.perf_counter() - start
+
+
+async def check_breaker(url: str, port: int) -> list:
+    found = []
+    reset_seconds = 0.5
+    client = FlowgladClient(base_url=url, max_retries=0, breaker=CircuitBreaker(reset_seconds=reset_seconds))
+    stub_config(port, **dict(HEALTHY, error_rate=1.0, error_status=500))
+    for n in range(1, FLOWGLAD_BREAKER_FAILURES + 1):
+        status, calls, _ = await checkout(client, port)
+        if (status, calls) != (500, 1):
+            found.append(f"failure {n}: {status} after {calls} call(s), expected 500 after 1")
+        expected = "open" if n == FLOWGLAD_BREAKER_FAILURES else "closed"
+        if client.breaker.state != expected:
+            found.append(f"breaker {client.breaker.state} after {n} failure(s), expected {expected}")
+    status, calls, _ = await checkout(client, port)
+    if (status, calls) != (503, 0):
+        found.append(f"open breaker: {status} after {calls} call(s), expected 503 without calling")
+    stub_config(port, **HEALTHY)
+    await asyncio.sleep(reset_seconds)
+    status, calls, _ = await checkout(client, port)
+    if (status, calls, client.breaker.state) != (200, 1, "closed"):
+        found.append(f"trial call: {status} after {calls} call(s), breaker {client.breaker.state}, "
+                     "expected 200 after 1 and closed")
+    await client.aclose()
+    return found
+
+
+async def check_not_retried(url: str, port: int, error_status: int) -> list:
+    client = FlowgladClient(base_url=url, breaker=CircuitBreaker(failures=100))
+    # Only the first call fails, so a retry would succeed
+    stub_config(port, **dict(HEALTHY, fail_next=1, error_status=error_status))
+    status, calls, _ = await checkout(client, port)
+    await client.aclose()
+    if (status, calls) != (error_status, 1):
+        return [f"{status} after {calls} call(s), expected {error_status} after 1"]
+    return []
+
+
+async def check_retried(url: str, port: int, error_status: int) -> list:
+    found = []
+    client = FlowgladClient(base_url=url, max_retries=2, deadline=5.0, breaker=CircuitBreaker(failures=100))
+    stub_config(port, **dict(HEALTHY, fail_next=1, error_status=error_status, retry_after=0.05))
+    status, calls, _ = await checkout(client, port)
+    if (status, calls) != (200, 2):
+        found.append(f"one failure: {status} after {calls} call(s), expected 200 after 2")
+    stub_config(port, **dict(HEALTHY, error_rate=1.0, error_status=error_status, retry_after=0.05))
+    status, calls, _ = await checkout(client, port)
+    if (status, calls) != (error_status, 3):
+        found.append(f"every call failing: {status} after {calls} call(s), expected {error_status} after 3")
+    await client.aclose()
+
+    # The second Retry-After wait would end past the deadline, so only one retry starts
+    client = FlowgladClient(base_url=url, max_retries=5, deadline=1.0, breaker=CircuitBreaker(failures=100))
+    stub_config(port, **dict(HEALTHY, error_rate=1.0, error_status=error_status, retry_after=0.6))
+    status, calls, seconds = await checkout(client, port)
+    if (status, calls) != (error_status, 2) or seconds >= client.deadline:
+        found.append(f"deadline 1s: {status} after {calls} call(s) in {seconds:.2f}s, "
+                     f"expected {error_status} after 2 within the deadline")
+    await client.aclose()
+    return found
+
+
+async def check_hang(url: str, port: int) -> list:
+    read_timeout = 0.5
+    client = FlowgladClient(base_url=url, read_timeout=read_timeout, breaker=CircuitBreaker(failures=100))
+    stub_config(port, **dict(HEALTHY, hang=True))
+    status, calls, seconds = await checkout(client, port)
+    stub_config(port, **HEALTHY)
+    await client.aclose()
+    if (status, calls) != (504, 1) or not read_timeout <= seconds < read_timeout + 1:
+        return [f"{status} after {calls} call(s) in {seconds:.2f}s, "
+                f"expected 504 after 1 once the {read_timeout}s read timeout passed"]
+    return []
+
+
+async def run_checks(port: int) -> int:
+    url = f"http://127.0.0.1:{port}"
+    checks = [("breaker", check_breaker, ())]
+    checks += [(f"post_not_retried[{status}]", check_not_retried, (status,)) for status in (500, 502, 504)]
+    checks += [(f"retried[{status}]", check_retried, (status,)) for status in (429, 503)]
+    checks += [("hang", check_hang, ())]
+    failures = 0
+    for name, check, args in checks:
+        found = await check(url, port, *args)
+        failures += bool(found)
+        print(f"{'FAIL' if found else 'ok'}  {name}")
+        for problem in found:
+            print(f"      ! {problem}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub-port", type=int, default=8792)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.flowglad_stub", "--port", str(args.stub_port)])
+    try:
+        if wait_for(args.stub_port, "/_stub/stats", time.perf_counter(), 200, 30) is None:
+            sys.exit("flowglad_stub did not start")
+        failures = asyncio.run(run_checks(args.stub_port))
+    finally:
+        stub.terminate()
+        stub.wait()
+    print(f"{failures} check(s) failed" if failures else "all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+EXPLAIN QUERY PLAN audit of the hot catalog queries: recommendation pages
+(location, unfiltered, structured filters, next pages), chat id lookups, the
+location/filter id scopes chat ranks within, and the BM25 candidate queries.
+
+Fails (exit status 1) when a plan scans a table, scans an index other than a
+page order index (which LIMIT stops early), or sorts a whole category for an
+unnarrowed page. Runs against a synthetic catalog by default, or --db.
+
+Usage (from backend/):
+    python -m benchmarks.check_query_plans --rows 5000
+    python -m benchmarks.check_query_plans --db travel_agent.db --analyze
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, event, insert, text
+
+from amenities import ensure_amenity_index
+from benchmarks.bench_amenity_filters import synthetic_hotels
+from benchmarks.bench_recommendation_queries import synthetic_rows
+from database import Base, Hotel, Flight, Attraction, apply_sqlite_pragmas, ensure_indexes
+from fulltext import _STATEMENTS, ensure_fulltext_index, match_query
+from models import RecommendationFilters
+from recommendations import CATEGORIES, CategoryQuery, ids_statement, recommendations_statement, statement_params, with_filters
+
+LOCATIONS = ["City7", "Country7"]
+PAGE = 21
+# A keyset position in the middle of each category's order
+AFTER = {"hotel": [4.0, 100], "flight": [800.0, 100], "attraction": [4.0, 100]}
+FILTERS = RecommendationFilters(amenities_all=["Pool", "Spa"], categories=["culture"], min_rating=4.0, max_price=300)
+
+_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?")
+
+
+def page_scenarios():
+    """name -> (queries per category, whether the page order must come from an index)"""
+    located = {t: CategoryQuery(cities=LOCATIONS[:1], countries=LOCATIONS, limit=PAGE) for t in CATEGORIES}
+    everything = {t: CategoryQuery(limit=PAGE) for t in CATEGORIES}
+    return {
+        "page_location": (located, False),
+        "page_location_next": ({t: CategoryQuery(cities=LOCATIONS[:1], countries=LOCATIONS, limit=PAGE, after=AFTER[t])
+                                for t in CATEGORIES}, False),
+        "page_all": (everything, True),
+        "page_all_next": ({t: CategoryQuery(limit=PAGE, after=AFTER[t]) for t in CATEGORIES}, True),
+        "page_location_filtered": (with_filters(located, FILTERS), False),
+        "page_all_filtered": (with_filters(everything, FILTERS), False),
+        "chat_ids": ({t: CategoryQuery(ids=[3, 1, 2]) for t in CATEGORIES}, False),
+    }
+
+
+def scope_scenarios():
+    """name -> scope per category, as chat resolves allowed ids"""
+    located = {t: CategoryQuery(cities=LOCATIONS, countries=LOCATIONS) for t in CATEGORIES}
+    return {
+        "scope_location": located,
+        "scope_location_filtered": with_filters(located, FILTERS),
+        "scope_filtered": with_filters({t: CategoryQuery() for t in CATEGORIES}, FILTERS),
+    }
+
+
+def explain(conn, statement, params) -> list:
+    compiled = statement.compile(dialect=conn.dialect)
+    expanded = compiled.construct_expanded_state(params)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + expanded.statement, expanded.positional_parameters)
+    return [row[3] for row in rows]
+
+
+def problems(plan: list, tables: set, ordered: bool) -> list:
+    found = []
+    for line in plan:
+        match = _SCAN.match(line)
+        if match and match.group(1) in tables:
+            table, index = match.groups()
+            if index is None:
+                found.append(f"full scan of {table}")
+            elif not index.endswith("_page_order"):
+                found.append(f"full scan of {table} through {index}")
+        if ordered and line.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            found.append("sorts the whole category instead of walking the page order index")
+    return found
+
+
+def audit(engine) -> int:
+    tables = set(Base.metadata.tables)
+    failures = 0
+
+    def report(name: str, plan: list, ordered: bool = False):
+        nonlocal failures
+        found = problems(plan, tables, ordered)
+        failures += bool(found)
+        print(f"{'FAIL' if found else 'ok'}  {name}")
+        for line in plan:
+            print(f"        {line}")
+        for problem in found:
+            print(f"      ! {problem}")
+
+    with engine.connect() as conn:
+        for name, (queries, ordered) in page_scenarios().items():
+            statement = recommendations_statement(tuple((t, query.shape) for t, query in queries.items()))
+            report(name, explain(conn, statement, statement_params(queries)), ordered)
+        for name, scopes in scope_scenarios().items():
+            for item_type, scope in scopes.items():
+                report(f"{name}[{item_type}]",
+                       explain(conn, ids_statement(item_type, scope.shape), statement_params({item_type: scope})))
+        for (item_type, filtered), statement in _STATEMENTS.items():
+            params = {"query": match_query("pool spa"), "k": 200}
+            if filtered:
+                params["locations"] = LOCATIONS
+            report(f"bm25[{item_type}{', location' if filtered else ''}]", explain(conn, statement, params))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="rows per category of the synthetic catalog")
+    parser.add_argument("--db", help="audit this SQLite file instead (indexes are created, rows left alone)")
+    parser.add_argument("--analyze", action="store_true", help="ANALYZE first (writes sqlite_stat1), so plans use table statistics")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{args.db or os.path.join(tmp, 'plans.db')}")
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+        Base.metadata.create_all(engine)
+        ensure_indexes(engine)
+        ensure_fulltext_index(engine)
+        ensure_amenity_index(engine)
+        if not args.db:
+            _, flights, attractions = synthetic_rows(args.rows)
+            with engine.begin() as conn:
+                # Hotels with skewed amenity lists, so table statistics look like a real catalog's
+                conn.execute(insert(Hotel), list(synthetic_hotels(args.rows)))
+                conn.execute(insert(Flight), flights)
+                conn.execute(insert(Attraction), attractions)
+        if args.analyze:
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE"))
+        failures = audit(engine)
+        engine.dispose()
+    print(f"{failures} plan(s) regressed to a scan" if failures else "all plans index-driven")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Deterministic stand-in for SentenceTransformer, for offline and reproducible benchmarks.
+
+Each word gets a fixed pseudo-random unit vector seeded by its CRC32, and a
+text is the sum of its words' vectors: texts sharing words are similar, the
+same text always encodes to the same vector, on any machine, without
+downloading a model. Load it through the app's model loader with
+
+    ENCODER_MODEL_FACTORY=benchmarks.fake_encoder:FakeEncoder
+
+FAKE_ENCODER_MS_PER_TEXT adds a sleep per encoded text, to stand in for the
+cost of a real forward pass (default 0).
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+DIMENSIONS = 384  # all-MiniLM-L6-v2
+FAKE_ENCODER_MS_PER_TEXT = float(os.getenv("FAKE_ENCODER_MS_PER_TEXT", "0"))
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeEncoder:
+    def __init__(self, model_name: str = "fake", dimensions: int = DIMENSIONS,
+                 ms_per_text: float = FAKE_ENCODER_MS_PER_TEXT, batch_size: int = 1024):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.ms_per_text = ms_per_text
+        self.batch_size = batch_size
+        self._ids = {}
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def _word_ids(self, words: List[str]) -> List[int]:
+        missing = [word for word in dict.fromkeys(words) if word not in self._ids]
+        if missing:
+            with self._lock:
+                missing = [word for word in missing if word not in self._ids]
+                vectors = [np.random.default_rng(zlib.crc32(word.encode())).standard_normal(self.dimensions)
+                           for word in missing]
+                if vectors:
+                    vectors = np.array(vectors, dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                    # Readers keep using the array they fetched; the grown copy replaces it whole
+                    self._vectors = np.concatenate([self._vectors, vectors])
+                    for word in missing:
+                        self._ids[word] = len(self._ids)
+        return [self._ids[word] for word in words]
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            # Empty texts encode as the empty word, so every text has at least one
+            batch = [_WORD.findall(text.lower()) or [""] for text in texts[start:start + self.batch_size]]
+            offsets = np.cumsum([0] + [len(words) for words in batch[:-1]])
+            ids = self._word_ids([word for words in batch for word in words])
+            embeddings[start:start + len(batch)] = np.add.reduceat(self._vectors[ids], offsets, axis=0)
+        if self.ms_per_text:
+            time.sleep(self.ms_per_text * len(texts) / 1000)
+        return embeddings
@@ -0,0 +1,78 @@
+"""
+Local stand-in for the Flowglad checkout API that injects latency and errors.
+
+Answers POST /api/v1/checkout-sessions like Flowglad does, after --latency-ms
+(plus up to --jitter-ms), failing a --error-rate share of calls with
+--error-status. POST /_stub/config changes any of these at runtime (e.g.
+{"error_rate": 1.0} to take the provider down, {"fail_next": 2} to fail just
+the next two calls, {"retry_after": 0.1} to send Retry-After with failures)
+and GET /_stub/stats reports the calls served.
+
+Usage (from backend/):
+    python -m benchmarks.flowglad_stub --port 8790 --latency-ms 300 --error-rate 0.2
+    FLOWGLAD_BASE_URL=http://127.0.0.1:8790 uvicorn main:app --port 8000
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+config = {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "error_status": 503, "hang": False,
+          "fail_next": 0, "retry_after": None}
+stats = Counter()
+
+app = FastAPI()
+
+
+@app.post("/api/v1/checkout-sessions")
+async def checkout_sessions(request: Request):
+    payload = await request.json()
+    stats["calls"] += 1
+    # No answer while hang is set: exercises the client's read timeout. Switching it off lets the
+    # server shut down, which waits for requests in flight
+    while config["hang"]:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep((config["latency_ms"] + random.uniform(0, config["jitter_ms"])) / 1000)
+    if config["fail_next"] > 0 or random.random() < config["error_rate"]:
+        config["fail_next"] = max(0, config["fail_next"] - 1)
+        stats[f"status_{config['error_status']}"] += 1
+        headers = {"Retry-After": str(config["retry_after"])} if config["retry_after"] is not None else None
+        return JSONResponse({"error": "injected failure"}, status_code=config["error_status"], headers=headers)
+    stats["status_200"] += 1
+    session_id = f"cs_{uuid.uuid4().hex[:16]}"
+    name = payload.get("checkoutSession", {}).get("outputName", "")
+    return {"checkoutSession": {"id": session_id, "url": f"https://checkout.example/{session_id}", "name": name}}
+
+
+@app.post("/_stub/config")
+async def set_config(changes: dict):
+    config.update({key: value for key, value in changes.items() if key in config})
+    return config
+
+
+@app.get("/_stub/stats")
+async def get_stats():
+    return dict(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+    config.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                  error_status=args.error_status)
+
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
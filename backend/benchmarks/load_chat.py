@@ -0,0 +1,91 @@
+"""
+Closed-loop load test for /api/chat against a running server.
+
+Each client keeps one keep-alive connection and sends chat messages back to
+back for the given duration. Reports throughput and latency percentiles for
+every concurrency level.
+
+Usage (server started separately, e.g. `uvicorn main:app --port 8000`):
+    python -m benchmarks.load_chat --url http://localhost:8000 --concurrency 50 100 200
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+MESSAGES = [
+    ("I want the trip to be chill, I love nature over history", "7-day trip to Japan"),
+    ("I will travel with my parents", "5 days in Paris"),
+    ("Make it more budget-friendly", "A week in Europe"),
+    ("more relaxing, maybe an onsen", "3-day trip to Hakone"),
+    ("cheaper hotels with a pool", "10 days in Thailand"),
+    ("museums and history please", "Rome for 4 days"),
+]
+
+
+def run_client(url, path: str, deadline: float, offset: int, latencies: list, errors: list):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    i = offset
+    while time.perf_counter() < deadline:
+        message, plan = MESSAGES[i % len(MESSAGES)]
+        body = json.dumps({"message": message, "current_plan": plan})
+        start = time.perf_counter()
+        try:
+            conn.request("POST", path, body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except Exception as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    conn.close()
+
+
+def run_level(url, path: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for n in range(concurrency):
+            pool.submit(run_client, url, path, deadline, n, latencies, errors)
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/api/chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency level")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    lock = threading.Lock()
+    for concurrency in args.concurrency:
+        result = run_level(url, args.path, concurrency, args.duration)
+        with lock:
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
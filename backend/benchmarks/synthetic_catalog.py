@@ -0,0 +1,218 @@
+"""
+Synthetic catalogs for offline benchmarks: hotels, flights and attractions
+in a scratch SQLite file, with embeddings from the fake encoder.
+
+Rows are spread over real cities with Zipf-like popularity (Bangkok, Paris and
+London hold far more rows than Ljubljana), plus a long tail of small towns
+that hold a fifth of the rows. Descriptions, amenities and categories are
+drawn from fixed vocabularies, so BM25 and the fake embeddings have
+something to rank on. The same rows and seed give the same file.
+
+The catalog is written through catalog_import with deferred indexes, and its
+embeddings are computed with benchmarks.fake_encoder, so a server pointed at
+it (TRAVEL_AGENT_DB) with ENCODER_MODEL_FACTORY=benchmarks.fake_encoder:FakeEncoder
+is ready as soon as it has loaded them.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_catalog --rows 100000 --db /tmp/catalog_100k.db
+    TRAVEL_AGENT_DB=/tmp/catalog_100k.db ENCODER_MODEL_FACTORY=benchmarks.fake_encoder:FakeEncoder \\
+        uvicorn main:app --port 8000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from amenities import ensure_amenity_index
+from benchmarks.bench_amenity_filters import AMENITIES
+from benchmarks.fake_encoder import FakeEncoder
+from catalog_import import import_records, peak_rss_mib
+from changes import ensure_change_log, prune_changes
+from database import Base, apply_sqlite_pragmas, ensure_columns, ensure_indexes
+from embedding_store import EmbeddingStore
+from fulltext import ensure_fulltext_index
+
+# (city, country, airport code), most visited first
+CITIES = [
+    ("Bangkok", "Thailand", "BKK"), ("Paris", "France", "CDG"), ("London", "UK", "LHR"),
+    ("Dubai", "United Arab Emirates", "DXB"), ("Singapore", "Singapore", "SIN"), ("New York", "USA", "JFK"),
+    ("Tokyo", "Japan", "HND"), ("Istanbul", "Turkey", "IST"), ("Kuala Lumpur", "Malaysia", "KUL"),
+    ("Seoul", "South Korea", "ICN"), ("Rome", "Italy", "FCO"), ("Barcelona", "Spain", "BCN"),
+    ("Amsterdam", "Netherlands", "AMS"), ("Osaka", "Japan", "KIX"), ("Hong Kong", "China", "HKG"),
+    ("Milan", "Italy", "MXP"), ("Vienna", "Austria", "VIE"), ("Prague", "Czech Republic", "PRG"),
+    ("Berlin", "Germany", "BER"), ("Madrid", "Spain", "MAD"), ("Los Angeles", "USA", "LAX"),
+    ("Lisbon", "Portugal", "LIS"), ("Sydney", "Australia", "SYD"), ("Kyoto", "Japan", "ITM"),
+    ("Venice", "Italy", "VCE"), ("Munich", "Germany", "MUC"), ("Dublin", "Ireland", "DUB"),
+    ("Florence", "Italy", "FLR"), ("Athens", "Greece", "ATH"), ("Budapest", "Hungary", "BUD"),
+    ("Copenhagen", "Denmark", "CPH"), ("Mexico City", "Mexico", "MEX"), ("Cairo", "Egypt", "CAI"),
+    ("Marrakesh", "Morocco", "RAK"), ("Cape Town", "South Africa", "CPT"), ("Rio de Janeiro", "Brazil", "GIG"),
+    ("Buenos Aires", "Argentina", "EZE"), ("Vancouver", "Canada", "YVR"), ("Hanoi", "Vietnam", "HAN"),
+    ("Bali", "Indonesia", "DPS"), ("Stockholm", "Sweden", "ARN"), ("Edinburgh", "UK", "EDI"),
+    ("Reykjavik", "Iceland", "KEF"), ("Hakone", "Japan", "HND"), ("Zurich", "Switzerland", "ZRH"),
+    ("Krakow", "Poland", "KRK"), ("Porto", "Portugal", "OPO"), ("Seville", "Spain", "SVQ"),
+    ("Dubrovnik", "Croatia", "DBV"), ("Ljubljana", "Slovenia", "LJU"),
+]
+# Popularity falls off as 1 / rank; the tail towns share TAIL_SHARE of the rows evenly
+TAIL_TOWNS = 400
+TAIL_SHARE = 0.2
+SYLLABLES = ["ka", "lo", "mer", "va", "ten", "ri", "sol", "an", "bru", "del", "mi", "or", "tas", "ven", "ul"]
+
+TERMS = ["onsen", "rooftop", "pool", "spa", "sauna", "garden", "beach", "casino", "vineyard", "ski", "harbour",
+         "historic", "museum", "nightlife", "family", "quiet", "luxury", "budget", "boutique", "temple", "market",
+         "hiking", "lake", "mountain", "castle", "street food", "jazz", "design", "romantic", "eco"]
+FILLER = ("Comfortable rooms with friendly staff close to the city centre and public transport.",
+          "A short walk from the old town, with views over the river.",
+          "Recently renovated, with breakfast served every morning.",
+          "Popular with couples and families alike.")
+ATTRACTION_CATEGORIES = ["culture", "history", "nature", "food", "shopping", "nightlife", "adventure", "relaxation"]
+ATTRACTION_KINDS = ["Museum", "Gardens", "Old Market", "Castle", "Food Tour", "Park", "Gallery", "Bathhouse",
+                    "Viewpoint", "Cathedral"]
+HOTEL_KINDS = ["Hotel", "Inn", "Suites", "Resort", "Hostel", "Residence", "Lodge"]
+AIRLINES = ["SkyWays", "Aurora Air", "Pacific Connect", "EuroJet", "Meridian", "Northwind", "Sunline"]
+FIRST_DEPARTURE = date(2030, 1, 1)
+DEPARTURE_DAYS = 90
+
+
+def locations(seed: int = 0) -> list:
+    """(city, country, airport) of every city rows can be in: the real ones, then the tail towns"""
+    rng = random.Random(seed)
+    towns = []
+    while len(towns) < TAIL_TOWNS:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        if name not in {town[0] for town in towns} and name not in {city[0] for city in CITIES}:
+            city, country, airport = rng.choice(CITIES)
+            towns.append((name, country, airport))
+    return CITIES + towns
+
+
+def popularity(count: int = len(CITIES) + TAIL_TOWNS) -> list:
+    """Cumulative weights over locations(): Zipf for the real cities, flat for the tail"""
+    head = [1.0 / (rank + 1) for rank in range(len(CITIES))]
+    towns = count - len(CITIES)
+    scale = (1 - TAIL_SHARE if towns else 1.0) / sum(head)
+    tail = [TAIL_SHARE / towns] * towns if towns else []
+    return list(accumulate([weight * scale for weight in head] + tail))
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.sample(TERMS, words)) + ". " + rng.choice(FILLER)
+
+
+def hotels(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    places, weights = locations(seed), popularity()
+    amenity_weights = [1.0 / (rank + 1) for rank in range(len(AMENITIES))]
+    for i, (city, country, _) in enumerate(rng.choices(places, cum_weights=weights, k=n)):
+        kind = rng.choice(HOTEL_KINDS)
+        yield i, {"supplier_id": f"H{i}", "name": f"{city} {rng.choice(TERMS).title()} {kind} {i}",
+                  "city": city, "country": country,
+                  "price_per_night": round(rng.lognormvariate(4.8, 0.5), 2), "rating": round(rng.uniform(3, 5), 1),
+                  "description": f"{kind} in {city} with {text(rng, 3)}",
+                  "amenities": ", ".join(sorted(set(rng.choices(AMENITIES, amenity_weights, k=6)))),
+                  "image_url": f"https://example.com/hotels/{i}.jpg", "address": f"{i} Main Street, {city}",
+                  "booking_link": f"https://example.com/book/hotel/{i}",
+                  "images": [f"https://example.com/hotels/{i}-1.jpg", f"https://example.com/hotels/{i}-2.jpg"]}
+
+
+def flights(n: int, seed: int = 0):
+    rng = random.Random(seed + 1)
+    # Flights connect the real cities only
+    weights = popularity(len(CITIES))
+    for i in range(n):
+        first, second = rng.choices(range(len(CITIES)), cum_weights=weights, k=2)
+        while second == first:
+            second = rng.choices(range(len(CITIES)), cum_weights=weights)[0]
+        (origin, _, origin_airport), (destination, _, arrival_airport) = CITIES[first], CITIES[second]
+        departure = rng.randint(0, 23 * 60 - 1)
+        minutes = rng.randint(60, 16 * 60)
+        yield i, {"supplier_id": f"F{i}", "airline": rng.choice(AIRLINES), "flight_number": f"SW{i}",
+                  "origin": origin, "destination": destination,
+                  "departure_airport": f"{origin} ({origin_airport})",
+                  "arrival_airport": f"{destination} ({arrival_airport})",
+                  "departure_date": (FIRST_DEPARTURE + timedelta(days=rng.randrange(DEPARTURE_DAYS))).isoformat(),
+                  "departure_time": f"{departure // 60:02d}:{departure % 60:02d}",
+                  "arrival_time": f"{(departure + minutes) // 60 % 24:02d}:{(departure + minutes) % 60:02d}",
+                  "price": round(rng.lognormvariate(6.2, 0.6), 2), "duration": f"{minutes // 60}h {minutes % 60}m",
+                  "stops": rng.choices([0, 1, 2], [6, 3, 1])[0],
+                  "flight_class": rng.choices(["Economy", "Premium Economy", "Business"], [8, 1, 1])[0],
+                  "booking_link": f"https://example.com/book/flight/{i}"}
+
+
+def attractions(n: int, seed: int = 0):
+    rng = random.Random(seed + 2)
+    places, weights = locations(seed), popularity()
+    for i, (city, country, _) in enumerate(rng.choices(places, cum_weights=weights, k=n)):
+        kind = rng.choice(ATTRACTION_KINDS)
+        yield i, {"supplier_id": f"A{i}", "name": f"{city} {kind} {i}", "city": city, "country": country,
+                  "category": rng.choice(ATTRACTION_CATEGORIES), "description": f"{kind} known for {text(rng, 3)}",
+                  "price": round(rng.choice([0, 0, rng.uniform(5, 80)]), 2), "rating": round(rng.uniform(3, 5), 1),
+                  "image_url": f"https://example.com/attractions/{i}.jpg", "address": f"{i} Side Street, {city}",
+                  "opening_hours": "9:00-17:00", "ticket_link": f"https://example.com/book/attraction/{i}",
+                  "images": [f"https://example.com/attractions/{i}-1.jpg"]}
+
+
+GENERATORS = {"hotel": hotels, "flight": flights, "attraction": attractions}
+
+
+def build(db_path: str, rows: int, seed: int = 0) -> dict:
+    """Write a catalog of `rows` rows per table and its fake embeddings; returns timings"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    # The same schema, indexes and sync triggers the app sets up at startup
+    Base.metadata.create_all(engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    ensure_fulltext_index(engine)
+    ensure_amenity_index(engine)
+    ensure_change_log(engine)
+    report = {"rows": rows, "seed": seed}
+    start = time.perf_counter()
+    for item_type, generate in GENERATORS.items():
+        stats = import_records(engine, item_type, generate(rows, seed), defer_indexes=True)
+        assert stats.rejected == 0, stats.errors[:3]
+    report["import_seconds"] = round(time.perf_counter() - start, 1)
+    prune_changes(engine)
+    start = time.perf_counter()
+    with Session(engine) as db:
+        EmbeddingStore(os.path.splitext(db_path)[0] + "_embeddings", FakeEncoder().encode).sync(db)
+    report["embed_seconds"] = round(time.perf_counter() - start, 1)
+    report["peak_rss_mib"] = peak_rss_mib()
+    engine.dispose()
+    return report
+
+
+def ensure_catalog(directory: str, rows: int, seed: int = 0) -> str:
+    """Path of the catalog for (rows, seed) in directory, built on first use"""
+    db_path = os.path.join(directory, f"catalog_{rows}_s{seed}.db")
+    report_path = os.path.splitext(db_path)[0] + "_report.json"
+    # The report is written last, so a build that was interrupted starts over
+    if not os.path.exists(report_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        report = build(db_path, rows, seed)
+        with open(report_path, "w") as f:
+            json.dump(report, f)
+        print(json.dumps({"catalog": db_path, **report}), flush=True)
+    return db_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", required=True, help="SQLite file to create")
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    print(json.dumps(build(args.db, args.rows, args.seed)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Bookings against per-date inventory, with Idempotency-Key support.
+
+Each bookable item has a capacity per date (rooms per night, seats on a
+flight, tickets per day). Inventory rows are created with the default
+capacity the first time a date is booked. A booking inserts its row and
+takes its units with a conditional upsert (booked + quantity <= capacity) in
+one short transaction, so two requests can never both get the last room.
+
+The transaction's first statement is a write: SQLite takes the write lock
+up front and concurrent bookings queue on busy_timeout. A transaction that
+read first would have to upgrade its lock, and under WAL that fails at once
+with SQLITE_BUSY instead of waiting. Within a process, booking transactions
+also queue on an asyncio lock, so only one connection per worker waits on
+SQLite's lock at a time.
+
+A request sent with an Idempotency-Key stores the key and a hash of the
+request body with the booking. A retry with the same key is answered from
+that row and books nothing. A key reused for a different request is rejected.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import uuid
+import weakref
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Booking, Inventory
+
+# Units per date of an item without an inventory row yet
+BOOKING_CAPACITY = {
+    "hotel": int(os.getenv("BOOKING_HOTEL_ROOMS", "10")),
+    "flight": int(os.getenv("BOOKING_FLIGHT_SEATS", "150")),
+    "attraction": int(os.getenv("BOOKING_ATTRACTION_TICKETS", "500")),
+}
+# Attempts after the write lock wait (busy_timeout) runs out, before answering 503
+BOOKING_LOCK_RETRIES = int(os.getenv("BOOKING_LOCK_RETRIES", "3"))
+
+# Booking transactions of a process run one at a time: the others wait here in FIFO order, instead
+# of all polling SQLite's lock with busy_timeout sleeps that grow to 100 ms
+_write_locks = weakref.WeakKeyDictionary()
+
+# A key that is already stored inserts nothing. Raising IntegrityError instead would leave the failed
+# statement to the garbage collector, which can then block the event loop on its connection's lock.
+_INSERT_BOOKING = insert(Booking).on_conflict_do_nothing(index_elements=[Booking.idempotency_key])
+# Creates the date's inventory row with the units taken, or takes them from the existing row if enough
+# are left; no row changes (rowcount 0) when the date is sold out
+_TAKE_UNITS = text(
+    "INSERT INTO inventory (item_type, item_id, date, capacity, booked) "
+    "VALUES (:item_type, :item_id, :date, :capacity, :quantity) "
+    "ON CONFLICT (item_type, item_id, date) DO UPDATE SET booked = booked + excluded.booked "
+    "WHERE booked + excluded.booked <= capacity")
+
+
+class BookingError(Exception):
+    """A booking that can't be made; status_code is what the API endpoint should answer with"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def new_booking_id() -> str:
+    # 122 random bits: unique across requests, workers and restarts without coordination
+    return f"bk_{uuid.uuid4().hex}"
+
+
+def request_hash(request: dict) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def booking_dates(start: date, nights: int = 1) -> List[str]:
+    return [(start + timedelta(days=n)).isoformat() for n in range(nights)]
+
+
+def _write_lock() -> asyncio.Lock:
+    loop = asyncio.get_running_loop()
+    if loop not in _write_locks:
+        _write_locks[loop] = asyncio.Lock()
+    return _write_locks[loop]
+
+
+def _is_locked(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+async def replay(db: AsyncSession, idempotency_key: str, fingerprint: str) -> Optional[Booking]:
+    """The booking stored for this key, or None; raises 422 if the key was used for another request"""
+    booking = (await db.execute(select(Booking).where(Booking.idempotency_key == idempotency_key))).scalar_one_or_none()
+    if booking is not None and booking.request_hash != fingerprint:
+        raise BookingError(422, "Idempotency-Key was already used for a different request")
+    return booking
+
+
+async def reserve(db: AsyncSession, item_type: str, item_id: int, dates: List[str], quantity: int = 1,
+                  message: str = "", idempotency_key: Optional[str] = None,
+                  fingerprint: Optional[str] = None) -> Tuple[Booking, bool]:
+    """
+    Take `quantity` units on every date and store the booking, in one transaction.
+
+    Returns the booking and whether it was replayed: when a concurrent request
+    with the same Idempotency-Key commits first, its booking is returned and
+    this one takes nothing. Raises BookingError 409 when a date is sold out.
+    """
+    capacity = BOOKING_CAPACITY[item_type]
+    if quantity > capacity:
+        raise BookingError(409, f"Sold out on {dates[0]}")
+    for attempt in range(BOOKING_LOCK_RETRIES + 1):
+        values = {"id": new_booking_id(), "item_type": item_type, "item_id": item_id, "date": dates[0],
+                  "nights": len(dates), "quantity": quantity, "message": message,
+                  "idempotency_key": idempotency_key, "request_hash": fingerprint,
+                  "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        try:
+            async with _write_lock():
+                # Writes only: the first statement takes the write lock for the whole transaction.
+                # Core rather than ORM execution, which doesn't report rowcount.
+                conn = await db.connection()
+                if (await conn.execute(_INSERT_BOOKING, values)).rowcount == 0:
+                    await db.rollback()
+                    return await replay(db, idempotency_key, fingerprint), True
+                for day in dates:
+                    result = await conn.execute(_TAKE_UNITS, {"item_type": item_type, "item_id": item_id, "date": day,
+                                                              "capacity": capacity, "quantity": quantity})
+                    if result.rowcount == 0:
+                        await db.rollback()
+                        raise BookingError(409, f"Sold out on {day}")
+                await db.commit()
+                return Booking(**values), False
+        except OperationalError as e:
+            await db.rollback()
+            if not _is_locked(e):
+                raise
+            if attempt == BOOKING_LOCK_RETRIES:
+                raise BookingError(503, "Too many bookings at once, try again", retry_after=1)
+            await asyncio.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+
+async def availability(db: AsyncSession, item_type: str, item_id: int, dates: List[str]) -> List[Dict]:
+    """Capacity and units booked on each date; dates never booked have the default capacity"""
+    rows = (await db.execute(select(Inventory).where(
+        Inventory.item_type == item_type, Inventory.item_id == item_id, Inventory.date.in_(dates)))).scalars()
+    stored = {row.date: (row.capacity, row.booked) for row in rows}
+    result = []
+    for day in dates:
+        capacity, booked = stored.get(day, (BOOKING_CAPACITY[item_type], 0))
+        result.append({"date": day, "capacity": capacity, "booked": booked, "available": capacity - booked})
+    return result
@@ -0,0 +1,284 @@
+"""
+Streaming bulk import of supplier catalog feeds (CSV or JSON Lines).
+
+Rows are read lazily, validated a chunk at a time against the feed record
+models and written with executemany in transactions of a bounded size, so
+memory stays flat whatever the size of the file. Rows with a supplier_id
+are upserted on it. Every written row is recorded in the catalog change log
+(changes.py); embeddings are not computed here, running servers encode the
+new and changed rows when they pick up the change (or --embed does).
+
+Usage (from backend/):
+    python -m catalog_import hotel hotels.csv
+    python -m catalog_import flight flights.jsonl --defer-indexes --embed
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory isn't reported
+    resource = None
+
+try:
+    from orjson import loads
+except ImportError:  # orjson is optional, as in serialization.py
+    from json import loads
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+
+import database
+from amenities import ensure_amenity_index
+from changes import CHANGE_TABLES, change_triggers, ensure_change_log, prune_changes
+from database import Base, Hotel, Flight, Attraction, apply_sqlite_pragmas, ensure_columns, ensure_indexes
+from fulltext import FULLTEXT_TABLES, ensure_fulltext_index, rebuild_fulltext_index
+from models import HotelRecord, FlightRecord, AttractionRecord
+
+# item type -> (catalog model, feed record model)
+IMPORT_MODELS = {
+    "hotel": (Hotel, HotelRecord),
+    "flight": (Flight, FlightRecord),
+    "attraction": (Attraction, AttractionRecord),
+}
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Rows validated and written per executemany, and rows written per transaction
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+IMPORT_TRANSACTION_ROWS = int(os.getenv("IMPORT_TRANSACTION_ROWS", "100000"))
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportStats:
+    item_type: str
+    read: int = 0
+    written: int = 0  # inserted or updated
+    rejected: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)  # the first MAX_REPORTED_ERRORS rejections
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.written / self.seconds if self.seconds else 0.0
+
+    def reject(self, position, error: ValidationError):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            problems = "; ".join(f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in error.errors())
+            self.errors.append(f"{position}: {problems}")
+
+
+def read_feed(path: str, format: Optional[str] = None) -> Iterator[Tuple[int, Optional[dict]]]:
+    """
+    Lazily yield (line number, raw record) for each row of a CSV or JSON Lines file.
+
+    Empty CSV cells are left out, so optional fields take their defaults;
+    JSON lines that don't parse come through as None and get rejected.
+    """
+    format = format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if format == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, {key: value for key, value in record.items()
+                                        if key is not None and value not in ("", None)}
+    elif format == "jsonl":
+        with open(path, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, loads(line)
+                except ValueError:
+                    yield line_number, None
+    else:
+        raise ValueError(f"Unknown feed format for {path}; expected .csv, .jsonl or .ndjson")
+
+
+def _chunks(records: Iterable, size: int) -> Iterator[list]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _validate(adapter: TypeAdapter, record_cls, chunk: list, stats: ImportStats) -> List[dict]:
+    """Rows of the chunk that validate, as column dicts; one call for the whole chunk unless a row fails"""
+    try:
+        records = adapter.validate_python([raw for _, raw in chunk])
+    except ValidationError:
+        records = []
+        for position, raw in chunk:
+            try:
+                records.append(record_cls.model_validate(raw))
+            except ValidationError as e:
+                stats.reject(position, e)
+    return adapter.dump_python(records)
+
+
+def _write_statement(item_type: str, upsert: bool):
+    model_cls, record_cls = IMPORT_MODELS[item_type]
+    table = model_cls.__table__
+    if not upsert:
+        return insert(table)
+    statement = sqlite_insert(table)
+    # NULL supplier ids never conflict, so rows without one are plain inserts
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.supplier_id],
+        set_={name: statement.excluded[name] for name in record_cls.model_fields if name != "supplier_id"})
+
+
+def _defer(engine: Engine, item_type: str):
+    """Drop the table's secondary indexes and sync triggers; _restore rebuilds them"""
+    table = IMPORT_MODELS[item_type][0].__table__
+    # The change log keeps its triggers, so every imported row still reaches derived caches
+    logged = set(change_triggers(CHANGE_TABLES[item_type]))
+    with engine.begin() as conn:
+        # Unique indexes stay: upserts need the supplier id one
+        for index in table.indexes:
+            if not index.unique:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+        triggers = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :table"),
+                                {"table": table.name}).scalars().all()
+        for trigger in triggers:
+            if trigger not in logged:
+                conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+
+
+def _restore(engine: Engine, item_type: str):
+    ensure_indexes(engine)
+    if item_type in FULLTEXT_TABLES and ensure_fulltext_index(engine):
+        rebuild_fulltext_index(engine, [item_type])
+    # Fills the join table again, since its triggers are gone
+    ensure_amenity_index(engine)
+
+
+def import_records(engine: Engine, item_type: str, records: Iterable[Tuple[object, Optional[dict]]],
+                   upsert: bool = True, defer_indexes: bool = False, chunk_rows: int = IMPORT_CHUNK_ROWS,
+                   transaction_rows: int = IMPORT_TRANSACTION_ROWS) -> ImportStats:
+    """
+    Validate and write catalog rows of one type.
+
+    records yields (position, raw dict) pairs, e.g. from read_feed or
+    enumerate(rows); positions label rejected rows. With defer_indexes the
+    table's secondary indexes and sync triggers are dropped for the import
+    and rebuilt once at the end, which pays off for loads that are large
+    next to the table. Transactions committed before a failure are kept;
+    re-running a feed with supplier ids upserts the same rows again.
+    """
+    _, record_cls = IMPORT_MODELS[item_type]
+    adapter = TypeAdapter(List[record_cls])
+    statement = _write_statement(item_type, upsert)
+    stats = ImportStats(item_type)
+    start = time.perf_counter()
+    if defer_indexes:
+        _defer(engine, item_type)
+    try:
+        with engine.connect() as conn:
+            pending = 0
+            for chunk in _chunks(records, chunk_rows):
+                stats.read += len(chunk)
+                rows = _validate(adapter, record_cls, chunk, stats)
+                if rows:
+                    conn.execute(statement, rows)
+                    stats.written += len(rows)
+                    pending += len(rows)
+                if pending >= transaction_rows:
+                    conn.commit()
+                    pending = 0
+            conn.commit()
+    finally:
+        if defer_indexes:
+            _restore(engine, item_type)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def import_file(engine: Engine, item_type: str, path: str, format: Optional[str] = None, **options) -> ImportStats:
+    """Stream a CSV or JSON Lines feed into the catalog; options as for import_records"""
+    return import_records(engine, item_type, read_feed(path, format), **options)
+
+
+def peak_rss_mib() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+
+
+def build_embeddings(engine: Engine, embeddings_path: str, model_name: str = "all-MiniLM-L6-v2"):
+    """Encode new and changed catalog rows into the embedding store in one pass"""
+    from sqlalchemy.orm import Session
+
+    from embedding_store import EmbeddingStore
+    from encoder import ModelLoader
+
+    model = ModelLoader(model_name)
+    model.start()
+    model.wait()
+    with Session(engine) as db:
+        EmbeddingStore(embeddings_path, model.encode).sync(db)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("item_type", choices=IMPORT_MODELS)
+    parser.add_argument("path", help="CSV or JSON Lines feed, one catalog row per line")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--db", help="SQLite file to import into (default: the app database)")
+    parser.add_argument("--insert-only", action="store_true", help="plain inserts, even for rows with a supplier_id")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="drop secondary indexes and sync triggers during the import and rebuild them after")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    parser.add_argument("--transaction-rows", type=int, default=IMPORT_TRANSACTION_ROWS)
+    parser.add_argument("--embed", action="store_true", help="encode new and changed rows into the embedding store")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        engine = create_engine(f"sqlite:///{args.db}")
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+        embeddings_path = os.path.splitext(args.db)[0] + "_embeddings"
+    else:
+        engine = database.engine
+        embeddings_path = os.path.splitext(database.DB_PATH)[0] + "_embeddings"
+    # The same schema, indexes and sync triggers the app sets up at startup
+    Base.metadata.create_all(engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    ensure_fulltext_index(engine)
+    ensure_amenity_index(engine)
+    ensure_change_log(engine)
+
+    stats = import_file(engine, args.item_type, args.path, args.format, upsert=not args.insert_only,
+                        defer_indexes=args.defer_indexes, chunk_rows=args.chunk_rows,
+                        transaction_rows=args.transaction_rows)
+    for error in stats.errors:
+        print(f"Rejected line {error}")
+    summary = {key: value for key, value in asdict(stats).items() if key != "errors"}
+    summary.update(seconds=round(stats.seconds, 2), rows_per_second=round(stats.rows_per_second),
+                   peak_rss_mib=peak_rss_mib())
+    print(json.dumps(summary), flush=True)
+    prune_changes(engine)
+    if args.embed:
+        build_embeddings(engine, embeddings_path)
+    engine.dispose()
+    # Rejected rows make the exit status 1; the valid rows are still written
+    sys.exit(1 if stats.rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Catalog change log: a row per insert, update and delete of a hotel, flight or attraction.
+
+SQLite triggers append to catalog_changes inside the transaction of every
+catalog write (ORM, bulk import or plain SQL), so a change is logged exactly
+when it commits. Writers are serialized, so sequence numbers commit in order
+and the latest one is a monotonic catalog version. Derived structures remember
+the version they were built at and catch up on the rows changed since, instead
+of rebuilding from the whole catalog.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from database import Hotel, Flight, Attraction
+
+# item type -> catalog table
+CHANGE_TABLES = {
+    "hotel": Hotel.__tablename__,
+    "flight": Flight.__tablename__,
+    "attraction": Attraction.__tablename__,
+}
+
+# Log rows kept by prune_changes; consumers further behind than this rebuild from scratch
+CATALOG_CHANGELOG_ROWS = int(os.getenv("CATALOG_CHANGELOG_ROWS", "1000000"))
+# Seconds between checks of the background change feed
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "1.0"))
+
+
+def change_triggers(table: str) -> List[str]:
+    return [f"{table}_changes_ai", f"{table}_changes_ad", f"{table}_changes_au"]
+
+
+def _ddl(item_type: str) -> List[str]:
+    table = CHANGE_TABLES[item_type]
+    insert, delete, update = change_triggers(table)
+    log = f"INSERT INTO catalog_changes(item_type, item_id, op) SELECT '{item_type}',"
+    return [
+        f"CREATE TRIGGER {insert} AFTER INSERT ON {table} BEGIN {log} new.id, 'insert'; END",
+        f"CREATE TRIGGER {delete} AFTER DELETE ON {table} BEGIN {log} old.id, 'delete'; END",
+        # A changed id reads as a delete of the old row and an update of the new one
+        f"CREATE TRIGGER {update} AFTER UPDATE ON {table} BEGIN "
+        f"{log} old.id, 'delete' WHERE old.id != new.id; {log} new.id, 'update'; END",
+    ]
+
+
+def ensure_change_log(engine: Engine):
+    """(Re)create the logging triggers; run before anything writes to the catalog"""
+    with engine.begin() as conn:
+        for item_type, table in CHANGE_TABLES.items():
+            # Replaced every time, so databases pick up changes to the trigger bodies
+            for trigger in change_triggers(table):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            for statement in _ddl(item_type):
+                conn.execute(text(statement))
+
+
+def catalog_version(conn: Connection) -> int:
+    """Sequence number of the latest committed catalog change (0 before any)"""
+    # sqlite_sequence only gets its row with the first change
+    return conn.execute(text(
+        "SELECT coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'catalog_changes'), 0)")).scalar()
+
+
+@dataclass
+class CatalogDelta:
+    """
+    Rows changed between two catalog versions, by item type.
+
+    upserted ids were inserted or updated and exist at `version`; deleted ids
+    don't. With full=True the log no longer reaches back to `since` and the
+    ids are unknown: consumers rebuild from the whole catalog.
+    """
+    since: int
+    version: int
+    upserted: Dict[str, Set[int]] = field(default_factory=dict)
+    deleted: Dict[str, Set[int]] = field(default_factory=dict)
+    full: bool = False
+
+    def __bool__(self) -> bool:
+        return self.version != self.since
+
+    def __len__(self) -> int:
+        return sum(map(len, self.upserted.values())) + sum(map(len, self.deleted.values()))
+
+    def changed(self, item_type: str) -> Set[int]:
+        return self.upserted.get(item_type, set()) | self.deleted.get(item_type, set())
+
+
+def changes_since(conn: Connection, since: int) -> CatalogDelta:
+    """The rows changed after version `since`, each with its latest operation"""
+    version = catalog_version(conn)
+    delta = CatalogDelta(since, version)
+    if version == since:
+        return delta
+    # Pruned past since, or a database that was replaced by an older one
+    oldest = conn.execute(text("SELECT min(seq) FROM catalog_changes")).scalar()
+    if version < since or oldest is None or oldest > since + 1:
+        delta.full = True
+        return delta
+    # SQLite takes the bare op column from the row holding max(seq)
+    rows = conn.execute(text(
+        "SELECT item_type, item_id, op, max(seq) FROM catalog_changes WHERE seq > :since AND seq <= :version "
+        "GROUP BY item_type, item_id"), {"since": since, "version": version})
+    for item_type, item_id, op, _ in rows:
+        target = delta.deleted if op == "delete" else delta.upserted
+        target.setdefault(item_type, set()).add(item_id)
+    return delta
+
+
+def prune_changes(engine: Engine, keep: int = CATALOG_CHANGELOG_ROWS) -> int:
+    """Drop all but the latest `keep` log rows, returning how many were deleted"""
+    with engine.begin() as conn:
+        horizon = catalog_version(conn) - keep
+        if horizon <= 0:
+            return 0
+        return conn.execute(text("DELETE FROM catalog_changes WHERE seq <= :horizon"), {"horizon": horizon}).rowcount
+
+
+class ChangeFeed:
+    """
+    Delivers catalog deltas to in-memory subscribers.
+
+    poll() reads what changed since the last poll and calls every subscriber
+    with one CatalogDelta; start() polls from a daemon thread, so writes made
+    by other processes (imports, other workers) reach this one too.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.version: Optional[int] = None
+        self._subscribers: List[Callable[[CatalogDelta], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[CatalogDelta], None]):
+        self._subscribers.append(callback)
+
+    def poll(self) -> Optional[CatalogDelta]:
+        """Deliver the changes since the last poll; the first poll only records the version"""
+        with self._lock:
+            with self.engine.connect() as conn:
+                if self.version is None:
+                    self.version = catalog_version(conn)
+                    return None
+                delta = changes_since(conn, self.version)
+            if not delta:
+                return None
+            for callback in self._subscribers:
+                try:
+                    callback(delta)
+                except Exception as e:
+                    print(f"Error applying catalog changes: {e}")
+            self.version = delta.version
+            return delta
+
+    def start(self, interval: float = CATALOG_POLL_SECONDS):
+        self.poll()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="catalog-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling catalog changes: {e}")
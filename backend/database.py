@@ -1,12 +1,20 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, Date, ForeignKey
+from sqlalchemy import create_engine, event, func, literal_column, CheckConstraint, Column, Integer, String, Float, Text, Date, ForeignKey, Index
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateIndex
 import sqlite3
 from datetime import datetime, timedelta
 import random
 
 Base = declarative_base()
 
+def page_order(column):
+    """Keyset sort expression of a catalog table; queries must use it verbatim to match the index"""
+    # A literal, not a bound parameter, or SQLite can't match the expression index
+    return func.coalesce(column, literal_column("0.0"))
+
 class Hotel(Base):
     __tablename__ = "hotels"
     
@@ -22,6 +30,16 @@ class Hotel(Base):
     address = Column(String)
     booking_link = Column(String)
     images = Column(Text)  # JSON string of image URLs
+    supplier_id = Column(String)  # key for feed upserts, see catalog_import.py
+    
+    # Pages walk the sort index (see recommendations.SORT_ORDER); rating filters usually come with a
+    # price range, which (rating, price) answers without reading the rows
+    __table_args__ = (
+        Index("ix_hotels_page_order", page_order(rating).desc(), id),
+        Index("ix_hotels_rating_price", rating, price_per_night),
+        Index("ix_hotels_price_per_night", price_per_night),
+        Index("ux_hotels_supplier_id", supplier_id, unique=True),
+    )
 
 class Flight(Base):
     __tablename__ = "flights"
@@ -29,8 +47,8 @@ class Flight(Base):
     id = Column(Integer, primary_key=True, index=True)
     airline = Column(String)
     flight_number = Column(String)
-    origin = Column(String, index=True)
-    destination = Column(String, index=True)
+    origin = Column(String)
+    destination = Column(String)
     departure_airport = Column(String)
     arrival_airport = Column(String)
     departure_date = Column(String)
@@ -41,6 +59,17 @@ class Flight(Base):
     stops = Column(Integer)
     flight_class = Column(String)
     booking_link = Column(String)
+    supplier_id = Column(String)
+    
+    # Route indexes carry the departure date for route + date lookups; price serves the price range
+    # filters, with stops alongside for nonstop-only searches
+    __table_args__ = (
+        Index("ix_flights_destination_date", destination, departure_date),
+        Index("ix_flights_origin_date", origin, departure_date),
+        Index("ix_flights_page_order", page_order(price), id),
+        Index("ix_flights_price_stops", price, stops),
+        Index("ux_flights_supplier_id", supplier_id, unique=True),
+    )
 
 class Attraction(Base):
     __tablename__ = "attractions"
@@ -49,7 +78,7 @@ class Attraction(Base):
     name = Column(String, index=True)
     city = Column(String, index=True)
     country = Column(String, index=True)
-    category = Column(String)  # nature, history, culture, etc.
+    category = Column(String, index=True)  # nature, history, culture, etc.
     description = Column(Text)
     price = Column(Float)
     rating = Column(Float)
@@ -58,16 +87,148 @@ class Attraction(Base):
     opening_hours = Column(String)
     ticket_link = Column(String)
     images = Column(Text)  # JSON string of image URLs
+    supplier_id = Column(String)
+    
+    __table_args__ = (
+        Index("ix_attractions_page_order", page_order(rating).desc(), id),
+        Index("ix_attractions_rating_price", rating, price),
+        Index("ix_attractions_price", price),
+        Index("ux_attractions_supplier_id", supplier_id, unique=True),
+    )
+
+class Amenity(Base):
+    """Interned amenity name (trimmed, lower-cased); see amenities.py"""
+    __tablename__ = "amenities"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+class HotelAmenity(Base):
+    """Hotel -> amenity join table, maintained by triggers on hotels"""
+    __tablename__ = "hotel_amenities"
+    
+    hotel_id = Column(Integer, primary_key=True)
+    amenity_id = Column(Integer, primary_key=True)
+    
+    # Filters look up hotels by amenity
+    __table_args__ = (Index("ix_hotel_amenities_amenity", "amenity_id", "hotel_id"),)
+
+class CatalogChange(Base):
+    """One insert, update or delete of a catalog row, written by triggers; see changes.py"""
+    __tablename__ = "catalog_changes"
+    
+    # AUTOINCREMENT: sequence numbers are never reused, so the latest one is the catalog version
+    seq = Column(Integer, primary_key=True)
+    item_type = Column(String, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # insert, update or delete
+    
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class Inventory(Base):
+    """Units of an item on one date: rooms per night, seats on a flight, tickets per day; see bookings.py"""
+    __tablename__ = "inventory"
+    
+    item_type = Column(String, primary_key=True)
+    item_id = Column(Integer, primary_key=True)
+    date = Column(String, primary_key=True)  # YYYY-MM-DD
+    capacity = Column(Integer, nullable=False)
+    booked = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (CheckConstraint("booked >= 0 AND booked <= capacity", name="ck_inventory_booked"),)
+
+class Booking(Base):
+    __tablename__ = "bookings"
+    
+    id = Column(String, primary_key=True)
+    item_type = Column(String, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    date = Column(String, nullable=False)  # first date (check-in for hotels)
+    nights = Column(Integer, nullable=False, default=1)
+    quantity = Column(Integer, nullable=False, default=1)
+    message = Column(String)
+    idempotency_key = Column(String)
+    request_hash = Column(String)  # of the request body, to reject a key reused for another request
+    created_at = Column(String, nullable=False)
+    
+    __table_args__ = (Index("ux_bookings_idempotency_key", idempotency_key, unique=True),)
 
 # Database setup
 import os
-DB_PATH = os.path.join(os.path.dirname(__file__), "travel_agent.db")
+# TRAVEL_AGENT_DB points the app at another SQLite file, e.g. a benchmark catalog
+DB_PATH = os.getenv("TRAVEL_AGENT_DB", os.path.join(os.path.dirname(__file__), "travel_agent.db"))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+
+# SQLite tuning: WAL lets readers run alongside a writer, and NORMAL sync is safe under WAL
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", str(-64 * 1024))),  # negative = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 2**20))),
+    "temp_store": "MEMORY",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+# Prepared statements kept per connection by the sqlite3 driver
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+# pool_size + max_overflow should cover Starlette's 40 threadpool workers: sync endpoints release
+# their session in a dependency teardown that also needs a threadpool slot, so a smaller pool
+# can deadlock under load until pool_timeout expires
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "32"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _connect_args() -> dict:
+    return {"check_same_thread": False, "cached_statements": SQLITE_STATEMENT_CACHE}
+
+def _pool_args() -> dict:
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure every new pooled connection"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+engine = create_engine(DATABASE_URL, connect_args=_connect_args(), **_pool_args())
+event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the request path; it shares the pragmas through its sync engine.
+# aiosqlite defaults to NullPool (a new connection per checkout), so pool explicitly.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=_connect_args(),
+                                   poolclass=AsyncAdaptedQueuePool, **_pool_args())
+event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def ensure_columns(bind):
+    """Add model columns missing from existing tables; only nullable columns without defaults qualify"""
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def ensure_indexes(bind):
+    """Create model indexes missing from existing tables, which create_all leaves alone"""
+    # IF NOT EXISTS rather than checkfirst: SQLAlchemy can't reflect expression indexes
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
 def init_db():
+    # Imported here: changes.py builds its triggers from the models above
+    from changes import ensure_change_log, prune_changes
     Base.metadata.create_all(bind=engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    # Before seeding, so a reseed is logged like any other catalog write
+    ensure_change_log(engine)
+    prune_changes(engine)
     populate_sample_data()
 
 def populate_sample_data():
@@ -243,9 +404,6 @@ def populate_sample_data():
              "images": json.dumps(["https://images.unsplash.com/photo-1520250497591-112f2f40a3f4?w=800"])},
         ]
         
-        for hotel in hotels_data:
-            db.add(Hotel(**hotel))
-        
         # 20 Flights
         flights_data = [
             {"airline": "Japan Airlines", "flight_number": "JL004", "origin": "New York", "destination": "Tokyo",
@@ -350,9 +508,6 @@ def populate_sample_data():
              "booking_link": "https://aerlingus.com/book/EI101"},
         ]
         
-        for flight in flights_data:
-            db.add(Flight(**flight))
-        
         # 20 Tourist Attractions
         attractions_data = [
             {"name": "Shibuya Crossing", "city": "Tokyo", "country": "Japan", "category": "culture",
@@ -483,10 +638,12 @@ def populate_sample_data():
              "images": json.dumps(["https://images.unsplash.com/photo-1520250497591-112f2f40a3f4?w=800"])},
         ]
         
-        for attraction in attractions_data:
-            db.add(Attraction(**attraction))
-        
-        db.commit()
+        # Seeded through the same validated bulk path as supplier feeds
+        from catalog_import import import_records
+        for item_type, rows in (("hotel", hotels_data), ("flight", flights_data), ("attraction", attractions_data)):
+            stats = import_records(engine, item_type, enumerate(rows, 1))
+            for error in stats.errors:
+                print(f"Rejected sample {item_type} {error}")
     except Exception as e:
         print(f"Error populating data: {e}")
         db.rollback()
@@ -0,0 +1,461 @@
+"""Persistent store of precomputed catalog embeddings"""
+import hashlib
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker only, no cross-process locking
+    fcntl = None
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from changes import catalog_version, changes_since
+from database import DB_PATH, Hotel, Flight, Attraction
+
+CATALOG_MODELS = {
+    "hotel": Hotel,
+    "flight": Flight,
+    "attraction": Attraction,
+}
+# Ids loaded per query when catching up with changed rows
+SYNC_BATCH_ROWS = 5000
+
+# Spare rows written after the matrix, as a fraction of its rows, for syncs to append vectors to
+EMBEDDING_SPARE_FRACTION = float(os.getenv("EMBEDDING_SPARE_FRACTION", "0.25"))
+MIN_SPARE_ROWS = 1024
+# Write the matrix again once rows left behind by updates and deletes exceed this fraction of the live ones
+EMBEDDING_COMPACT_FRACTION = float(os.getenv("EMBEDDING_COMPACT_FRACTION", "0.25"))
+# Store versions whose changed keys are remembered for changed_rows()
+CHANGE_HISTORY = 256
+
+# Stored next to travel_agent.db as travel_agent_embeddings.npy / .json / .journal
+EMBEDDINGS_PATH = os.path.splitext(DB_PATH)[0] + "_embeddings"
+
+
+def item_text(item, item_type: str) -> str:
+    """Build the text that gets embedded for a catalog item"""
+    if item_type == "hotel":
+        return f"{item.name} {item.description} {item.amenities} {item.city} {item.country}"
+    elif item_type == "attraction":
+        return f"{item.name} {item.description} {item.category} {item.city} {item.country}"
+    else:  # flight
+        return f"{item.airline} {item.origin} {item.destination} {item.flight_class}"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so scoring is a plain dot product"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """
+    Normalized catalog embeddings keyed by (item type, id, text hash).
+
+    Vectors live in a single float32 matrix persisted as a .npy file and
+    memory-mapped read-only, so restarts don't re-embed the catalog and
+    every uvicorn worker shares the same page-cache copy of the matrix. A
+    JSON sidecar maps each (item type, id) to its matrix row and text hash,
+    and records the catalog version (see changes.py) the store is synced to.
+
+    A sync writes only what changed: new vectors go into spare rows at the
+    end of the matrix file, and their sidecar entries and any removals are
+    appended to a journal of JSON lines, replayed on top of the sidecar.
+    Rows already written never change, so workers reading the mapping never
+    see a half-written vector. The matrix and sidecar are written again in
+    full, and the journal started over, once the spare rows run out or the
+    rows left behind by updates and deletes exceed EMBEDDING_COMPACT_FRACTION
+    of the live ones. Writers take an exclusive file lock; other workers
+    replay the new journal lines, or load the new files, the next time they
+    check the version.
+    """
+
+    def __init__(self, path: str, encode: Callable[[List[str]], np.ndarray]):
+        self.matrix_path = path + ".npy"
+        self.index_path = path + ".json"
+        self.journal_path = path + ".journal"
+        self.lock_path = path + ".lock"
+        self.encode = encode
+        self._lock = threading.RLock()
+        self._rows: Dict[Tuple[str, int], Tuple[int, str]] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        # Matrix rows written so far, live or left behind; new vectors go after them
+        self._used = 0
+        # Written to the sidecar and every journal line, so lines left from older files are skipped
+        self._generation = None
+        # (journal inode, bytes replayed) of what was loaded
+        self._loaded = None
+        # Catalog version the rows reflect; None until a build, which sync() then catches up from
+        self.synced_version = None
+        # Bumped on every change so derived indexes know when to update
+        self._version = 0
+        # (version, keys whose vectors changed or were removed, None if unknown), for changed_rows()
+        self._changes = deque(maxlen=CHANGE_HISTORY)
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def version(self) -> int:
+        self._reload_if_changed()
+        return self._version
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """Serialize writers (and readers against writers) across worker processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _journal_state(self) -> Optional[Tuple[int, int]]:
+        """(inode, size) of the journal: full writes replace it, syncs append to it"""
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def _reload_if_changed(self):
+        """Catch up with what another process wrote"""
+        if self._journal_state() == self._loaded:
+            return
+        with self._lock, self._file_lock(exclusive=False):
+            self._catch_up()
+
+    def _catch_up(self):
+        """Replay new journal lines, or load the files again if they were replaced"""
+        state = self._journal_state()
+        if state == self._loaded:
+            return
+        if state is not None and self._loaded is not None and state[0] == self._loaded[0] \
+                and state[1] > self._loaded[1]:
+            self._replay()
+        else:
+            self._load()
+
+    def _changed(self, keys: Optional[Set[Tuple[str, int]]]):
+        self._version += 1
+        self._changes.append((self._version, keys))
+
+    def _load(self):
+        self._rows = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._used = 0
+        self._generation = self._loaded = self.synced_version = None
+        if os.path.exists(self.matrix_path) and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    index = json.load(f)
+                self._matrix = np.load(self.matrix_path, mmap_mode="r")
+                self._rows = {(t, int(i)): (row, h) for t, i, row, h in index["rows"]}
+                # Files written before the journal have no spare rows and no generation
+                self._used = index.get("used", len(self._matrix))
+                self._generation = index.get("generation")
+                self.synced_version = index.get("catalog_version")
+                if os.path.exists(self.journal_path):
+                    self._loaded = (os.stat(self.journal_path).st_ino, 0)
+                    self._replay()
+            except Exception as e:
+                print(f"Error loading embedding store, it will be rebuilt: {e}")
+                self._rows = {}
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+                self._used = 0
+                self._generation = self._loaded = self.synced_version = None
+        self._changed(None)
+
+    def _replay(self):
+        """Apply the journal lines written since the last load or replay"""
+        inode, offset = self._loaded
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written has no newline yet
+        end = data.rfind(b"\n") + 1
+        changed = set()
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            if entry["generation"] != self._generation:
+                continue
+            for t, i in entry["removed"]:
+                self._rows.pop((t, i), None)
+                changed.add((t, i))
+            for t, i, row, h in entry["rows"]:
+                self._rows[(t, i)] = (row, h)
+                changed.add((t, i))
+            self._used = entry["used"]
+            self.synced_version = entry["catalog_version"]
+        self._loaded = (inode, offset + end)
+        if changed:
+            self._changed(changed)
+
+    def _journal_line(self, rows: List, removed: List) -> str:
+        # dumps, not dump: only one-shot encoding uses the C encoder
+        return json.dumps({"generation": self._generation, "rows": rows, "removed": removed,
+                           "used": self._used, "catalog_version": self.synced_version}) + "\n"
+
+    def _save(self):
+        """Write the matrix with spare rows after it, the sidecar, and an empty journal"""
+        used, dim = len(self._matrix), self._matrix.shape[1]
+        spare = max(MIN_SPARE_ROWS, int(used * EMBEDDING_SPARE_FRACTION))
+        self._generation = secrets.token_hex(8)
+        self._used = used
+        tmp_matrix = self.matrix_path + ".tmp.npy"
+        tmp_index = self.index_path + ".tmp"
+        tmp_journal = self.journal_path + ".tmp"
+        # Spare rows are left unwritten, so they take no disk space until a sync fills them
+        matrix = np.lib.format.open_memmap(tmp_matrix, mode="w+", dtype=np.float32, shape=(used + spare, dim))
+        matrix[:used] = self._matrix
+        matrix.flush()
+        del matrix
+        with open(tmp_index, "w") as f:
+            f.write(json.dumps({"rows": [[t, i, row, h] for (t, i), (row, h) in self._rows.items()],
+                                "used": used, "generation": self._generation,
+                                "catalog_version": self.synced_version}))
+        with open(tmp_journal, "w") as f:
+            f.write(self._journal_line([], []))
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+        os.replace(tmp_journal, self.journal_path)
+        # Drop the private copy and share the file mapping with other workers
+        self._matrix = np.load(self.matrix_path, mmap_mode="r")
+        self._loaded = self._journal_state()
+        self._changed(None)
+
+    def _fits(self, keys: List[Tuple[str, int]], vectors: Optional[np.ndarray], removed: set) -> bool:
+        """Whether vectors for keys can go into spare rows, rather than the matrix being written again"""
+        if self._generation is None or (vectors is not None and vectors.shape[1] != self._matrix.shape[1]):
+            return False
+        live = len(self._rows) - len(removed) + sum(key not in self._rows for key in keys)
+        used = self._used + len(keys)
+        return used <= len(self._matrix) and used - live <= EMBEDDING_COMPACT_FRACTION * live
+
+    def _append(self, updates: Dict[Tuple[str, int], Tuple[str, str]], vectors: Optional[np.ndarray],
+                removed: set):
+        """Write the vectors of updated rows into spare rows and journal them and the removals"""
+        keys = list(updates)
+        start = self._used
+        if keys:
+            matrix = np.load(self.matrix_path, mmap_mode="r+")
+            matrix[start:start + len(keys)] = vectors
+            matrix.flush()
+            del matrix
+        rows = []
+        for row, key in enumerate(keys, start):
+            self._rows[key] = (row, updates[key][0])
+            rows.append([key[0], key[1], row, updates[key][0]])
+        for key in removed:
+            del self._rows[key]
+        self._used = start + len(keys)
+        with open(self.journal_path, "a") as f:
+            f.write(self._journal_line(rows, [list(key) for key in removed]))
+        self._loaded = self._journal_state()
+        if keys or removed:
+            self._changed(set(keys) | removed)
+
+    def _write(self, updates: Dict[Tuple[str, int], Tuple[str, str]], removed: set, version):
+        """Encode the updated rows and store them and the removals as of catalog version"""
+        keys = list(updates)
+        vectors = normalize_rows(self.encode([updates[key][1] for key in keys])) if keys else None
+        self.synced_version = version
+        if self._fits(keys, vectors, removed):
+            self._append(updates, vectors, removed)
+        else:
+            self._relayout(updates, vectors, removed)
+            self._save()
+
+    def build(self, db: Session):
+        """Sync the store with the whole catalog, encoding only new or changed rows"""
+        with self._lock, self._file_lock():
+            # Another worker may have just built it; start from what's on disk
+            self._catch_up()
+            self._build(db)
+
+    def _build(self, db: Session):
+        # Read before the rows: changes committed in between are applied again by the next sync
+        version = catalog_version(db.connection())
+        keys = []
+        texts = []
+        for item_type, model_cls in CATALOG_MODELS.items():
+            # Rows of one type stay contiguous and in id order so snapshots are plain slices
+            for item in db.query(model_cls).order_by(model_cls.id).all():
+                keys.append((item_type, item.id))
+                texts.append(item_text(item, item_type))
+        hashes = [text_hash(text) for text in texts]
+
+        reuse = {}
+        to_encode = []
+        for pos, (key, h) in enumerate(zip(keys, hashes)):
+            cached = self._rows.get(key)
+            if cached is not None and cached[1] == h:
+                reuse[pos] = cached[0]
+            else:
+                to_encode.append(pos)
+
+        if not to_encode and len(reuse) == len(self._rows):
+            if version != self.synced_version or self._generation is None:
+                self._write({}, set(), version)
+            return  # Nothing changed since the last build
+
+        encoded = None
+        if to_encode:
+            encoded = normalize_rows(self.encode([texts[pos] for pos in to_encode]))
+        dim = encoded.shape[1] if encoded is not None else self._matrix.shape[1]
+
+        matrix = np.empty((len(keys), dim), dtype=np.float32)
+        if reuse:
+            positions = list(reuse.keys())
+            matrix[positions] = self._matrix[list(reuse.values())]
+        if encoded is not None:
+            matrix[to_encode] = encoded
+
+        self._matrix = matrix
+        self._rows = {key: (row, h) for row, (key, h) in enumerate(zip(keys, hashes))}
+        self.synced_version = version
+        self._save()
+
+    def sync(self, db: Session):
+        """
+        Catch up with the catalog change log, loading and encoding only the rows
+        changed since the last build or sync. Falls back to build() when the
+        store has no version yet or the log was pruned past it.
+        """
+        with self._lock, self._file_lock():
+            self._catch_up()
+            delta = None if self.synced_version is None else changes_since(db.connection(), self.synced_version)
+            if delta is None or delta.full:
+                self._build(db)
+                return
+            if not delta:
+                return
+
+            updates = {}  # key -> (text hash, text) of rows whose text changed
+            removed = set()
+            for item_type, model_cls in CATALOG_MODELS.items():
+                removed.update((item_type, item_id) for item_id in delta.deleted.get(item_type, ()))
+                ids = sorted(delta.upserted.get(item_type, ()))
+                found = set()
+                for start in range(0, len(ids), SYNC_BATCH_ROWS):
+                    batch = ids[start:start + SYNC_BATCH_ROWS]
+                    for item in db.query(model_cls).filter(model_cls.id.in_(batch)):
+                        found.add(item.id)
+                        key = (item_type, item.id)
+                        text = item_text(item, item_type)
+                        h = text_hash(text)
+                        # Price or link updates leave the text, and so the vector, as it is
+                        cached = self._rows.get(key)
+                        if cached is None or cached[1] != h:
+                            updates[key] = (h, text)
+                # Deleted again since the version was read
+                removed.update((item_type, item_id) for item_id in ids if item_id not in found)
+
+            removed &= self._rows.keys()
+            self._write(updates, removed, delta.version)
+
+    def _relayout(self, updates: Dict[Tuple[str, int], Tuple[str, str]], vectors: Optional[np.ndarray],
+                  removed: set):
+        """Lay the live rows out again in a private matrix, each type contiguous and in id order"""
+        layout = sorted((self._rows.keys() - removed) | updates.keys())
+        dim = vectors.shape[1] if vectors is not None else self._matrix.shape[1]
+        matrix = np.empty((len(layout), dim), dtype=np.float32)
+        encoded = {key: pos for pos, key in enumerate(updates)}
+        rows = {}
+        kept_new, kept_old = [], []
+        for row, key in enumerate(layout):
+            if key in encoded:
+                matrix[row] = vectors[encoded[key]]
+                rows[key] = (row, updates[key][0])
+            else:
+                old_row, h = self._rows[key]
+                kept_new.append(row)
+                kept_old.append(old_row)
+                rows[key] = (row, h)
+        if kept_new:
+            matrix[kept_new] = self._matrix[kept_old]
+        self._matrix = matrix
+        self._rows = rows
+
+    def upsert(self, item_type: str, items: List):
+        """Encode items and write their vectors, replacing any existing rows"""
+        if not items:
+            return
+        with self._lock, self._file_lock():
+            self._catch_up()
+            updates = {}
+            for item in items:
+                text = item_text(item, item_type)
+                updates[(item_type, item.id)] = (text_hash(text), text)
+            self._write(updates, set(), self.synced_version)
+
+    def layout(self, item_type: str) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """(version, ids, their rows, matrix) for every stored item of one type; the matrix isn't copied"""
+        self._reload_if_changed()
+        with self._lock:
+            entries = sorted((item_id, row) for (t, item_id), (row, _) in self._rows.items() if t == item_type)
+            ids = np.array([item_id for item_id, _ in entries], dtype=np.int64)
+            rows = np.array([row for _, row in entries], dtype=np.int64)
+            return self._version, ids, rows, self._matrix
+
+    def changed_rows(self, item_type: str, since: int) -> Optional[Tuple[int, np.ndarray, np.ndarray, Set[int]]]:
+        """
+        What changed in one type's vectors after store version since: (version,
+        ids with new vectors, their matrix rows, removed ids). None when that
+        isn't known, because the matrix was loaded or written in full since or
+        the version is older than the last CHANGE_HISTORY changes.
+        """
+        self._reload_if_changed()
+        with self._lock:
+            keys = set()
+            expected = since + 1
+            for version, changed in self._changes:
+                if version < expected:
+                    continue
+                if version != expected or changed is None:
+                    return None
+                keys.update(key for key in changed if key[0] == item_type)
+                expected += 1
+            if expected != self._version + 1:
+                return None
+            ids = sorted(item_id for _, item_id in keys & self._rows.keys())
+            rows = np.array([self._rows[(item_type, item_id)][0] for item_id in ids], dtype=np.int64)
+            removed = {item_id for _, item_id in keys - self._rows.keys()}
+            return self._version, np.array(ids, dtype=np.int64), rows, removed
+
+    def snapshot(self, item_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, vectors) for every stored item of one type"""
+        _, ids, rows, matrix = self.layout(item_type)
+        if not len(rows):
+            return ids, np.zeros((0, matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32)
+        if rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            # Zero-copy view into the shared mapping
+            return ids, matrix[rows[0]:rows[-1] + 1]
+        return ids, np.ascontiguousarray(matrix[rows])
+
+    def vectors(self, item_type: str, items: List) -> np.ndarray:
+        """Return the normalized vectors for items as one contiguous matrix"""
+        with self._lock:
+            missing = [item for item in items if (item_type, item.id) not in self._rows]
+            if missing:
+                self.upsert(item_type, missing)
+            rows = [self._rows[(item_type, item.id)][0] for item in items]
+            return np.ascontiguousarray(self._matrix[rows])
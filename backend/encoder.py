@@ -0,0 +1,247 @@
+"""Background loading and micro-batching front end for the sentence transformer"""
+import asyncio
+import importlib
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client
+from typing import Callable, List, Optional
+
+import numpy as np
+
+MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", "64"))
+MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", "5"))
+
+# Unix socket path (or host:port) of a shared encoder process; see encoder_server.py
+ENCODER_ADDRESS = os.getenv("ENCODER_ADDRESS")
+# Shared secret of the encoder connections, which unpickle what they receive: ENCODER_AUTHKEY,
+# or else the contents of ENCODER_AUTHKEY_FILE, generated by encoder_server.py when missing
+ENCODER_AUTHKEY = os.getenv("ENCODER_AUTHKEY")
+ENCODER_AUTHKEY_FILE = os.getenv("ENCODER_AUTHKEY_FILE", os.path.join(os.path.dirname(__file__), ".encoder_authkey"))
+# "module:callable" building the model from its name instead of SentenceTransformer,
+# e.g. benchmarks.fake_encoder:FakeEncoder for offline, reproducible runs
+ENCODER_MODEL_FACTORY = os.getenv("ENCODER_MODEL_FACTORY")
+
+
+def load_factory(path: str) -> Callable[[str], object]:
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def encoder_authkey(create: bool = False) -> bytes:
+    """
+    The encoder authkey. Without ENCODER_AUTHKEY it is read from ENCODER_AUTHKEY_FILE, which
+    `create` writes with a random key, readable by its owner only, if it doesn't exist yet.
+    Raises FileNotFoundError when there is neither.
+    """
+    if ENCODER_AUTHKEY:
+        return ENCODER_AUTHKEY.encode()
+    if create:
+        try:
+            fd = os.open(ENCODER_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    with open(ENCODER_AUTHKEY_FILE) as f:
+        key = f.read().strip()
+    if not key:
+        raise ValueError(f"{ENCODER_AUTHKEY_FILE} is empty")
+    return key.encode()
+
+
+def parse_address(address: str):
+    """'host:port' becomes a TCP address, anything else a Unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class RemoteModel:
+    """Stand-in for SentenceTransformer that encodes in the shared encoder process"""
+
+    def __init__(self, address: str, connect_timeout: float = 120.0):
+        self.address = parse_address(address)
+        self._lock = threading.Lock()
+        self._conn = self._connect(connect_timeout)
+
+    def _connect(self, timeout: float):
+        # The encoder process may still be loading the model
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                # Until the encoder process starts, neither the key file nor the socket may exist
+                return Client(self.address, authkey=encoder_authkey())
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            self._conn.send(list(texts))
+            result = self._conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class ModelLoader:
+    """
+    Loads the sentence transformer in a background thread.
+
+    sentence_transformers (and torch) are only imported inside the loader
+    thread, so importing the app and binding the port stay fast. The ready
+    Future resolves once the model is loaded and the optional warmup (e.g.
+    syncing the catalog embeddings) has finished.
+    """
+
+    def __init__(self, model_name: str, address: Optional[str] = ENCODER_ADDRESS,
+                 factory: Optional[str] = ENCODER_MODEL_FACTORY):
+        self.model_name = model_name
+        self.address = address
+        self.factory = factory
+        self.ready: Future = Future()
+        self.state = "not_started"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._model = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, warmup: Optional[Callable[[], None]] = None):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, args=(warmup,), name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self, warmup: Optional[Callable[[], None]]):
+        start = time.perf_counter()
+        try:
+            if self.address:
+                # Workers share one model in the encoder process instead of loading their own
+                self._model = RemoteModel(self.address)
+            elif self.factory:
+                self._model = load_factory(self.factory)(self.model_name)
+            else:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        except Exception as e:
+            print(f"Error loading model {self.model_name}: {e}")
+            self.state = "failed"
+            self.error = str(e)
+            self.ready.set_exception(e)
+            return
+        if warmup is not None:
+            try:
+                warmup()
+            except Exception as e:
+                # The model itself is usable; derived data gets rebuilt on demand
+                print(f"Error warming up model {self.model_name}: {e}")
+        self.load_seconds = time.perf_counter() - start
+        self.state = "ready"
+        self.ready.set_result(self._model)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds for the model; False if it isn't ready by then"""
+        try:
+            self.ready.result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        # The warmup runs before ready resolves, so use the model as soon as it exists
+        if self._model is None:
+            self.start()
+            self.ready.result()
+        return self._model.encode(texts)
+
+    def status(self) -> dict:
+        return {
+            "model": self.model_name,
+            "encoder_address": self.address,
+            "factory": self.factory,
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+class BatchingEncoder:
+    """
+    Collects texts from concurrent requests and encodes them in one forward pass.
+
+    Callers submit a text and get a Future back. A single worker thread waits
+    up to max_wait_ms after the first pending text (or until max_batch_size
+    texts are queued), runs one batched encode, and resolves every Future
+    with its own row of the result.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batching-encoder", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for the next batch; the Future resolves to its embedding"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking helper for sync endpoints"""
+        return self.submit(text).result()
+
+    async def encode_async(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self._encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
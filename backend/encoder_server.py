@@ -0,0 +1,93 @@
+"""
+Shared encoder process for multi-worker deployments.
+
+Loads the sentence transformer once and serves encode requests from every
+uvicorn worker over a local socket, batching texts across workers.
+
+Connections unpickle what they receive, so they are authenticated with the
+key from ENCODER_AUTHKEY or ENCODER_AUTHKEY_FILE (generated here, mode 0600,
+if neither exists), the Unix socket is only accessible to its owner, and a
+TCP address must be a loopback one unless --allow-remote is given.
+
+Usage:
+    python encoder_server.py --address /tmp/travel_agent_encoder.sock
+    ENCODER_ADDRESS=/tmp/travel_agent_encoder.sock uvicorn main:app --workers 4
+"""
+import argparse
+import ipaddress
+import os
+import socket
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from encoder import BatchingEncoder, encoder_authkey, parse_address
+
+
+def serve_connection(conn, encoder: BatchingEncoder):
+    with conn:
+        while True:
+            try:
+                texts = conn.recv()
+            except EOFError:
+                return
+            try:
+                futures = [encoder.submit(text) for text in texts]
+                result = np.stack([future.result() for future in futures]) if futures else np.zeros((0, 0))
+            except Exception as e:
+                result = e
+            conn.send(result)
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback
+                   for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP))
+    except (OSError, ValueError):
+        return False
+
+
+def listen(address, authkey: bytes) -> Listener:
+    if not isinstance(address, str):
+        return Listener(address, authkey=authkey)
+    if os.path.exists(address):
+        os.remove(address)
+    # Create the socket owner-only from the start, not chmod it after others could connect
+    umask = os.umask(0o177)
+    try:
+        return Listener(address, authkey=authkey)
+    finally:
+        os.umask(umask)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=os.getenv("ENCODER_ADDRESS", "/tmp/travel_agent_encoder.sock"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--allow-remote", action="store_true", help="accept a TCP address that isn't loopback")
+    args = parser.parse_args()
+
+    address = parse_address(args.address)
+    if not isinstance(address, str) and not args.allow_remote and not is_loopback(address[0]):
+        parser.error(f"{address[0]} is not a loopback address; pass --allow-remote to listen on it")
+    authkey = encoder_authkey(create=True)
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model)
+    encoder = BatchingEncoder(model.encode)
+
+    with listen(address, authkey) as listener:
+        print(f"Encoder serving {args.model} on {args.address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError as e:
+                print(f"Rejected encoder client: {e}")
+                continue
+            threading.Thread(target=serve_connection, args=(conn, encoder), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Async client for the Flowglad API, shared by every request of a worker.
+
+One httpx.AsyncClient keeps a pool of keep-alive connections to Flowglad, so
+checkout calls don't pay a TCP and TLS handshake each and never block the
+event loop. Every call has connect and read timeouts and an overall deadline.
+Failures that are safe to repeat are retried with jittered backoff, and a
+circuit breaker fails fast while Flowglad keeps failing.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+FLOWGLAD_BASE_URL = os.getenv("FLOWGLAD_BASE_URL", "https://app.flowglad.com")
+FLOWGLAD_API_KEY = os.getenv("FLOWGLAD_API_KEY", "sk_test_8wB6uVgbjqRPNqdi8f9eoB")
+FLOWGLAD_CONNECT_TIMEOUT = float(os.getenv("FLOWGLAD_CONNECT_TIMEOUT", "3"))
+FLOWGLAD_READ_TIMEOUT = float(os.getenv("FLOWGLAD_READ_TIMEOUT", "10"))
+# No retry starts once this many seconds have passed since the first attempt
+FLOWGLAD_DEADLINE_SECONDS = float(os.getenv("FLOWGLAD_DEADLINE_SECONDS", "15"))
+FLOWGLAD_MAX_RETRIES = int(os.getenv("FLOWGLAD_MAX_RETRIES", "2"))
+FLOWGLAD_BACKOFF_SECONDS = float(os.getenv("FLOWGLAD_BACKOFF_SECONDS", "0.2"))
+FLOWGLAD_BACKOFF_MAX_SECONDS = float(os.getenv("FLOWGLAD_BACKOFF_MAX_SECONDS", "2"))
+FLOWGLAD_MAX_CONNECTIONS = int(os.getenv("FLOWGLAD_MAX_CONNECTIONS", "20"))
+# Consecutive failures that open the breaker, and how long it stays open before a trial call
+FLOWGLAD_BREAKER_FAILURES = int(os.getenv("FLOWGLAD_BREAKER_FAILURES", "5"))
+FLOWGLAD_BREAKER_RESET_SECONDS = float(os.getenv("FLOWGLAD_BREAKER_RESET_SECONDS", "30"))
+
+# Responses that say the request was not processed, so even a POST can be sent again
+RETRY_STATUSES = {429, 503}
+# Responses where the request may have been processed: only idempotent methods retry them
+IDEMPOTENT_RETRY_STATUSES = {500, 502, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Failures before anything was sent
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class FlowgladError(Exception):
+    """A Flowglad call that failed; status_code is what the API endpoint should answer with"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: calls go through. After `failures` consecutive failures it opens
+    and calls fail fast for `reset_seconds`. Then one trial call is let
+    through (half-open); its success closes the breaker and its failure opens
+    it again. A trial that never reports back (e.g. a cancelled request) is
+    replaced by another after `reset_seconds`.
+    """
+
+    def __init__(self, failures: int = FLOWGLAD_BREAKER_FAILURES, reset_seconds: float = FLOWGLAD_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one caller gets True"""
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            if self._trial_at is not None and now - self._trial_at < self.reset_seconds:
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial_at = None
+
+
+def backoff(attempt: int, base: float = FLOWGLAD_BACKOFF_SECONDS, cap: float = FLOWGLAD_BACKOFF_MAX_SECONDS) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class FlowgladClient:
+    """Pooled async Flowglad API client with timeouts, retries and a circuit breaker"""
+
+    def __init__(self, base_url: str = FLOWGLAD_BASE_URL, api_key: str = FLOWGLAD_API_KEY,
+                 connect_timeout: float = FLOWGLAD_CONNECT_TIMEOUT, read_timeout: float = FLOWGLAD_READ_TIMEOUT,
+                 deadline: float = FLOWGLAD_DEADLINE_SECONDS, max_retries: int = FLOWGLAD_MAX_RETRIES,
+                 max_connections: int = FLOWGLAD_MAX_CONNECTIONS, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        # The pool timeout bounds the wait for a free connection when all are busy
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use, inside the event loop that serves requests
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits,
+                                             headers={"Authorization": self.api_key})
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, path: str, **kwargs) -> dict:
+        """Send a request and return the JSON body, raising FlowgladError on failure"""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                retry_after = self.breaker.retry_after()
+                raise FlowgladError(503, "Flowglad is unavailable, try again later", retry_after)
+            delay = None
+            try:
+                response = await self._http().request(method, path, **kwargs)
+            except httpx.TimeoutException as e:
+                self.breaker.record_failure()
+                error = FlowgladError(504, f"Flowglad timed out: {type(e).__name__}")
+                retryable = idempotent or isinstance(e, NOT_SENT_ERRORS)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                error = FlowgladError(502, f"Flowglad unreachable: {type(e).__name__}")
+                retryable = idempotent or isinstance(e, NOT_SENT_ERRORS)
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    # 4xx is about the request, not Flowglad's health
+                    self.breaker.record_success()
+                    if response.is_success:
+                        return response.json()
+                    raise FlowgladError(response.status_code, f"Flowglad API error: {response.text}")
+                self.breaker.record_failure()
+                error = FlowgladError(response.status_code, f"Flowglad API error: {response.text}",
+                                      _retry_after(response))
+                retryable = response.status_code in RETRY_STATUSES or (
+                    idempotent and response.status_code in IDEMPOTENT_RETRY_STATUSES)
+                delay = error.retry_after
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            delay = min(delay, FLOWGLAD_BACKOFF_MAX_SECONDS) if delay is not None else backoff(attempt)
+            if time.monotonic() - start + delay >= self.deadline:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def create_checkout_session(self, payload: dict) -> dict:
+        return await self.request("POST", "/api/v1/checkout-sessions", json=payload)
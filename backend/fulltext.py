@@ -0,0 +1,140 @@
+"""SQLite FTS5 index over hotel and attraction text, for BM25 candidate generation"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# item type -> (catalog table, FTS table, indexed columns, BM25 weight per column)
+FULLTEXT_TABLES = {
+    "hotel": ("hotels", "hotels_fts", ("name", "description", "amenities"), (4.0, 1.0, 2.0)),
+    "attraction": ("attractions", "attractions_fts", ("name", "description", "category"), (4.0, 1.0, 2.0)),
+}
+
+# item type -> (city-like column, country-like column), as in recommendations.LOCATION_COLUMNS
+_LOCATION_COLUMNS = {"hotel": ("city", "country"), "attraction": ("city", "country")}
+
+# Words too common in chat messages to say anything about a hotel or attraction
+STOP_WORDS = frozenset("""
+    a about an and any are as at be but by can could do for from get have i im in into is it its
+    like looking me more my near of on or our please show some something that the their them there
+    these this to trip us want we what where which with would you your
+""".split())
+
+# Porter stemming lets "pools" match "pool"; unicode61 folds case and diacritics
+TOKENIZER = os.getenv("FTS_TOKENIZER", "porter unicode61")
+
+
+def match_query(message: str) -> Optional[str]:
+    """FTS5 query matching any content word of the message, or None if there is none"""
+    words = []
+    for word in re.findall(r"\w+", message.lower()):
+        if len(word) > 1 and word not in STOP_WORDS and word not in words:
+            words.append(word)
+    if not words:
+        return None
+    # Quoted, so words like OR, NEAR or column names are taken literally
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def _ddl(item_type: str) -> List[str]:
+    table, fts, columns, _ = FULLTEXT_TABLES[item_type]
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    # External-content table: the FTS index stores no copy of the text, triggers keep it in sync
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', tokenize='{TOKENIZER}')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        # Price and rating updates don't touch the index
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF id, {names} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+
+def ensure_fulltext_index(engine: Engine) -> bool:
+    """
+    Create the FTS tables and sync triggers if missing, indexing existing rows.
+
+    Returns False (and chat ranking stays embedding-only) when the SQLite
+    build lacks FTS5.
+    """
+    try:
+        with engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            for item_type, (_, fts, _, _) in FULLTEXT_TABLES.items():
+                for statement in _ddl(item_type):
+                    conn.execute(text(statement))
+                if fts not in existing:
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        return True
+    except Exception as e:
+        print(f"Full-text index unavailable: {e}")
+        return False
+
+
+def rebuild_fulltext_index(engine: Engine, item_types: Sequence[str] = tuple(FULLTEXT_TABLES)):
+    """Re-index every row of the item types, e.g. after writes that bypassed the triggers"""
+    with engine.begin() as conn:
+        for item_type in item_types:
+            _, fts, _, _ = FULLTEXT_TABLES[item_type]
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _bm25_statement(item_type: str, filtered: bool):
+    table, fts, _, weights = FULLTEXT_TABLES[item_type]
+    city, country = _LOCATION_COLUMNS[item_type]
+    # bm25() is lower for better matches, so negate it into a score
+    sql = (f"SELECT {fts}.rowid AS id, -bm25({fts}, {', '.join(map(str, weights))}) AS score "
+           f"FROM {fts}")
+    if filtered:
+        sql += (f" JOIN {table} ON {table}.id = {fts}.rowid WHERE {fts} MATCH :query "
+                f"AND ({table}.{city} IN :locations OR {table}.{country} IN :locations)")
+    else:
+        sql += f" WHERE {fts} MATCH :query"
+    sql += f" ORDER BY score DESC, {fts}.rowid LIMIT :k"
+    statement = text(sql)
+    if filtered:
+        statement = statement.bindparams(bindparam("locations", expanding=True))
+    return statement
+
+
+_STATEMENTS: Dict[Tuple[str, bool], object] = {
+    (item_type, filtered): _bm25_statement(item_type, filtered)
+    for item_type in FULLTEXT_TABLES for filtered in (False, True)
+}
+
+
+def bm25_candidates(db: Session, item_type: str, message: str, locations: Sequence[str],
+                    k: int) -> List[Tuple[int, float]]:
+    """Up to k (id, BM25 score) pairs for rows matching the message, best first"""
+    query = match_query(message)
+    if query is None or item_type not in FULLTEXT_TABLES or k <= 0:
+        return []
+    params = {"query": query, "k": k}
+    if locations:
+        params["locations"] = list(locations)
+    rows = db.execute(_STATEMENTS[(item_type, bool(locations))], params)
+    return [(row.id, float(row.score)) for row in rows]
+
+
+def hybrid_scores(dense: Dict[int, float], lexical: List[Tuple[int, float]],
+                  lexical_weight: float) -> List[Tuple[int, float]]:
+    """
+    Blend dense similarity with BM25 for every id in dense.
+
+    BM25 is scaled to [0, 1] by the best match in lexical, so the weight
+    means the same thing whatever the query length; ids without a match
+    score 0 on the lexical side.
+    """
+    best = max((score for _, score in lexical), default=0.0)
+    lexical_scores = {item_id: score / best for item_id, score in lexical} if best > 0 else {}
+    return [(item_id, (1 - lexical_weight) * score + lexical_weight * lexical_scores.get(item_id, 0.0))
+            for item_id, score in dense.items()]
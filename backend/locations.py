@@ -0,0 +1,261 @@
+"""Single-pass location extraction over a gazetteer built from the catalog"""
+import re
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import Hotel, Flight, Attraction
+
+# Result order: cities before countries before regions
+KIND_ORDER = {"city": 0, "country": 1, "region": 2}
+
+# Regions aren't catalog columns, so they are always part of the gazetteer
+REGIONS = ["Europe", "Asia", "America"]
+
+# Alternative spellings -> catalog name. Short all-caps aliases (like "LA" or "US")
+# only match in upper case so they don't fire on ordinary words.
+ALIASES = {
+    "NYC": "New York",
+    "New York City": "New York",
+    "LA": "Los Angeles",
+    "SF": "San Francisco",
+    "Rio": "Rio de Janeiro",
+    "United Kingdom": "UK",
+    "Britain": "UK",
+    "Great Britain": "UK",
+    "England": "UK",
+    "United States": "USA",
+    "US": "USA",
+    "United Arab Emirates": "UAE",
+    "Czechia": "Czech Republic",
+    "Holland": "Netherlands",
+}
+
+# IATA code in airport names like "Narita International Airport (NRT)"
+AIRPORT_CODE = re.compile(r"\(([A-Z]{3})\)")
+
+
+def fold_case(text: str) -> str:
+    """Lower-case without changing length, so match offsets line up with the original text"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(ch.lower()[:1] or ch for ch in text)
+
+
+def _case_sensitive(name: str, canonical: str) -> bool:
+    """Short all-caps aliases and airport codes only match as written"""
+    return name != canonical and len(name) <= 3 and name.isupper()
+
+
+class LocationAutomaton:
+    """
+    Aho-Corasick automaton over gazetteer names.
+
+    One pass over the text finds every occurrence of every name; matches are
+    then filtered to whole words and resolved leftmost-longest, so "New York
+    City" wins over "New York" and "Rome" doesn't fire inside "Romeo".
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        # Patterns ending exactly at each node
+        self._terminal: List[List[int]] = [[]]
+        # Failure links and outputs merged along them, rebuilt lazily after inserts
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._linked = True
+        # Per pattern: (name as written, canonical name, kind, case sensitive)
+        self.patterns: List[Tuple[str, str, str, bool]] = []
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def copy(self) -> "LocationAutomaton":
+        """Independent copy, so names can be added without disturbing concurrent searches"""
+        clone = LocationAutomaton()
+        clone._goto = [dict(edges) for edges in self._goto]
+        clone._terminal = [list(terminal) for terminal in self._terminal]
+        clone._fail = self._fail
+        clone._out = self._out
+        clone._linked = self._linked
+        clone.patterns = list(self.patterns)
+        return clone
+
+    def add(self, name: str, canonical: str, kind: str, case_sensitive: bool = False):
+        """Insert a name into the trie"""
+        node = 0
+        for ch in fold_case(name):
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._terminal.append([])
+            node = nxt
+        self._terminal[node].append(len(self.patterns))
+        self.patterns.append((name, canonical, kind, case_sensitive))
+        self._linked = False
+
+    def _link(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        fail = [0] * len(self._goto)
+        out = [list(terminal) for terminal in self._terminal]
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                state = fail[node]
+                while state and ch not in self._goto[state]:
+                    state = fail[state]
+                target = self._goto[state].get(ch, 0) if node else 0
+                fail[child] = target
+                out[child].extend(out[target])
+                queue.append(child)
+        self._fail = fail
+        self._out = out
+        self._linked = True
+
+    def search(self, text: str) -> List[Tuple[int, int, int]]:
+        """Return (start, end, pattern id) for every whole-word, leftmost-longest match"""
+        if not self._linked:
+            self._link()
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        matches = []
+        node = 0
+        for i, ch in enumerate(fold_case(text)):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                name, _, _, case_sensitive = patterns[pid]
+                start = i + 1 - len(name)
+                if case_sensitive and text[start:i + 1] != name:
+                    continue
+                if (start > 0 and text[start - 1].isalnum()) or (i + 1 < len(text) and text[i + 1].isalnum()):
+                    continue
+                matches.append((start, i + 1, pid))
+
+        # Leftmost-longest, non-overlapping
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        end = 0
+        for match in matches:
+            if match[0] >= end:
+                selected.append(match)
+                end = match[1]
+        return selected
+
+
+def catalog_gazetteer(db: Session) -> Dict[str, Tuple[str, str]]:
+    """Map every name the catalog knows (plus aliases and regions) to (canonical name, kind)"""
+    names: Dict[str, Tuple[str, str]] = {}
+    for region in REGIONS:
+        names[region] = (region, "region")
+    for model_cls in (Hotel, Attraction):
+        for (country,) in db.query(model_cls.country).distinct():
+            if country:
+                names[country] = (country, "country")
+    # Cities override countries with the same name (e.g. Singapore)
+    for model_cls in (Hotel, Attraction):
+        for (city,) in db.query(model_cls.city).distinct():
+            if city:
+                names[city] = (city, "city")
+    for column in (Flight.origin, Flight.destination):
+        for (city,) in db.query(column).distinct():
+            if city:
+                names[city] = (city, "city")
+    for city_column, airport_column in ((Flight.origin, Flight.departure_airport),
+                                        (Flight.destination, Flight.arrival_airport)):
+        for city, airport in db.query(city_column, airport_column).distinct():
+            code = AIRPORT_CODE.search(airport or "")
+            if city and code and code.group(1) not in names:
+                names[code.group(1)] = (city, "city")
+    for alias, canonical in ALIASES.items():
+        if alias not in names and canonical in names:
+            names[alias] = (canonical, names[canonical][1])
+    return names
+
+
+class LocationMatcher:
+    """
+    Extracts catalog locations from free text.
+
+    The gazetteer is loaded from the catalog on first use and refreshed after
+    catalog changes (mark_dirty, called from the catalog change feed). Writes that don't change the set of names cost
+    nothing; new names are inserted into a copy of the current automaton, and
+    it is only rebuilt from scratch when names disappear or change meaning.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]]):
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._names: Dict[str, Tuple[str, str]] = {}
+        self._automaton: Optional[LocationAutomaton] = None
+        self._dirty = True
+        # Bumped whenever the set of names changes, so parsed results can be cached against it
+        self.version = 0
+
+    @classmethod
+    def from_names(cls, names: Dict[str, Tuple[str, str]]) -> "LocationMatcher":
+        """Matcher over a fixed gazetteer, without a catalog behind it"""
+        matcher = cls(None)
+        matcher.update(names)
+        return matcher
+
+    def mark_dirty(self, *args):
+        self._dirty = True
+
+    def refresh(self, db: Optional[Session] = None):
+        """Reload the gazetteer from the catalog and update the automaton"""
+        owns_session = db is None
+        db = db or self._session_factory()
+        try:
+            names = catalog_gazetteer(db)
+        finally:
+            if owns_session:
+                db.close()
+        self.update(names)
+
+    def update(self, names: Dict[str, Tuple[str, str]]):
+        """Swap in a new gazetteer, reusing the current automaton when names were only added"""
+        with self._lock:
+            self._dirty = False
+            if names == self._names and self._automaton is not None:
+                return
+            removed = any(names.get(name) != value for name, value in self._names.items())
+            if self._automaton is None or removed:
+                automaton = LocationAutomaton()
+                added = names
+            else:
+                automaton = self._automaton.copy()
+                added = {name: value for name, value in names.items() if name not in self._names}
+            for name, (canonical, kind) in added.items():
+                automaton.add(name, canonical, kind, _case_sensitive(name, canonical))
+            automaton.search("")  # Link before publishing so readers never see a half-built automaton
+            self._automaton = automaton
+            self._names = names
+            self.version += 1
+
+    @property
+    def stale(self) -> bool:
+        """True if the next extraction has to reload the gazetteer from the catalog"""
+        return self._session_factory is not None and (self._dirty or self._automaton is None)
+
+    def ensure_fresh(self):
+        """Reload the gazetteer if the catalog changed since it was built"""
+        if self.stale:
+            self.refresh()
+
+    def extract(self, text: str) -> List[str]:
+        """Canonical location names mentioned in text, cities first, without duplicates"""
+        self.ensure_fresh()
+        automaton = self._automaton
+        found = {}
+        for start, _, pid in automaton.search(text):
+            _, canonical, kind, _ = automaton.patterns[pid]
+            if canonical not in found:
+                found[canonical] = (KIND_ORDER[kind], start)
+        return sorted(found, key=found.get)
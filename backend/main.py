@@ -1,23 +1,146 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
+from dataclasses import asdict
 import re
+import hmac
 import json
 import os
-from datetime import datetime
-from sentence_transformers import SentenceTransformer
+from datetime import date, datetime, timezone
+import math
 import numpy as np
-import requests
 
-from database import SessionLocal, Hotel, Flight, Attraction, init_db
+from database import engine, SessionLocal, AsyncSessionLocal, init_db
+from embedding_store import EmbeddingStore, EMBEDDINGS_PATH, item_text
+from changes import CatalogDelta, ChangeFeed
+from vector_index import CatalogIndex, top_k
+from encoder import BatchingEncoder, ModelLoader
+from flowglad import FlowgladClient, FlowgladError
+from metrics import METRICS_ENABLED, MetricsRegistry, TimingMiddleware, span
+from profiler import (
+    PROFILER_ADMIN_TOKEN, PROFILER_INTERVAL_MS, PROFILER_MAX_SECONDS, Profile, Profiler, ProfilerBusy,
+    ProfilerMiddleware
+)
+from bookings import BookingError, availability, booking_dates, replay, request_hash, reserve
+from amenities import ensure_amenity_index
+from fulltext import FULLTEXT_TABLES, bm25_candidates, ensure_fulltext_index, hybrid_scores
+from cache import CachedResponse, LRUCache, ResponseCache, etag_matches, normalize_message
+from locations import LocationMatcher
+from plan_parser import TravelPlan, TravelPlanParser
+from pagination import MAX_PAGE_SIZE, Positions, decode_cursor, encode_cursor, exhausted, position
+from recommendations import (
+    CATEGORIES, CategoryQuery, fetch_ids_sync, fetch_recommendations, fetch_recommendations_sync, ids_statement,
+    page_queries, split_pages, statement_params, with_filters
+)
+from serialization import HAS_ORJSON, RowFragments, recommendations_json, recommendations_response
+from sessions import ChatSession, InMemorySessionStore, new_session_id
 from models import (
-    TravelPlanRequest, ChatMessage, RecommendationsResponse,
-    HotelResponse, FlightResponse, AttractionResponse,
-    BookingRequest, BookingResponse, CheckoutSessionRequest, CheckoutSessionResponse
+    TravelPlanRequest, ChatMessage, RecommendationFilters, RecommendationsResponse,
+    BookingRequest, BookingResponse, AvailabilityResponse, CheckoutSessionRequest, CheckoutSessionResponse
+)
+# Sentence transformer model, loaded in the background after startup
+model = ModelLoader('all-MiniLM-L6-v2')
+
+# How long /api/chat waits for the model before falling back to lexical ranking
+CHAT_MODEL_WAIT_SECONDS = float(os.getenv("CHAT_MODEL_WAIT_SECONDS", "0"))
+
+# Results per category on each page of /api/travel-plan, unless the request sets a limit
+TRAVEL_PLAN_PAGE_SIZE = int(os.getenv("TRAVEL_PLAN_PAGE_SIZE", "20"))
+
+# Concurrent chat requests share one batched forward pass for their messages
+query_encoder = BatchingEncoder(model.encode)
+
+# Precomputed catalog embeddings, persisted next to the database
+embedding_store = EmbeddingStore(EMBEDDINGS_PATH, model.encode)
+catalog_index = CatalogIndex(embedding_store)
+
+# Normalized chat message -> query embedding
+message_embedding_cache = LRUCache(
+    maxsize=int(os.getenv("MESSAGE_EMBEDDING_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("MESSAGE_EMBEDDING_CACHE_TTL", "3600")),
+)
+# (normalized message, locations, days) -> ranked ids per category
+chat_result_cache = LRUCache(
+    maxsize=int(os.getenv("CHAT_RESULT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CHAT_RESULT_CACHE_TTL", "300")),
+)
+
+# Hybrid chat ranking: BM25 candidates from the FTS index re-ranked by embedding similarity.
+# Scores blend as (1 - weight) * cosine + weight * BM25 scaled to [0, 1].
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "0.3"))
+# BM25 matches fetched per category; with at least HYBRID_MIN_CANDIDATES of them only their
+# vectors are scored, otherwise they are blended into the nearest neighbours
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "200"))
+HYBRID_MIN_CANDIDATES = int(os.getenv("HYBRID_MIN_CANDIDATES", "50"))
+# Set at startup once the FTS tables exist
+fulltext_ready = False
+
+# Bumped on every catalog change so session candidates are resolved again
+catalog_writes = 0
+
+def invalidate_chat_results(*args):
+    """Drop cached rankings whenever the catalog changes"""
+    global catalog_writes
+    catalog_writes += 1
+    chat_result_cache.clear()
+
+# Encoded JSON per catalog row, reused across responses (0 disables). orjson encodes a row about
+# as fast as a cached fragment is joined, so it only pays off with the stdlib encoder.
+RESPONSE_FRAGMENT_CACHE_SIZE = int(os.getenv("RESPONSE_FRAGMENT_CACHE_SIZE", "0" if HAS_ORJSON else "100000"))
+row_fragments = RowFragments(RESPONSE_FRAGMENT_CACHE_SIZE) if RESPONSE_FRAGMENT_CACHE_SIZE > 0 else None
+
+# Encoded /api/travel-plan and /api/recommendations/day responses per request and catalog version,
+# bounded by their total size (0 disables; ETags and 304s work either way)
+response_cache = ResponseCache(max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 2**20))))
+# max-age of their Cache-Control header; 0 has clients revalidate with If-None-Match every time
+RESPONSE_MAX_AGE = int(os.getenv("RESPONSE_MAX_AGE", "0"))
+# Response header naming the chat session of a /api/travel-plan first page
+SESSION_ID_HEADER = "X-Session-Id"
+
+# Gazetteer of catalog cities, countries, aliases and airport codes
+location_matcher = LocationMatcher(SessionLocal)
+plan_parser = TravelPlanParser(location_matcher)
+
+# Catalog changes from any writer (this process, other workers, catalog_import), read from the
+# change log every CATALOG_POLL_SECONDS
+catalog_feed = ChangeFeed(engine)
+
+def apply_catalog_changes(delta: CatalogDelta):
+    """Bring derived caches up to date with the rows that changed"""
+    invalidate_chat_results()
+    response_cache.clear()
+    location_matcher.mark_dirty()
+    if row_fragments is not None:
+        if delta.full:
+            row_fragments.clear()
+        for item_type in CATEGORIES:
+            row_fragments.discard(item_type, delta.changed(item_type))
+    # Until the model is loaded the warmup syncs the store instead
+    if model.wait(0):
+        db = SessionLocal()
+        try:
+            embedding_store.sync(db)
+        finally:
+            db.close()
+
+catalog_feed.subscribe(apply_catalog_changes)
+
+# Parsed plan and candidate vectors per conversation, keyed by the session id returned to the client
+chat_sessions = InMemorySessionStore(
+    max_sessions=int(os.getenv("CHAT_SESSION_MAX", "1000")),
+    max_bytes=int(os.getenv("CHAT_SESSION_MAX_BYTES", str(256 * 2**20))),
+    idle_seconds=float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800")),
 )
-# Initialize sentence transformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Plans matching more rows than this per category are ranked through the index instead
+CHAT_SESSION_MAX_CANDIDATES = int(os.getenv("CHAT_SESSION_MAX_CANDIDATES", "5000"))
+
+# Pooled Flowglad API client shared by the checkout requests of this worker
+flowglad = FlowgladClient()
 
 app = FastAPI()
 
@@ -28,8 +151,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_ID_HEADER],
 )
 
+# Latency histograms per endpoint and stage for /metrics, and a Server-Timing header on every response
+request_metrics = MetricsRegistry()
+if METRICS_ENABLED:
+    app.add_middleware(TimingMiddleware, registry=request_metrics)
+
+# Sampling profiler behind /admin/profile, only installed when PROFILER_ADMIN_TOKEN is set
+profiler = Profiler()
+if PROFILER_ADMIN_TOKEN:
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -38,218 +172,380 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
+    global fulltext_ready
     init_db()
+    fulltext_ready = ensure_fulltext_index(engine)
+    ensure_amenity_index(engine)
+    catalog_feed.start()
+    # Load the model and sync catalog embeddings without blocking startup
+    model.start(warmup=warm_catalog_embeddings)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await flowglad.aclose()
+
+def warm_catalog_embeddings():
+    db = SessionLocal()
+    try:
+        embedding_store.sync(db)
+    finally:
+        db.close()
+    invalidate_chat_results()
 
 @app.get("/")
 def read_root():
     return {"message": "Travel Agent API"}
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Request and stage latency histograms of this worker, in the Prometheus text format"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not PROFILER_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), PROFILER_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: Optional[float] = Query(None, gt=0, le=PROFILER_MAX_SECONDS),
+                         requests: Optional[int] = Query(None, gt=0), route: Optional[str] = None,
+                         interval_ms: float = Query(PROFILER_INTERVAL_MS, ge=1, le=1000), idle: bool = False,
+                         top: int = Query(30, ge=1, le=1000), format: str = Query("json", pattern="^(json|collapsed)$")):
+    """
+    Sample the stacks of this worker for `seconds`, or for the next `requests` requests to the
+    route with path template `route` (waiting at most `seconds`, default PROFILER_MAX_SECONDS)
+    """
+    if requests is None and seconds is None:
+        raise HTTPException(status_code=400, detail="Set seconds, or requests and route")
+    if (requests is None) != (route is None):
+        raise HTTPException(status_code=400, detail="requests and route go together")
+    path_regex = methods = None
+    if route is not None:
+        matched = [r for r in app.routes if isinstance(r, APIRoute) and r.path == route]
+        if not matched:
+            raise HTTPException(status_code=400, detail=f"No route {route}")
+        path_regex, methods = matched[0].path_regex, set().union(*(r.methods for r in matched))
+    profile = Profile(interval_ms / 1000, idle=idle, route=route, path_regex=path_regex, methods=methods,
+                      requests=requests or 0)
+    try:
+        profiler.start(profile)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await run_in_threadpool(profile.wait, seconds or PROFILER_MAX_SECONDS)
+    finally:
+        profiler.finish(profile)
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.report(top)
+
+@app.get("/api/ready")
+def readiness():
+    """Report whether the embedding model is loaded and chat ranking is semantic"""
+    status = model.status()
+    return JSONResponse(status, status_code=200 if status["state"] == "ready" else 503)
+
 def extract_locations(text: str) -> List[str]:
     """Extract location names from travel plan text"""
-    locations = []
-    # Common cities and countries - ordered by specificity (cities before countries)
-    common_locations = [
-        # Cities (more specific)
-        "Tokyo", "Kyoto", "Hakone", "Paris", "Rome", "Barcelona", "London", 
-        "Berlin", "Amsterdam", "Vienna", "Prague", "Dubai", "Singapore", 
-        "Bangkok", "Sydney", "New York", "Los Angeles", "Istanbul", "Cairo", 
-        "Rio de Janeiro", "Buenos Aires",
-        # Countries (less specific)
-        "Japan", "France", "Italy", "Spain", "UK", "Germany", "Netherlands",
-        "Austria", "Czech Republic", "UAE", "Thailand", "Australia", "USA",
-        "Turkey", "Egypt", "Brazil", "Argentina",
-        # Regions
-        "Europe", "Asia", "America"
-    ]
-    
-    text_lower = text.lower()
-    found_locations = []
-    
-    # Check for locations in order (cities first, then countries)
-    for loc in common_locations:
-        if loc.lower() in text_lower:
-            found_locations.append(loc)
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    for loc in found_locations:
-        if loc not in seen:
-            locations.append(loc)
-            seen.add(loc)
-    
-    return locations
+    return location_matcher.extract(text)
 
 def extract_days(text: str) -> int:
     """Extract number of days from travel plan"""
-    # Look for patterns like "7-day", "7 days", "7day", "seven days"
-    patterns = [
-        r'(\d+)[-\s]day',
-        r'(\d+)day',
-        r'(\d+)\s+days?',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return int(match.group(1))
-    
-    return 1  # Default to 1 day
+    return parse_travel_plan(text).days
 
-def parse_travel_plan(plan: str) -> dict:
+def parse_travel_plan(plan: str) -> TravelPlan:
     """Parse travel plan to extract information"""
-    locations = extract_locations(plan)
-    days = extract_days(plan)
-    
-    # Determine if plan is specific or general
-    is_specific = len(locations) > 0 and days > 1
-    
-    return {
-        "locations": locations,
-        "days": days,
-        "is_specific": is_specific,
-        "original_plan": plan
-    }
-
-def filter_by_preferences(query_result, preferences: str) -> List:
-    """Filter results based on user preferences"""
-    if not preferences:
-        return query_result
-    
-    preferences_lower = preferences.lower()
-    filtered = []
-    
-    for item in query_result:
-        # For hotels
-        if hasattr(item, 'amenities'):
-            if 'nature' in preferences_lower and 'mountain' in item.amenities.lower():
-                filtered.append(item)
-            elif 'chill' in preferences_lower and 'spa' in item.amenities.lower():
-                filtered.append(item)
-            elif 'family' in preferences_lower or 'parents' in preferences_lower:
-                filtered.append(item)
-            else:
-                filtered.append(item)
-        
-        # For attractions
-        elif hasattr(item, 'category'):
-            if 'nature' in preferences_lower and item.category == 'nature':
-                filtered.append(item)
-            elif 'history' in preferences_lower and item.category == 'history':
-                filtered.append(item)
-            elif 'chill' in preferences_lower and item.category == 'nature':
-                filtered.append(item)
-            else:
-                filtered.append(item)
-        
-        # For flights
-        else:
-            filtered.append(item)
-    
-    return filtered if filtered else query_result
+    return plan_parser.parse(plan)
+
+async def parse_travel_plan_async(plan: str) -> TravelPlan:
+    """Parse on the event loop, reloading the gazetteer (a blocking query) in the threadpool first"""
+    if location_matcher.stale:
+        await run_in_threadpool(location_matcher.ensure_fresh)
+    return parse_travel_plan(plan)
+
+# CategoryQuery fields whose values match as a set, so their order doesn't change the response
+UNORDERED_FIELDS = ("cities", "countries", "amenities_all", "amenities_any", "categories")
+
+def response_cache_key(endpoint: str, queries: Dict[str, CategoryQuery], **params) -> str:
+    """Everything a recommendations response depends on, including the catalog version"""
+    canonical = {item_type: {name: sorted(set(value)) if name in UNORDERED_FIELDS else value
+                             for name, value in asdict(query).items() if value is not None}
+                 for item_type, query in queries.items()}
+    return json.dumps([endpoint, catalog_feed.version, canonical, params], sort_keys=True, separators=(",", ":"))
+
+def cached_response(cached: CachedResponse, if_none_match: Optional[str] = None, private: bool = False,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    The encoded body with its ETag, or 304 Not Modified when the client already holds it.
+    Only GET endpoints pass if_none_match: RFC 9110 doesn't allow a 304 for other methods.
+    """
+    headers = {**(headers or {}), "ETag": cached.etag,
+               "Cache-Control": f"{'private' if private else 'public'}, "
+                                f"{f'max-age={RESPONSE_MAX_AGE}' if RESPONSE_MAX_AGE else 'no-cache'}"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 @app.post("/api/travel-plan", response_model=RecommendationsResponse)
-def process_travel_plan(request: TravelPlanRequest, db: Session = Depends(get_db)):
+async def process_travel_plan(request: TravelPlanRequest, db: AsyncSession = Depends(get_async_db)):
     """Process travel plan and return recommendations"""
-    parsed = parse_travel_plan(request.plan)
-    locations = parsed["locations"]
-    days = parsed["days"]
-
-    # Extract locations from preferences as well (users may mention multiple locations)
-    preference_locations = []
-    if request.preferences:
-        preference_locations = extract_locations(request.preferences)
+    with span("parse"):
+        parsed = await parse_travel_plan_async(request.plan)
+        locations = list(parsed.locations)
+        days = parsed.days
+
+        # Extract locations from preferences as well (users may mention multiple locations)
+        preference_locations = []
+        if request.preferences:
+            preference_locations = extract_locations(request.preferences)
     
-    # Combine all locations from plan and preferences, remove duplicates
-    all_locations = list(set(locations + preference_locations))
+    # Combine all locations from plan and preferences, remove duplicates; first mentions keep their order
+    # so the city picked below, and the cache key, are the same in every worker
+    all_locations = list(dict.fromkeys(locations + preference_locations))
     
     # Filter by all locations
     if all_locations:
-        hotels = db.query(Hotel).filter(
-            Hotel.city.in_(all_locations[-1:]) | Hotel.country.in_(all_locations)
-        ).all()
-        
-        flights = db.query(Flight).filter(
-            Flight.destination.in_(all_locations[-1:]) | Flight.origin.in_(all_locations)
-        ).all()
-        
-        attractions = db.query(Attraction).filter(
-            Attraction.city.in_(all_locations[-1:]) | Attraction.country.in_(all_locations)
-        ).all()
+        query = CategoryQuery(cities=all_locations[-1:], countries=all_locations)
+        queries = {item_type: query for item_type in CATEGORIES}
     else:
-        # If no locations specified, get all items
-        hotels = db.query(Hotel).all()
-        flights = db.query(Flight).all()
-        attractions = db.query(Attraction).all()
-    
-    # Apply preferences if provided
-    # if request.preferences:
-    #     hotels = filter_by_preferences(hotels, request.preferences)
-    #     attractions = filter_by_preferences(attractions, request.preferences)
-    
-    return RecommendationsResponse(
-        hotels=[HotelResponse(**{k: getattr(h, k) for k in HotelResponse.__fields__.keys()}) for h in hotels],
-        flights=[FlightResponse(**{k: getattr(f, k) for k in FlightResponse.__fields__.keys()}) for f in flights],
-        attractions=[AttractionResponse(**{k: getattr(a, k) for k in AttractionResponse.__fields__.keys()}) for a in attractions],
-        days=days,
-        current_day=1
-    )
-
-def calculate_similarity_scores(user_message: str, items: List, item_type: str) -> List[tuple]:
-    """Calculate cosine similarity between user message and items using sentence transformers"""
+        # If no locations specified, page through all items
+        queries = {item_type: CategoryQuery() for item_type in CATEGORIES}
+    queries = with_filters(queries, request.filters)
+    positions = parse_cursor(request.cursor)
+    limits = {item_type: request.limit or TRAVEL_PLAN_PAGE_SIZE for item_type in CATEGORIES}
+    pages = page_queries(queries, limits, positions)
+    key = response_cache_key("travel-plan", pages, days=days)
+    cached = response_cache.get(key)
+    if cached is None:
+        with span("db_fetch"):
+            results, next_positions = split_pages(await fetch_recommendations(db, pages), limits)
+
+        with span("serialize"):
+            body = recommendations_json(results, days=days, current_day=1,
+                                        next_cursor=encode_cursor(next_positions), fragments=row_fragments)
+        cached = response_cache.put(key, body)
+
+    # Follow-up chat messages reuse the parsed plan through this session; later pages keep the first one.
+    # Each request gets its own, named in a header so the cached body and its ETag stay the same for everyone.
+    headers = None
+    if positions is None:
+        session = ChatSession(session_id=new_session_id(), plan=parsed)
+        chat_sessions.put(session)
+        headers = {SESSION_ID_HEADER: session.session_id}
+    return cached_response(cached, private=positions is None, headers=headers)
+
+# Number of results returned per category by /api/chat (and /api/recommendations/day)
+HOTEL_LIMIT = 6
+FLIGHT_LIMIT = 5
+ATTRACTION_LIMIT = 6
+CHAT_LIMITS = {"hotel": HOTEL_LIMIT, "flight": FLIGHT_LIMIT, "attraction": ATTRACTION_LIMIT}
+
+def encode_query(text: str) -> Optional[np.ndarray]:
+    """Encode a user message into a normalized query vector, or None if encoding fails"""
+    key = normalize_message(text)
+    cached = message_embedding_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        # Get user message embedding
-        user_embedding = model.encode([user_message])
-        
-        # Create item descriptions
-        item_texts = []
-        for item in items:
-            if item_type == "hotel":
-                item_text = f"{item.name} {item.description} {item.amenities} {item.city} {item.country}"
-            elif item_type == "attraction":
-                item_text = f"{item.name} {item.description} {item.category} {item.city} {item.country}"
-            else:  # flight
-                item_text = f"{item.airline} {item.origin} {item.destination} {item.flight_class}"
-            item_texts.append(item_text)
-        
-        # Get item embeddings
-        item_embeddings = model.encode(item_texts)
-        
-        # Calculate cosine similarity using numpy
-        # Normalize embeddings
-        user_norm = user_embedding / np.linalg.norm(user_embedding, axis=1, keepdims=True)
-        items_norm = item_embeddings / np.linalg.norm(item_embeddings, axis=1, keepdims=True)
-        # Calculate cosine similarity
-        similarities = np.dot(user_norm, items_norm.T)[0]
-        
-        # Return items with similarity scores
-        return list(zip(items, similarities))
+        embedding = query_encoder.encode(text)
+    except Exception as e:
+        print(f"Error encoding message: {e}")
+        return None
+    embedding = embedding / np.linalg.norm(embedding)
+    message_embedding_cache.put(key, embedding)
+    return embedding
+
+def by_score(ranked: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """Best score first, ties by id, so cursors over a ranking are stable"""
+    return sorted(ranked, key=lambda pair: (-pair[1], pair[0]))
+
+def lexical_candidates(db: Session, item_type: str, message: str, locations: List[str],
+                       k: int) -> List[Tuple[int, float]]:
+    """BM25 matches for the message, or none when the full-text index isn't available"""
+    if not fulltext_ready:
+        return []
+    try:
+        with span("db_fts"):
+            return bm25_candidates(db, item_type, message, locations, k)
     except Exception as e:
-        print(f"Error calculating similarity: {e}")
-        # Fallback: return items with zero scores
-        return [(item, 0.0) for item in items]
+        print(f"Error in full-text search: {e}")
+        return []
+
+def dense_scores(item_type: str, ids, query_embedding: np.ndarray) -> dict:
+    """Similarity of the query to the indexed vectors of the given ids"""
+    found, vectors = catalog_index.get(item_type).vectors_for(set(ids))
+    return dict(zip(found.tolist(), (vectors @ query_embedding).tolist()))
+
+def hybrid_rank(item_type: str, query_embedding: np.ndarray, dense: List[Tuple[int, float]],
+                lexical: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """Re-rank the union of dense and BM25 candidates by the blended score"""
+    if not lexical:
+        return by_score(dense)
+    scores = dict(dense)
+    missing = [item_id for item_id, _ in lexical if item_id not in scores]
+    if missing:
+        scores.update(dense_scores(item_type, missing, query_embedding))
+    return by_score(hybrid_scores(scores, lexical, HYBRID_LEXICAL_WEIGHT))
+
+def scope_ids(db: Session, item_type: str, scope: CategoryQuery) -> set:
+    """Ids of the rows matching a scope's locations and structured filters"""
+    with span("db_ids"):
+        return fetch_ids_sync(db, item_type, scope)
+
+def scoped_query(db: Session, model_cls, item_type: str, scope: CategoryQuery, *entities):
+    """ORM query over the rows matching a scope's locations and structured filters"""
+    query = db.query(*entities)
+    if scope.shape:
+        query = query.filter(model_cls.id.in_(ids_statement(item_type, scope.shape)))
+        query = query.params(**statement_params({item_type: scope}))
+    return query
+
+def rank_ids(db: Session, model_cls, item_type: str, query_embedding: Optional[np.ndarray],
+             message: str, scope: CategoryQuery, k: int) -> List[Tuple[int, float]]:
+    """Return (id, score) for the k catalog rows closest to the query, restricted to the scope"""
+    locations = list(scope.cities or [])
+    # Structured filters resolve to ids up front, through the amenity join table and indexes
+    allowed_ids = scope_ids(db, item_type, scope) if scope.filtered else None
+    if allowed_ids is not None and not allowed_ids:
+        return []
+    lexical = []
+    if query_embedding is not None:
+        # The BM25 pool doesn't depend on k, so deeper pages rank the same candidates
+        lexical = lexical_candidates(db, item_type, message, locations, max(HYBRID_CANDIDATES, k))
+        if allowed_ids is not None:
+            lexical = [pair for pair in lexical if pair[0] in allowed_ids]
+        if len(lexical) >= HYBRID_MIN_CANDIDATES:
+            # Enough literal matches: only their vectors are scored
+            try:
+                return hybrid_rank(item_type, query_embedding, [], lexical)[:k]
+            except Exception as e:
+                print(f"Error calculating similarity: {e}")
+    if allowed_ids is None and locations:
+        allowed_ids = scope_ids(db, item_type, scope)
+        if not allowed_ids:
+            return []
+    if query_embedding is not None:
+        try:
+            # Few literal matches: blend them into the nearest neighbours instead
+            dense = catalog_index.search(item_type, query_embedding, max(k, HYBRID_MIN_CANDIDATES), allowed_ids)
+            return hybrid_rank(item_type, query_embedding, dense, lexical)[:k]
+        except Exception as e:
+            print(f"Error calculating similarity: {e}")
+    # Fallback: unranked rows in scope
+    if allowed_ids is not None:
+        return [(item_id, 0.0) for item_id in sorted(allowed_ids)[:k]]
+    with span("db_ids"):
+        return [(row.id, 0.0) for row in db.query(model_cls.id).order_by(model_cls.id).limit(k)]
+
+def session_rank_ids(db: Session, session: ChatSession, model_cls, item_type: str,
+                     query_embedding: np.ndarray, message: str, k: int) -> List[Tuple[int, float]]:
+    """Rank the session's cached candidates for its plan locations, resolving them on first use"""
+    version = (catalog_writes, embedding_store.version)
+    with session.lock:
+        # Both counters only grow, so a request that read older versions leaves newer candidates alone
+        if session.catalog_version is None or version > session.catalog_version:
+            session.candidates = {}
+            session.catalog_version = version
+        candidates = session.candidates.get(item_type)
+    locations = list(session.plan.locations)
+    if candidates is None:
+        scope = CategoryQuery(cities=locations, countries=locations)
+        allowed_ids = scope_ids(db, item_type, scope)
+        if len(allowed_ids) > CHAT_SESSION_MAX_CANDIDATES:
+            return rank_ids(db, model_cls, item_type, query_embedding, message, scope, k)
+        candidates = catalog_index.get(item_type).vectors_for(allowed_ids)
+        with session.lock:
+            # Published only for the versions they were resolved at; a new dict, as the session
+            # store sums the candidates' size without this lock
+            if session.catalog_version == version:
+                session.candidates = {**session.candidates, item_type: candidates}
+    ids, vectors = candidates
+    scores = vectors @ query_embedding
+    lexical = lexical_candidates(db, item_type, message, locations, HYBRID_CANDIDATES)
+    if lexical:
+        # Every cached candidate is scored anyway, so blend BM25 into all of them
+        blended = hybrid_scores(dict(zip(ids.tolist(), scores.tolist())), lexical, HYBRID_LEXICAL_WEIGHT)
+        return by_score(blended)[:k]
+    return by_score([(int(ids[i]), float(scores[i])) for i in top_k(scores, k)])
 
+def lexical_rank_ids(db: Session, model_cls, item_type: str, message: str,
+                     scope: CategoryQuery, k: int) -> List[Tuple[int, float]]:
+    """Rank rows by BM25 (word overlap without the index); used until the model is ready"""
+    if fulltext_ready and item_type in FULLTEXT_TABLES:
+        locations = list(scope.cities or [])
+        if scope.filtered:
+            allowed_ids = scope_ids(db, item_type, scope)
+            ranked = [pair for pair in lexical_candidates(db, item_type, message, locations,
+                                                          max(HYBRID_CANDIDATES, k)) if pair[0] in allowed_ids]
+        else:
+            ranked = lexical_candidates(db, item_type, message, locations, k)
+        if len(ranked) < k:
+            # Pad with unmatched rows in id order, like the unranked fallback
+            matched = {item_id for item_id, _ in ranked}
+            query = scoped_query(db, model_cls, item_type, scope, model_cls.id)
+            with span("db_ids"):
+                ranked += [(row.id, 0.0) for row in query.order_by(model_cls.id).limit(k) if row.id not in matched]
+        return by_score(ranked)[:k]
+    words = set(re.findall(r"\w+", message.lower()))
+    scored = []
+    for item in scoped_query(db, model_cls, item_type, scope, model_cls):
+        item_words = set(re.findall(r"\w+", item_text(item, item_type).lower()))
+        scored.append((item.id, float(len(words & item_words))))
+    return by_score(scored)[:k]
+
+def ranked_page(ranked: List[Tuple[int, float]], position: Optional[list], limit: int):
+    """One page of a ranking after a [score, id, seen] cursor position, plus the next position"""
+    seen = 0
+    if position:
+        score, after_id, seen = position
+        ranked = [(item_id, s) for item_id, s in ranked if (-s, item_id) > (-score, after_id)]
+    page = ranked[:limit]
+    if len(ranked) > limit:
+        return page, [page[-1][1], page[-1][0], seen + len(page)]
+    return page, None
+
+def parse_cursor(cursor: Optional[str], width: int = 2) -> Optional[Positions]:
+    try:
+        return decode_cursor(cursor, width)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Chat stays a sync endpoint: ranking is CPU-bound numpy work and the embedding store
+# re-encodes stale rows through a sync session, so it runs in the threadpool
 @app.post("/api/chat", response_model=RecommendationsResponse)
 def chat_with_agent(message: ChatMessage, db: Session = Depends(get_db)):
     """Handle chatbot messages and update recommendations using sentence transformers and cosine similarity"""
     user_preferences = message.message
     
-    # Parse original plan if provided
-    if message.current_plan:
-        parsed = parse_travel_plan(message.current_plan)
-        original_locations = parsed["locations"]
-        days = parsed["days"]
+    # Reuse the plan parsed for this session; otherwise parse the original plan if provided
+    session = chat_sessions.get(message.session_id) if message.session_id else None
+    if session is None and message.current_plan:
+        with span("parse"):
+            session = ChatSession(session_id=new_session_id(), plan=parse_travel_plan(message.current_plan))
+    if session is not None:
+        original_locations = list(session.plan.locations)
+        days = session.plan.days
     else:
         original_locations = []
         days = 1
     
-    # Extract locations from user message - these override the original plan locations
-    message_locations = extract_locations(user_preferences)
+    # Parse the message in one pass; its locations override the original plan locations
+    with span("parse"):
+        message_plan = parse_travel_plan(user_preferences)
+    message_locations = list(message_plan.locations)
     
     # Check if user mentioned a different number of days in the chat message
-    chat_days = extract_days(user_preferences)
+    chat_days = message_plan.days
     if chat_days > 1:
         days = chat_days
     
@@ -260,113 +556,167 @@ def chat_with_agent(message: ChatMessage, db: Session = Depends(get_db)):
     else:
         all_locations = original_locations
     
-    # Get base recommendations filtered by locations
-    if all_locations:
-        hotels = db.query(Hotel).filter(
-            Hotel.city.in_(all_locations) | Hotel.country.in_(all_locations)
-        ).all()
-        
-        flights = db.query(Flight).filter(
-            Flight.destination.in_(all_locations) | Flight.origin.in_(all_locations)
-        ).all()
-        
-        attractions = db.query(Attraction).filter(
-            Attraction.city.in_(all_locations) | Attraction.country.in_(all_locations)
-        ).all()
-    else:
-        # If no locations specified, get all items
-        hotels = db.query(Hotel).all()
-        flights = db.query(Flight).all()
-        attractions = db.query(Attraction).all()
-
-    # Calculate similarity scores using sentence transformers
-    # Get hotels with similarity scores
-    hotel_scores = calculate_similarity_scores(user_preferences, hotels, "hotel")
-    # Sort by similarity score (descending) and take top 6
-    hotel_scores.sort(key=lambda x: x[1], reverse=True)
-    hotels = [h[0] for h in hotel_scores]
-
-    # Get flights with similarity scores
-    flight_scores = calculate_similarity_scores(user_preferences, flights, "flight")
-    # Sort by similarity score (descending) and take top 5
-    flight_scores.sort(key=lambda x: x[1], reverse=True)
-    flights = [f[0] for f in flight_scores]
+    # Rank deep enough to cover the items earlier pages returned plus one more than this page
+    positions = parse_cursor(message.cursor, width=3)
+    limits = {item_type: message.limit or default for item_type, default in CHAT_LIMITS.items()}
+    depths = {item_type: 0 if exhausted(positions, item_type) else
+              (position(positions, item_type) or [0, 0, 0])[2] + limits[item_type] + 1
+              for item_type in CATEGORIES}
     
-    # Get attractions with similarity scores
-    attraction_scores = calculate_similarity_scores(user_preferences, attractions, "attraction")
-    # Sort by similarity score (descending) and take top 6
-    attraction_scores.sort(key=lambda x: x[1], reverse=True)
-    attractions = [a[0] for a in attraction_scores]
-        
-    # except Exception as e:
-    #     print(f"Error calculating similarity scores: {e}")
-    #     # Fallback to simple filtering
-    #     hotels = filter_by_preferences(hotels, user_preferences.lower())
-    #     attractions = filter_by_preferences(attractions, user_preferences.lower())
+    # Locations and structured filters each category is ranked within
+    scope = CategoryQuery(cities=all_locations, countries=all_locations) if all_locations else CategoryQuery()
+    scopes = with_filters({item_type: scope for item_type in CATEGORIES}, message.filters)
+    filtered = any(scope.filtered for scope in scopes.values())
     
-    return RecommendationsResponse(
-        hotels=[HotelResponse(**{k: getattr(h, k) for k in HotelResponse.__fields__.keys()}) for h in hotels],
-        flights=[FlightResponse(**{k: getattr(f, k) for k in FlightResponse.__fields__.keys()}) for f in flights],
-        attractions=[AttractionResponse(**{k: getattr(a, k) for k in AttractionResponse.__fields__.keys()}) for a in attractions],
-        days=days,
-        current_day=1
-    )
+    # Repeated messages for the same trip reuse the cached ranking
+    cache_key = (normalize_message(user_preferences), frozenset(all_locations), days, tuple(depths.values()),
+                 message.filters.model_dump_json() if message.filters else None)
+    ranked = chat_result_cache.get(cache_key)
+    if ranked is None and not model.wait(CHAT_MODEL_WAIT_SECONDS):
+        # Model still loading: rank by word overlap and don't cache the result
+        with span("rank"):
+            ranked = {item_type: lexical_rank_ids(db, CATEGORIES[item_type][0], item_type, user_preferences,
+                                                  scopes[item_type], depth)
+                      for item_type, depth in depths.items() if depth}
+    elif ranked is None:
+        # Encode the message once and rank every category against it
+        with span("encode"):
+            query_embedding = encode_query(user_preferences)
+
+        if (session is not None and original_locations and not message_locations and not filtered
+                and query_embedding is not None):
+            # Same trip as the last turn: only re-rank the candidates cached on the session
+            with span("rank"):
+                ranked = {item_type: session_rank_ids(db, session, CATEGORIES[item_type][0], item_type,
+                                                      query_embedding, user_preferences, depth)
+                          for item_type, depth in depths.items() if depth}
+        else:
+            # Location filter and similarity ranking run together in the vector index
+            with span("rank"):
+                ranked = {item_type: rank_ids(db, CATEGORIES[item_type][0], item_type, query_embedding,
+                                              user_preferences, scopes[item_type], depth)
+                          for item_type, depth in depths.items() if depth}
+        # Unranked fallback results are not worth keeping
+        if query_embedding is not None:
+            chat_result_cache.put(cache_key, ranked)
+
+    # Categories an earlier page exhausted were not ranked and stay exhausted
+    pages, next_positions = {}, {}
+    with span("page"):
+        for item_type in CATEGORIES:
+            pages[item_type], next_positions[item_type] = ranked_page(
+                ranked.get(item_type, []), position(positions, item_type), limits[item_type])
+
+    # One projected query for all three categories, in ranked order
+    with span("db_fetch"):
+        results = fetch_recommendations_sync(
+            db, {item_type: CategoryQuery(ids=[item_id for item_id, _ in page]) for item_type, page in pages.items()})
+
+    if session is not None:
+        # Put back after every turn so the size of newly cached candidates is accounted for
+        chat_sessions.put(session)
+    
+    with span("serialize"):
+        return recommendations_response(results, days=days, current_day=1,
+                                        session_id=session.session_id if session is not None else None,
+                                        next_cursor=encode_cursor(next_positions), fragments=row_fragments)
+
+def query_filters(amenities_all: Optional[List[str]] = Query(None), amenities_any: Optional[List[str]] = Query(None),
+                  categories: Optional[List[str]] = Query(None), min_rating: Optional[float] = Query(None, ge=0, le=5),
+                  min_price: Optional[float] = Query(None, ge=0),
+                  max_price: Optional[float] = Query(None, ge=0)) -> RecommendationFilters:
+    """Structured filters from query parameters; repeat a list parameter for several values"""
+    return RecommendationFilters(amenities_all=amenities_all, amenities_any=amenities_any, categories=categories,
+                                 min_rating=min_rating, min_price=min_price, max_price=max_price)
 
 @app.get("/api/recommendations/day/{day}", response_model=RecommendationsResponse)
-def get_recommendations_for_day(day: int, locations: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_recommendations_for_day(day: int, locations: Optional[str] = None,
+                                      limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                                      cursor: Optional[str] = None,
+                                      filters: RecommendationFilters = Depends(query_filters),
+                                      db: AsyncSession = Depends(get_async_db),
+                                      if_none_match: Optional[str] = Header(None)):
     """Get recommendations for a specific day"""
     loc_list = locations.split(",") if locations else []
     
     if not loc_list:
-        hotels = db.query(Hotel).limit(6).all()
-        flights = db.query(Flight).limit(5).all()
-        attractions = db.query(Attraction).limit(6).all()
+        queries = {item_type: CategoryQuery() for item_type in CATEGORIES}
     else:
-        hotels = db.query(Hotel).filter(
-            Hotel.city.in_(loc_list) | Hotel.country.in_(loc_list)
-        ).limit(6).all()
+        query = CategoryQuery(cities=loc_list, countries=loc_list)
+        queries = {item_type: query for item_type in CATEGORIES}
+    queries = with_filters(queries, filters)
+    positions = parse_cursor(cursor)
+    limits = {item_type: limit or default for item_type, default in CHAT_LIMITS.items()}
+    pages = page_queries(queries, limits, positions)
+    key = response_cache_key("day", pages, day=day)
+    cached = response_cache.get(key)
+    if cached is None:
+        with span("db_fetch"):
+            results, next_positions = split_pages(await fetch_recommendations(db, pages), limits)
+
+        with span("serialize"):
+            body = recommendations_json(results, days=7,  # Assume max days
+                                        current_day=day, next_cursor=encode_cursor(next_positions),
+                                        fragments=row_fragments)
+        cached = response_cache.put(key, body)
+    return cached_response(cached, if_none_match)
+
+def retry_after_headers(retry_after: Optional[float]) -> Optional[dict]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+
+def booking_message(item_type: str, item) -> str:
+    if item_type == "hotel":
+        return f"Hotel {item.name} booked successfully!"
+    if item_type == "flight":
+        return f"Flight {item.airline} from {item.origin} to {item.destination} booked successfully!"
+    return f"Ticket for {item.name} purchased successfully!"
+
+@app.post("/api/book", response_model=BookingResponse)
+async def book_item(request: BookingRequest, response: Response,
+                    idempotency_key: Optional[str] = Header(None, max_length=255),
+                    db: AsyncSession = Depends(get_async_db)):
+    """Book units of an item on its dates; retries with the same Idempotency-Key get the stored booking"""
+    if request.type not in CATEGORIES:
+        raise HTTPException(status_code=400, detail="Invalid booking type")
+    fingerprint = request_hash(request.model_dump(mode="json"))
+    try:
+        if idempotency_key:
+            booking = await replay(db, idempotency_key, fingerprint)
+            if booking is not None:
+                response.headers["Idempotent-Replayed"] = "true"
+                return BookingResponse(success=True, message=booking.message, booking_id=booking.id)
         
-        flights = db.query(Flight).filter(
-            Flight.destination.in_(loc_list) | Flight.origin.in_(loc_list)
-        ).limit(5).all()
+        item = await db.get(CATEGORIES[request.type][0], request.id)
+        if not item:
+            raise HTTPException(status_code=404, detail=f"{request.type.capitalize()} not found")
+        if request.type == "flight":
+            # A flight is booked on the date it departs
+            if request.date and item.departure_date and request.date.isoformat() != item.departure_date:
+                raise HTTPException(status_code=400, detail=f"Flight departs on {item.departure_date}")
+            dates = [item.departure_date or (request.date or datetime.now(timezone.utc).date()).isoformat()]
+        else:
+            today = datetime.now(timezone.utc).date()
+            if request.date and request.date < today:
+                raise HTTPException(status_code=400, detail=f"Can't book a date before {today.isoformat()}")
+            nights = request.nights if request.type == "hotel" else 1
+            dates = booking_dates(request.date or today, nights)
         
-        attractions = db.query(Attraction).filter(
-            Attraction.city.in_(loc_list) | Attraction.country.in_(loc_list)
-        ).limit(6).all()
-    
-    return RecommendationsResponse(
-        hotels=[HotelResponse(**{k: getattr(h, k) for k in HotelResponse.__fields__.keys()}) for h in hotels],
-        flights=[FlightResponse(**{k: getattr(f, k) for k in FlightResponse.__fields__.keys()}) for f in flights],
-        attractions=[AttractionResponse(**{k: getattr(a, k) for k in AttractionResponse.__fields__.keys()}) for a in attractions],
-        days=7,  # Assume max days
-        current_day=day
-    )
+        booking, replayed = await reserve(db, request.type, request.id, dates, request.quantity,
+                                          booking_message(request.type, item), idempotency_key, fingerprint)
+    except BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=retry_after_headers(e.retry_after))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return BookingResponse(success=True, message=booking.message, booking_id=booking.id)
 
-@app.post("/api/book", response_model=BookingResponse)
-def book_item(request: BookingRequest, db: Session = Depends(get_db)):
-    """Handle booking requests"""
-    booking_id = f"{request.type}_{request.id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    
-    if request.type == "hotel":
-        hotel = db.query(Hotel).filter(Hotel.id == request.id).first()
-        if not hotel:
-            raise HTTPException(status_code=404, detail="Hotel not found")
-        return BookingResponse(success=True, message=f"Hotel {hotel.name} booked successfully!", booking_id=booking_id)
-    
-    elif request.type == "flight":
-        flight = db.query(Flight).filter(Flight.id == request.id).first()
-        if not flight:
-            raise HTTPException(status_code=404, detail="Flight not found")
-        return BookingResponse(success=True, message=f"Flight {flight.airline} from {flight.origin} to {flight.destination} booked successfully!", booking_id=booking_id)
-    
-    elif request.type == "attraction":
-        attraction = db.query(Attraction).filter(Attraction.id == request.id).first()
-        if not attraction:
-            raise HTTPException(status_code=404, detail="Attraction not found")
-        return BookingResponse(success=True, message=f"Ticket for {attraction.name} purchased successfully!", booking_id=booking_id)
-    
-    else:
+@app.get("/api/availability/{item_type}/{item_id}", response_model=AvailabilityResponse)
+async def get_availability(item_type: str, item_id: int, start: Optional[date] = None,
+                           days: int = Query(7, ge=1, le=31), db: AsyncSession = Depends(get_async_db)):
+    """Units left per date for an item, from `start` (default today)"""
+    if item_type not in CATEGORIES:
         raise HTTPException(status_code=400, detail="Invalid booking type")
+    dates = booking_dates(start or datetime.now(timezone.utc).date(), days)
+    return AvailabilityResponse(type=item_type, id=item_id, dates=await availability(db, item_type, item_id, dates))
 
 def get_customer_external_id(request: Request) -> str:
     """
@@ -390,9 +740,6 @@ def get_customer_external_id(request: Request) -> str:
 async def create_checkout_session(request: CheckoutSessionRequest, http_request: Request):
     """Create a Flowglad checkout session for hotel booking"""
     try:
-        # Get Flowglad API key from environment
-        flowglad_api_key = os.getenv("FLOWGLAD_API_KEY", "sk_test_8wB6uVgbjqRPNqdi8f9eoB")
-        
         # Get customer external ID
         customer_external_id = request.customer_external_id or get_customer_external_id(http_request)
         
@@ -431,16 +778,7 @@ async def create_checkout_session(request: CheckoutSessionRequest, http_request:
         
 
         # Call Flowglad API
-        url = "https://app.flowglad.com/api/v1/checkout-sessions"
-        headers = {
-            "Authorization": flowglad_api_key,
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        
-        result = response.json()
+        result = await flowglad.create_checkout_session(payload)
         
         # Extract checkout URL from response
         # Flowglad API typically returns the checkout session with a url field
@@ -474,9 +812,10 @@ async def create_checkout_session(request: CheckoutSessionRequest, http_request:
             session_id=session_id
         )
         
-    except requests.exceptions.HTTPError as e:
-        error_detail = f"Flowglad API error: {e.response.text if hasattr(e, 'response') else str(e)}"
-        raise HTTPException(status_code=e.response.status_code if hasattr(e, 'response') else 500, detail=error_detail)
+    except FlowgladError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=retry_after_headers(e.retry_after))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating checkout session: {str(e)}")
 
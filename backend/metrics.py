@@ -0,0 +1,175 @@
+"""
+Per-request stage timings, exported as Prometheus histograms and a Server-Timing header.
+
+TimingMiddleware gives every HTTP request a RequestTimings in a context
+variable, and `with span("stage"):` blocks in the endpoints add their time to
+it. The context is copied into threadpool calls, so sync endpoints record into
+the same object. Spans nest; a stage's time excludes the spans nested in it,
+so the stages of a request add up to at most its total. The stages of one
+request must run one after another (or nested), not concurrently.
+
+The request's stages go out in its Server-Timing header when the response
+starts, and are recorded in histograms per (endpoint, stage) once it ends.
+MetricsRegistry.render() writes them in the Prometheus text format.
+Outside a timed request span() is a shared no-op.
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+
+# METRICS_ENABLED=0 leaves the middleware out, which also turns every span into the no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = tuple(sorted(float(bound) for bound in os.getenv(
+    "METRICS_BUCKETS", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")))
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+_NO_SPAN = nullcontext()
+
+
+class RequestTimings:
+    """Seconds spent per stage by one request"""
+    __slots__ = ("stages", "_nested")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        # Time of the spans nested in each open span, innermost last
+        self._nested = []
+
+
+class _Span:
+    __slots__ = ("timings", "stage", "start")
+
+    def __init__(self, timings: RequestTimings, stage: str):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.timings._nested.append(0.0)
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        timings = self.timings
+        nested = timings._nested.pop()
+        timings.stages[self.stage] = timings.stages.get(self.stage, 0.0) + elapsed - nested
+        if timings._nested:
+            timings._nested[-1] += elapsed
+
+
+def span(stage: str):
+    """Context manager adding the time of its block to `stage` of the current request"""
+    timings = _current.get()
+    if timings is None:
+        return _NO_SPAN
+    return _Span(timings, stage)
+
+
+class Histogram:
+    """Observation counts per bucket (not cumulative) and their sum; the registry holds the lock"""
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+def _labels(**labels) -> str:
+    return ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for name, value in labels.items())
+
+
+class MetricsRegistry:
+    """Request and stage latency histograms of this worker process"""
+
+    def __init__(self, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.buckets = buckets
+        self._requests: Dict[tuple, Histogram] = {}
+        self._stages: Dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, histograms: Dict[tuple, Histogram], key: tuple, seconds: float):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(len(self.buckets) + 1)
+        # Bucket bounds are inclusive (le), the last slot is +Inf
+        histogram.counts[bisect_left(self.buckets, seconds)] += 1
+        histogram.sum += seconds
+
+    def record(self, endpoint: str, method: str, status: int, seconds: float, stages: Dict[str, float]):
+        with self._lock:
+            self._observe(self._requests, (endpoint, method, status), seconds)
+            for stage, stage_seconds in stages.items():
+                self._observe(self._stages, (endpoint, stage), stage_seconds)
+
+    def render(self) -> str:
+        """All histograms in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            requests = {key: (list(h.counts), h.sum) for key, h in self._requests.items()}
+            stages = {key: (list(h.counts), h.sum) for key, h in self._stages.items()}
+        lines = []
+        self._render_family(lines, "travel_agent_request_duration_seconds",
+                            "Time from receiving a request to the end of its response",
+                            {_labels(endpoint=e, method=m, status=s): v for (e, m, s), v in sorted(requests.items())})
+        self._render_family(lines, "travel_agent_stage_duration_seconds",
+                            "Time per request spent in a stage of an endpoint, excluding nested stages",
+                            {_labels(endpoint=e, stage=s): v for (e, s), v in sorted(stages.items())})
+        return "\n".join(lines) + "\n"
+
+    def _render_family(self, lines: list, name: str, help_text: str, series: dict):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+
+def server_timing(stages: Dict[str, float], total: float) -> bytes:
+    """Server-Timing header value, durations in milliseconds"""
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries).encode("latin-1")
+
+
+class TimingMiddleware:
+    """ASGI middleware that times every HTTP request, labelled by its route's path template"""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((b"server-timing", server_timing(timings.stages, perf_counter() - start)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # Unmatched paths share one label, so 404s can't grow the number of series
+            route = scope.get("route")
+            self.registry.record(route.path if route is not None else "unmatched", scope["method"], status,
+                                 perf_counter() - start, timings.stages)
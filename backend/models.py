@@ -1,13 +1,33 @@
-from pydantic import BaseModel
-from typing import List, Optional
+import datetime
+import json
+from pydantic import BaseModel, BeforeValidator, Field
+from typing import Annotated, List, Optional
+
+from pagination import MAX_PAGE_SIZE
+
+class RecommendationFilters(BaseModel):
+    """Structured filters; each applies to the categories that have the field"""
+    amenities_all: Optional[List[str]] = None  # hotels with every one of these
+    amenities_any: Optional[List[str]] = None  # hotels with at least one of these
+    categories: Optional[List[str]] = None  # attraction categories
+    min_rating: Optional[float] = Field(None, ge=0, le=5)  # hotels and attractions
+    min_price: Optional[float] = Field(None, ge=0)  # per night for hotels
+    max_price: Optional[float] = Field(None, ge=0)
 
 class TravelPlanRequest(BaseModel):
     plan: str
     preferences: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)  # per category
+    cursor: Optional[str] = None
+    filters: Optional[RecommendationFilters] = None
 
 class ChatMessage(BaseModel):
     message: str
     current_plan: Optional[str] = None
+    session_id: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)  # per category
+    cursor: Optional[str] = None
+    filters: Optional[RecommendationFilters] = None
 
 class HotelResponse(BaseModel):
     id: int
@@ -61,17 +81,83 @@ class RecommendationsResponse(BaseModel):
     attractions: List[AttractionResponse]
     days: int = 1
     current_day: int = 1
+    session_id: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+# Supplier feed rows (see catalog_import.py). Feeds may give lists where the catalog stores text.
+CommaList = Annotated[str, BeforeValidator(lambda v: ", ".join(map(str, v)) if isinstance(v, list) else v)]
+SupplierId = Annotated[Optional[str], BeforeValidator(lambda v: str(v) if isinstance(v, int) else v)]
+JsonList = Annotated[Optional[str], BeforeValidator(lambda v: json.dumps(v) if isinstance(v, list) else v)]
+
+class HotelRecord(BaseModel):
+    supplier_id: SupplierId = None
+    name: str
+    city: str
+    country: str
+    price_per_night: float = Field(ge=0)
+    rating: float = Field(ge=0, le=5)
+    description: str = ""
+    amenities: CommaList = ""
+    image_url: str = ""
+    address: str = ""
+    booking_link: Optional[str] = None
+    images: JsonList = None
+
+class FlightRecord(BaseModel):
+    supplier_id: SupplierId = None
+    airline: str
+    flight_number: Optional[str] = None
+    origin: str
+    destination: str
+    departure_airport: Optional[str] = None
+    arrival_airport: Optional[str] = None
+    departure_date: str = Field(pattern=r"^\d{4}-\d{2}-\d{2}$")
+    departure_time: str
+    arrival_time: str
+    price: float = Field(ge=0)
+    duration: str = ""
+    stops: int = Field(0, ge=0)
+    flight_class: str = "Economy"
+    booking_link: Optional[str] = None
+
+class AttractionRecord(BaseModel):
+    supplier_id: SupplierId = None
+    name: str
+    city: str
+    country: str
+    category: str
+    description: str = ""
+    price: float = Field(0.0, ge=0)
+    rating: float = Field(ge=0, le=5)
+    image_url: str = ""
+    address: str = ""
+    opening_hours: str = ""
+    ticket_link: Optional[str] = None
+    images: JsonList = None
 
 class BookingRequest(BaseModel):
     type: str  # hotel, flight, or attraction
     id: int
-    date: Optional[str] = None
+    date: Optional[datetime.date] = None  # check-in for hotels; flights book their departure date
+    nights: int = Field(1, ge=1, le=30)  # hotels only
+    quantity: int = Field(1, ge=1, le=10)  # rooms, seats or tickets
 
 class BookingResponse(BaseModel):
     success: bool
     message: str
     booking_id: Optional[str] = None
 
+class DateAvailability(BaseModel):
+    date: datetime.date
+    capacity: int
+    booked: int
+    available: int
+
+class AvailabilityResponse(BaseModel):
+    type: str
+    id: int
+    dates: List[DateAvailability]
+
 class CheckoutSessionRequest(BaseModel):
     hotel_id: int
     customer_external_id: Optional[str] = None
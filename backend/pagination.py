@@ -0,0 +1,58 @@
+"""Opaque keyset cursors for paging recommendation results per category"""
+import base64
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+MAX_PAGE_SIZE = 100
+
+# A cursor maps each item type to the sort key of the last item already returned, or to None
+# once the category is exhausted. Item types missing from a cursor start from the beginning.
+Positions = Dict[str, Optional[list]]
+
+
+def encode_cursor(positions: Positions) -> Optional[str]:
+    """Opaque token for the next page, or None when every category is exhausted"""
+    if all(position is None for position in positions.values()):
+        return None
+    raw = json.dumps(positions, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _valid_position(value, width: int) -> bool:
+    return value is None or (isinstance(value, list) and len(value) == width and all(
+        isinstance(part, (int, float)) and not isinstance(part, bool) for part in value))
+
+
+def decode_cursor(cursor: Optional[str], width: int = 2) -> Optional[Positions]:
+    """
+    Positions encoded in a cursor, each a list of width numbers.
+
+    Raises ValueError for anything that isn't one of ours, including a cursor
+    handed back to an endpoint with a different position layout.
+    """
+    if not cursor:
+        return None
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:  # bad base64, UTF-8 or JSON
+        raise ValueError("Invalid cursor")
+    if not isinstance(positions, dict) or not all(
+            isinstance(key, str) and _valid_position(value, width) for key, value in positions.items()):
+        raise ValueError("Invalid cursor")
+    return positions
+
+
+def exhausted(positions: Optional[Positions], item_type: str) -> bool:
+    return positions is not None and item_type in positions and positions[item_type] is None
+
+
+def position(positions: Optional[Positions], item_type: str) -> Optional[list]:
+    return positions.get(item_type) if positions else None
+
+
+def next_page(items: List[dict], limit: int, key: Callable[[dict], list]) -> Tuple[List[dict], Optional[list]]:
+    """Trim a fetch of limit + 1 items to one page, with the last item's key if more follow"""
+    if len(items) > limit:
+        items = items[:limit]
+        return items, key(items[-1])
+    return items, None
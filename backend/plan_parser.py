@@ -0,0 +1,161 @@
+"""Single-pass parser turning free-text travel plans into structured plans"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Tuple
+
+from cache import LRUCache
+from locations import LocationMatcher, fold_case
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+}
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+
+CURRENCIES = {"$": "USD", "usd": "USD", "dollars": "USD", "€": "EUR", "eur": "EUR", "euros": "EUR",
+              "£": "GBP", "gbp": "GBP", "pounds": "GBP", "¥": "JPY", "jpy": "JPY", "yen": "JPY"}
+
+# Companions that imply a party size when no explicit count is given
+COMPANIONS = {"solo": 1, "alone": 1, "by myself": 1, "my wife": 2, "my husband": 2, "my partner": 2,
+              "my girlfriend": 2, "my boyfriend": 2, "a couple": 2, "my parents": 3, "my family": 4}
+
+_NUMBER = r"\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+_MONTH = r"(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")[a-z]*\.?"
+
+# One alternation with a named group per kind of fact, so a single finditer pass sees them all.
+# Order matters where alternatives overlap: dates and budgets before plain counts. Text is
+# lower-cased up front and the leading lookahead skips positions no alternative can start at,
+# which is much cheaper than re.IGNORECASE trying every branch everywhere.
+PLAN_PATTERN = re.compile(
+    r"(?=[\d$€£¥]|\b[a-z])(?:"
+    r"(?P<iso_date>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|(?P<month_day>\b(?P<md_month>" + _MONTH + r")\s+(?P<md_day>\d{1,2})(?:st|nd|rd|th)?\b)"
+    r"|(?P<day_month>\b(?P<dm_day>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dm_month>" + _MONTH + r")(?![a-z]))"
+    r"|(?P<budget>(?P<cur_pre>[$€£¥])\s?(?P<amount_pre>\d[\d,]*(?:\.\d+)?)(?P<k_pre>k\b)?"
+    r"|\b(?P<amount_post>\d[\d,]*(?:\.\d+)?)(?P<k_post>k)?\s?(?P<cur_post>usd|dollars|eur|euros|gbp|pounds|jpy|yen)\b)"
+    r"|(?P<duration>\b(?P<dur_n>" + _NUMBER + r")\s*-?\s*(?P<dur_unit>days?|weeks?)\b|\bfortnight\b)"
+    r"|(?P<party>\b(?:party|group|family)\s+of\s+(?P<party_of>" + _NUMBER + r")\b"
+    r"|\b(?P<party_n>" + _NUMBER + r")\s+(?:people|persons|adults|travell?ers|guests|friends|of\s+us)\b)"
+    r"|(?P<companion>\b(?:" + "|".join(re.escape(c) for c in COMPANIONS) + r")\b))"
+)
+
+
+@dataclass(frozen=True)
+class TravelPlan:
+    """Structured facts extracted from a travel plan or chat message"""
+    original_plan: str
+    locations: Tuple[str, ...] = ()
+    days: int = 1
+    days_mentioned: bool = False
+    dates: Tuple[date, ...] = ()
+    budget: Optional[float] = None
+    currency: Optional[str] = None
+    party_size: Optional[int] = None
+
+    @property
+    def is_specific(self) -> bool:
+        return len(self.locations) > 0 and self.days > 1
+
+
+def _number(word: str) -> int:
+    return int(word) if word.isdigit() else NUMBER_WORDS[word]
+
+
+def _amount(text: str, thousands: Optional[str]) -> float:
+    value = float(text.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def _month(word: str) -> int:
+    word = word.rstrip(".")
+    return MONTHS.get(word[:4] if word.startswith("sept") else word[:3])
+
+
+def _upcoming(month: int, day: int, today: date) -> Optional[date]:
+    """The next occurrence of month/day on or after today"""
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            return None
+        if candidate >= today:
+            return candidate
+    return candidate
+
+
+def parse_facts(text: str, today: Optional[date] = None) -> dict:
+    """Extract day count, dates, budget and party size in a single regex pass"""
+    today = today or date.today()
+    facts = {"dates": []}
+    for match in PLAN_PATTERN.finditer(fold_case(text)):
+        group = match.group
+        if group("iso_date"):
+            try:
+                facts["dates"].append(date.fromisoformat(group("iso_date")))
+            except ValueError:
+                pass
+        elif group("month_day") or group("day_month"):
+            month = _month(group("md_month") or group("dm_month"))
+            parsed = _upcoming(month, int(group("md_day") or group("dm_day")), today) if month else None
+            if parsed:
+                facts["dates"].append(parsed)
+        elif group("budget"):
+            if "budget" not in facts:
+                if group("amount_pre"):
+                    facts["budget"] = _amount(group("amount_pre"), group("k_pre"))
+                    facts["currency"] = CURRENCIES[group("cur_pre")]
+                else:
+                    facts["budget"] = _amount(group("amount_post"), group("k_post"))
+                    facts["currency"] = CURRENCIES[group("cur_post")]
+        elif group("duration"):
+            # The first duration wins, e.g. "a 7-day trip ... three days in Tokyo" is 7 days
+            if "days" not in facts:
+                if group("dur_n") is None:
+                    facts["days"] = 14
+                else:
+                    n = _number(group("dur_n"))
+                    facts["days"] = n * 7 if group("dur_unit").startswith("week") else n
+        elif group("party"):
+            facts["party_size"] = _number(group("party_of") or group("party_n"))
+        elif group("companion") and "party_size" not in facts:
+            facts["companion"] = COMPANIONS[group("companion")]
+    if "party_size" not in facts and "companion" in facts:
+        facts["party_size"] = facts["companion"]
+    facts.pop("companion", None)
+    facts["dates"] = tuple(sorted(set(facts["dates"])))
+    return facts
+
+
+class TravelPlanParser:
+    """Parses plans into TravelPlan objects, caching results per text and gazetteer version"""
+
+    def __init__(self, matcher: LocationMatcher, cache_size: int = 4096):
+        self.matcher = matcher
+        self.cache = LRUCache(maxsize=cache_size)
+
+    def parse(self, text: str) -> TravelPlan:
+        self.matcher.ensure_fresh()
+        key = (text, self.matcher.version, date.today())
+        plan = self.cache.get(key)
+        if plan is not None:
+            return plan
+        facts = parse_facts(text)
+        plan = TravelPlan(
+            original_plan=text,
+            locations=tuple(self.matcher.extract(text)),
+            days=facts.get("days", 1),
+            days_mentioned="days" in facts,
+            dates=facts["dates"],
+            budget=facts.get("budget"),
+            currency=facts.get("currency"),
+            party_size=facts.get("party_size"),
+        )
+        self.cache.put(key, plan)
+        return plan
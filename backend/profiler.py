@@ -0,0 +1,214 @@
+"""
+On-demand sampling profiler for a running worker, behind an admin token.
+
+A Profile samples the Python stack of every thread of the process with
+sys._current_frames(), from a thread of its own, every `interval` seconds:
+either for a fixed time, or while the next N requests matching a route are
+in flight (ProfilerMiddleware counts them). Nothing runs while no profile is
+active: the sampler thread only exists during a profile, and the middleware
+is one attribute check per request.
+
+Results are collapsed stacks ("thread;outer;...;leaf count", the input of
+flamegraph.pl and speedscope) and a per-function summary of self and total
+samples. Threads blocked waiting, such as an idle event loop or threadpool
+worker, are left out unless `idle` is set. In request mode every thread is
+sampled while a matching request is in flight, so concurrent requests to
+other routes show up too.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Pattern
+
+# Token the X-Admin-Token header must carry; unset turns profiling off and /admin/profile answers 404
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN") or None
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+# Longest profile, and how long a request-mode profile waits for its requests
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+# (end of file path, function) of the innermost Python frame of a thread blocked waiting
+IDLE_LEAVES = (
+    ("/threading.py", "wait"),  # Condition, Event and queue.Queue waits
+    ("/threading.py", "_wait_for_tstate_lock"),  # Thread.join
+    ("/selectors.py", "select"),  # An event loop with nothing to run
+    ("/concurrent/futures/thread.py", "_worker"),  # Executor thread on an empty queue
+    ("/aiosqlite/core.py", "run"),  # Connection thread on an empty queue
+)
+
+
+class ProfilerBusy(Exception):
+    """Another profile is running in this worker"""
+
+
+def _label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profile:
+    """Stack samples of one profiling run"""
+
+    def __init__(self, interval: float, idle: bool = False, route: Optional[str] = None,
+                 path_regex: Optional[Pattern] = None, methods: Optional[set] = None, requests: int = 0):
+        self.interval = interval
+        self.idle = idle
+        self.route = route
+        self.path_regex = path_regex
+        self.methods = methods
+        self.requests = requests
+        self.started = 0
+        self.finished = 0
+        self.in_flight = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._idle_codes: Dict[object, bool] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start = self._end = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._end = time.perf_counter()
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the profiled requests finished or `timeout` passed; True in the first case"""
+        return self._done.wait(timeout)
+
+    def request_started(self, scope) -> bool:
+        """Count a request if it is one of the next N matching the route; called on the event loop"""
+        if self.started >= self.requests or not self.path_regex.match(scope["path"]):
+            return False
+        if self.methods and scope["method"] not in self.methods:
+            return False
+        self.started += 1
+        self.in_flight += 1
+        return True
+
+    def request_finished(self):
+        self.in_flight -= 1
+        self.finished += 1
+        if self.finished >= self.requests:
+            self._done.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            if self.path_regex is None or self.in_flight:
+                self._sample(own)
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                # Fell behind (e.g. the GIL was held); skip the missed samples instead of bursting
+                next_sample, delay = time.perf_counter(), 0
+            self._stop.wait(delay)
+
+    def _is_idle(self, code) -> bool:
+        idle = self._idle_codes.get(code)
+        if idle is None:
+            filename = code.co_filename.replace(os.sep, "/")
+            idle = self._idle_codes[code] = any(filename.endswith(path) and code.co_name == name
+                                                for path, name in IDLE_LEAVES)
+        return idle
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.setdefault(ident, f"thread-{ident}")
+        return name
+
+    def _sample(self, own: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if not self.idle and self._is_idle(frame.f_code):
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            # Threads with the same name (e.g. the threadpool's) share their stacks
+            self.stacks[(self._thread_name(ident), tuple(codes))] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """One "thread;outermost;...;innermost count" line per distinct stack"""
+        labels = {}
+        lines = []
+        for (thread, codes), count in self.stacks.most_common():
+            frames = [labels.get(code) or labels.setdefault(code, _label(code)) for code in reversed(codes)]
+            lines.append(f"{';'.join([thread.replace(';', ':')] + frames)} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def functions(self, top: int) -> List[dict]:
+        """The `top` functions by samples spent in them (self) and in them or their callees (total)"""
+        own, total = Counter(), Counter()
+        for (_, codes), count in self.stacks.items():
+            own[codes[0]] += count
+            for code in set(codes):
+                total[code] += count
+        stack_samples = sum(self.stacks.values()) or 1
+        ranked = sorted(total, key=lambda code: (own[code], total[code]), reverse=True)[:top]
+        return [{"function": _label(code), "self": own[code], "total": total[code],
+                 "self_pct": round(own[code] * 100 / stack_samples, 1),
+                 "total_pct": round(total[code] * 100 / stack_samples, 1)} for code in ranked]
+
+    def report(self, top: int) -> dict:
+        return {"route": self.route, "requests": self.finished if self.path_regex is not None else None,
+                "seconds": round((self._end or time.perf_counter()) - self._start, 3),
+                "interval_ms": self.interval * 1000, "samples": self.samples,
+                "stack_samples": sum(self.stacks.values()), "functions": self.functions(top),
+                "collapsed": self.collapsed().splitlines()}
+
+
+class Profiler:
+    """The worker's profile in progress, at most one at a time"""
+
+    def __init__(self):
+        self.active: Optional[Profile] = None
+        self._lock = threading.Lock()
+
+    def start(self, profile: Profile) -> Profile:
+        with self._lock:
+            if self.active is not None:
+                raise ProfilerBusy("A profile is already running in this worker")
+            self.active = profile
+        profile.start()
+        return profile
+
+    def finish(self, profile: Profile):
+        profile.stop()
+        with self._lock:
+            if self.active is profile:
+                self.active = None
+
+
+class ProfilerMiddleware:
+    """ASGI middleware counting the requests a request-mode profile waits for; a no-op otherwise"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profile = self.profiler.active
+        if profile is None or profile.path_regex is None or scope["type"] != "http" \
+                or not profile.request_started(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.request_finished()
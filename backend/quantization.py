@@ -0,0 +1,84 @@
+"""Compact float16 / int8 storage for normalized embeddings"""
+from typing import Optional
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+
+# Rows scored per block, so upcasting compact codes never allocates a full float32 copy
+SCORE_BLOCK_ROWS = 4096
+
+
+def _encode(vectors: np.ndarray, dtype: str):
+    """(codes, per-row scales or None) of float32 vectors"""
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def with_room(array: np.ndarray, start: int, end: int) -> np.ndarray:
+    """array if it has rows up to end, else a copy of its first start rows with at least twice the room"""
+    if end <= len(array):
+        return array
+    grown = np.empty((max(end, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:start] = array[:start]
+    return grown
+
+
+class QuantizedVectors:
+    """
+    Normalized vectors stored as float32, float16 or int8 codes.
+
+    int8 uses a symmetric per-vector scale (max |x| / 127), so a score is
+    (codes @ query) * scale. Scoring upcasts one block of rows at a time and
+    runs one matmul per block.
+    """
+
+    def __init__(self, vectors: np.ndarray, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype {dtype!r}, expected one of {DTYPES}")
+        self.dtype = dtype
+        self.data, self.scales = _encode(np.asarray(vectors, dtype=np.float32), dtype)
+
+    def extended(self, start: int, vectors: np.ndarray) -> "QuantizedVectors":
+        """
+        Rows [0, start) of these codes followed by the codes of vectors. The storage is
+        shared while it has room (and doubled when it hasn't); rows before start are never
+        written, so readers of this object are unaffected.
+        """
+        data, scales = _encode(np.asarray(vectors, dtype=np.float32), self.dtype)
+        end = start + len(data)
+        extended = QuantizedVectors.__new__(QuantizedVectors)
+        extended.dtype = self.dtype
+        extended.data = with_room(self.data, start, end)
+        extended.data[start:end] = data
+        extended.scales = None
+        if scales is not None:
+            extended.scales = with_room(self.scales, start, end)
+            extended.scales[start:end] = scales
+        return extended
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dot product of every (or every selected) vector with a float32 query"""
+        query = np.asarray(query, dtype=np.float32)
+        data = self.data if positions is None else self.data[positions]
+        if self.dtype == "float32":
+            return data @ query
+        out = np.empty(len(data), dtype=np.float32)
+        for start in range(0, len(data), SCORE_BLOCK_ROWS):
+            block = data[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            out *= self.scales if positions is None else self.scales[positions]
+        return out
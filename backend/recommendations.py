@@ -0,0 +1,309 @@
+"""Recommendation queries that fetch response columns for every category in one round trip"""
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, exists, func, literal_column, null, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from amenities import normalize_amenity
+from database import Amenity, Hotel, HotelAmenity, Flight, Attraction, page_order
+from models import HotelResponse, FlightResponse, AttractionResponse, RecommendationFilters
+from pagination import Positions, exhausted, next_page, position
+
+# item type -> (catalog model, response model), in the order categories are returned
+CATEGORIES = {
+    "hotel": (Hotel, HotelResponse),
+    "flight": (Flight, FlightResponse),
+    "attraction": (Attraction, AttractionResponse),
+}
+
+# item type -> (city-like column, country-like column) the location filters apply to
+LOCATION_COLUMNS = {
+    "hotel": (Hotel.city, Hotel.country),
+    "flight": (Flight.destination, Flight.origin),
+    "attraction": (Attraction.city, Attraction.country),
+}
+
+
+# Columns the structured filters apply to; categories without one ignore that filter
+PRICE_COLUMNS = {"hotel": Hotel.price_per_night, "flight": Flight.price, "attraction": Attraction.price}
+RATING_COLUMNS = {"hotel": Hotel.rating, "attraction": Attraction.rating}
+CATEGORY_COLUMNS = {"attraction": Attraction.category}
+AMENITY_TYPES = {"hotel"}
+
+# item type -> (sort field, descending); ties are broken by id, so pages are stable
+SORT_ORDER = {
+    "hotel": ("rating", True),
+    "flight": ("price", False),
+    "attraction": ("rating", True),
+}
+
+
+@dataclass(frozen=True)
+class CategoryQuery:
+    """
+    Rows of one category to fetch.
+
+    Rows match cities OR countries (destinations and origins for flights)
+    and every structured filter that is set (see with_filters).
+    ids restricts to those rows and also fixes the order of the results;
+    otherwise rows come in SORT_ORDER, starting after the (sort value, id)
+    key in after.
+    """
+    cities: Optional[Sequence[str]] = None
+    countries: Optional[Sequence[str]] = None
+    limit: Optional[int] = None
+    ids: Optional[Sequence[int]] = None
+    after: Optional[Sequence] = None
+    amenities_all: Optional[Sequence[str]] = None
+    amenities_any: Optional[Sequence[str]] = None
+    categories: Optional[Sequence[str]] = None
+    min_rating: Optional[float] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    @property
+    def shape(self) -> tuple:
+        """Names of the set fields, which is all the SQL depends on"""
+        return tuple(field.name for field in fields(self) if getattr(self, field.name) is not None)
+
+    @property
+    def filtered(self) -> bool:
+        """Whether any structured filter is set"""
+        return any(name in FILTER_FIELDS for name in self.shape)
+
+
+FILTER_FIELDS = ("amenities_all", "amenities_any", "categories", "min_rating", "min_price", "max_price")
+_LIST_FIELDS = ("cities", "countries", "ids", "amenities_all", "amenities_any", "categories")
+
+
+def _fold(names: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    folded = tuple(dict.fromkeys(normalize_amenity(name) for name in names or ()))
+    return folded or None
+
+
+def with_filters(queries: Dict[str, CategoryQuery],
+                 filters: Optional[RecommendationFilters]) -> Dict[str, CategoryQuery]:
+    """Add the structured filters that apply to each category to its query"""
+    if filters is None:
+        return queries
+    filtered = {}
+    for item_type, query in queries.items():
+        changes = {"min_price": filters.min_price, "max_price": filters.max_price}
+        if item_type in AMENITY_TYPES:
+            changes.update(amenities_all=_fold(filters.amenities_all), amenities_any=_fold(filters.amenities_any))
+        if item_type in RATING_COLUMNS:
+            changes["min_rating"] = filters.min_rating
+        if item_type in CATEGORY_COLUMNS:
+            changes["categories"] = _fold(filters.categories)
+        filtered[item_type] = replace(query, **changes)
+    return filtered
+
+
+def sort_key(item_type: str, item: dict) -> list:
+    """Keyset position of an item: [sort value, id]"""
+    return [item[SORT_ORDER[item_type][0]] or 0.0, item["id"]]
+
+
+def _sort_expression(item_type: str):
+    model_cls, _ = CATEGORIES[item_type]
+    return page_order(getattr(model_cls, SORT_ORDER[item_type][0]))
+
+
+def response_columns(item_type: str) -> list:
+    """Catalog columns backing the fields of the category's response model"""
+    model_cls, response_cls = CATEGORIES[item_type]
+    return [getattr(model_cls, name) for name in response_cls.model_fields]
+
+
+_WIDTH = max(len(response_columns(item_type)) for item_type in CATEGORIES)
+
+
+def _conditions(item_type: str, shape: tuple) -> list:
+    """WHERE clauses for the location, id and structured filters in a query shape"""
+    model_cls, _ = CATEGORIES[item_type]
+    city_column, country_column = LOCATION_COLUMNS[item_type]
+
+    def param(name: str, expanding: bool = False):
+        return bindparam(f"{item_type}_{name}", expanding=expanding)
+
+    conditions = []
+    location = []
+    if "cities" in shape:
+        location.append(city_column.in_(param("cities", True)))
+    if "countries" in shape:
+        location.append(country_column.in_(param("countries", True)))
+    if location:
+        conditions.append(or_(*location))
+    if "ids" in shape:
+        conditions.append(model_cls.id.in_(param("ids", True)))
+    # With a location or ids narrowing the rows, checking each row's amenities through the
+    # (hotel_id, amenity_id) key is cheapest; otherwise the hotels having the amenities are
+    # collected once through the (amenity_id, hotel_id) index
+    narrowed = any(name in shape for name in ("cities", "countries", "ids"))
+    if "amenities_all" in shape:
+        wanted = select(Amenity.id).where(Amenity.name.in_(param("amenities_all", True)))
+        if narrowed:
+            linked = (select(func.count()).where(HotelAmenity.hotel_id == model_cls.id,
+                                                 HotelAmenity.amenity_id.in_(wanted)).scalar_subquery())
+            conditions.append(linked == param("amenities_all_count"))
+        else:
+            # Unary + keeps SQLite from walking the whole (hotel_id, amenity_id) key to skip the GROUP BY sort
+            with_all = (select(HotelAmenity.hotel_id).where(HotelAmenity.amenity_id.in_(wanted))
+                        .group_by(literal_column("+hotel_amenities.hotel_id"))
+                        .having(func.count() == param("amenities_all_count")))
+            conditions.append(model_cls.id.in_(with_all))
+    if "amenities_any" in shape:
+        wanted = select(Amenity.id).where(Amenity.name.in_(param("amenities_any", True)))
+        if narrowed:
+            conditions.append(exists().where(HotelAmenity.hotel_id == model_cls.id,
+                                             HotelAmenity.amenity_id.in_(wanted)))
+        else:
+            conditions.append(model_cls.id.in_(select(HotelAmenity.hotel_id).where(HotelAmenity.amenity_id.in_(wanted))))
+    if "categories" in shape:
+        conditions.append(CATEGORY_COLUMNS[item_type].in_(param("categories", True)))
+    if "min_rating" in shape:
+        conditions.append(RATING_COLUMNS[item_type] >= param("min_rating"))
+    if "min_price" in shape:
+        conditions.append(PRICE_COLUMNS[item_type] >= param("min_price"))
+    if "max_price" in shape:
+        conditions.append(PRICE_COLUMNS[item_type] <= param("max_price"))
+    return conditions
+
+
+def _branch(kind: int, item_type: str, shape: tuple):
+    model_cls, _ = CATEGORIES[item_type]
+    columns = response_columns(item_type)
+    padding = [null().label(f"pad_{i}") for i in range(len(columns), _WIDTH)]
+    branch = select(literal_column(str(kind)).label("kind"), *columns, *padding)
+    conditions = _conditions(item_type, shape)
+    if conditions:
+        branch = branch.where(*conditions)
+    has_limit, has_ids = "limit" in shape, "ids" in shape
+    if not has_ids:
+        sort, descending = _sort_expression(item_type), SORT_ORDER[item_type][1]
+        if "after" in shape:
+            value, after_id = bindparam(f"{item_type}_after_value"), bindparam(f"{item_type}_after_id")
+            # The first clause bounds a range on the page order index; the OR alone can't
+            reached, beyond = (sort <= value, sort < value) if descending else (sort >= value, sort > value)
+            branch = branch.where(reached, or_(beyond, model_cls.id > after_id))
+        branch = branch.order_by(sort.desc() if descending else sort, model_cls.id)
+    if has_limit:
+        branch = branch.limit(bindparam(f"{item_type}_limit"))
+    if has_limit or not has_ids:
+        # SQLite only allows ORDER BY and LIMIT on a compound member inside a subquery
+        branch = select(branch.subquery())
+    return branch
+
+
+@lru_cache(maxsize=256)
+def recommendations_statement(shapes: Tuple[Tuple[str, tuple], ...]):
+    """
+    UNION ALL of one projected SELECT per category, built once per query shape.
+
+    Each branch starts with the category's index and is padded with NULLs to
+    a common width, so hotels, flights and attractions come back from a
+    single statement as plain tuples. Values are bound parameters, so the
+    statement (and SQLAlchemy's compiled form of it) is reused across requests.
+    """
+    branches = [_branch(kind, item_type, shape) for kind, (item_type, shape) in enumerate(shapes)]
+    return union_all(*branches) if len(branches) > 1 else branches[0]
+
+
+@lru_cache(maxsize=256)
+def ids_statement(item_type: str, shape: tuple):
+    """SELECT of the ids matching a query's filters, e.g. to restrict similarity search"""
+    model_cls, _ = CATEGORIES[item_type]
+    return select(model_cls.id).where(*_conditions(item_type, shape))
+
+
+def statement_params(queries: Dict[str, CategoryQuery]) -> dict:
+    params = {}
+    for item_type, query in queries.items():
+        for name in query.shape:
+            value = getattr(query, name)
+            if name == "after":
+                params[f"{item_type}_after_value"], params[f"{item_type}_after_id"] = value
+            else:
+                params[f"{item_type}_{name}"] = list(value) if name in _LIST_FIELDS else value
+        if query.amenities_all is not None:
+            params[f"{item_type}_amenities_all_count"] = len(query.amenities_all)
+    return params
+
+
+def _statement(queries: Dict[str, CategoryQuery]):
+    return recommendations_statement(tuple((item_type, query.shape) for item_type, query in queries.items()))
+
+
+def map_rows(rows, queries: Dict[str, CategoryQuery]) -> Dict[str, List[dict]]:
+    """
+    Split UNION rows by category into plain dicts keyed by response field.
+
+    Rows come from typed catalog columns, so they are trusted as is rather
+    than validated into response models again.
+    """
+    item_types = list(queries)
+    fields = [tuple(CATEGORIES[item_type][1].model_fields) for item_type in item_types]
+    results: List[List[dict]] = [[] for _ in item_types]
+    for row in rows:
+        kind = row[0]
+        names = fields[kind]
+        results[kind].append(dict(zip(names, row[1:len(names) + 1])))
+    mapped = dict(zip(item_types, results))
+    for item_type, query in queries.items():
+        if query.ids is not None:
+            mapped[item_type] = order_by_ids(mapped[item_type], query.ids)
+        else:
+            # Compound SELECTs don't promise to keep each member's order, so restore it here
+            field, descending = SORT_ORDER[item_type]
+            sign = -1 if descending else 1
+            mapped[item_type].sort(key=lambda item: (sign * (item[field] or 0.0), item["id"]))
+    return mapped
+
+
+def order_by_ids(items: List[dict], ids: Sequence[int]) -> List[dict]:
+    """Reorder items to follow ids, e.g. a similarity ranking"""
+    by_id = {item["id"]: item for item in items}
+    return [by_id[item_id] for item_id in ids if item_id in by_id]
+
+
+def page_queries(queries: Dict[str, CategoryQuery], limits: Dict[str, int],
+                 positions: Optional[Positions]) -> Dict[str, CategoryQuery]:
+    """Queries for one page: limit + 1 rows per category after its cursor position"""
+    return {item_type: replace(query, limit=limits[item_type] + 1, after=position(positions, item_type))
+            for item_type, query in queries.items() if not exhausted(positions, item_type)}
+
+
+def split_pages(results: Dict[str, List[dict]], limits: Dict[str, int]) -> Tuple[Dict[str, List[dict]], Positions]:
+    """Trim page_queries results to the page size and compute the next cursor positions"""
+    pages, positions = {}, {}
+    for item_type in CATEGORIES:
+        pages[item_type], positions[item_type] = next_page(
+            results.get(item_type, []), limits[item_type], lambda item: sort_key(item_type, item))
+    return pages, positions
+
+
+def _skip_empty(queries: Dict[str, CategoryQuery]) -> Dict[str, CategoryQuery]:
+    return {item_type: query for item_type, query in queries.items() if query.ids is None or len(query.ids) > 0}
+
+
+async def fetch_recommendations(db: AsyncSession, queries: Dict[str, CategoryQuery]) -> Dict[str, List[dict]]:
+    """Run every category query as one statement on an async session"""
+    active = _skip_empty(queries)
+    rows = (await db.execute(_statement(active), statement_params(active))).all() if active else []
+    return {item_type: [] for item_type in queries} | map_rows(rows, active)
+
+
+def fetch_ids_sync(db: Session, item_type: str, query: CategoryQuery) -> set:
+    """Ids of the rows matching a query's location and structured filters"""
+    rows = db.execute(ids_statement(item_type, query.shape), statement_params({item_type: query}))
+    return {row[0] for row in rows}
+
+
+def fetch_recommendations_sync(db: Session, queries: Dict[str, CategoryQuery]) -> Dict[str, List[dict]]:
+    """Run every category query as one statement on a sync session"""
+    active = _skip_empty(queries)
+    rows = db.execute(_statement(active), statement_params(active)).all() if active else []
+    return {item_type: [] for item_type in queries} | map_rows(rows, active)
@@ -0,0 +1,95 @@
+"""JSON encoding fast path for recommendation responses"""
+import json
+from typing import Dict, List, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder produces the same JSON, just slower
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+# Response keys per item type, in RecommendationsResponse field order
+RESPONSE_KEYS = {"hotel": "hotels", "flight": "flights", "attraction": "attractions"}
+
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class RowFragments:
+    """
+    Encoded JSON per catalog row, so hot rows are serialized once rather than per response.
+
+    Entries are keyed by (item type, id); changed rows are discarded as the
+    catalog change feed reports them, and the whole map is dropped when it
+    grows past maxsize.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._fragments: Dict[tuple, bytes] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def clear(self, *args):
+        self._fragments = {}
+
+    def discard(self, item_type: str, ids):
+        fragments = self._fragments
+        for item_id in ids:
+            fragments.pop((item_type, item_id), None)
+
+    def encode(self, item_type: str, items: List[dict]) -> bytes:
+        """JSON array of items, reusing cached fragments"""
+        fragments = self._fragments
+        parts = []
+        for item in items:
+            key = (item_type, item["id"])
+            fragment = fragments.get(key)
+            if fragment is None:
+                self.misses += 1
+                fragment = dumps(item)
+                if len(fragments) >= self.maxsize:
+                    fragments = self._fragments = {}
+                fragments[key] = fragment
+            else:
+                self.hits += 1
+            parts.append(fragment)
+        return b"[" + b",".join(parts) + b"]"
+
+
+def recommendations_json(results: Dict[str, List[dict]], days: int = 1, current_day: int = 1,
+                         session_id: Optional[str] = None, next_cursor: Optional[str] = None,
+                         fragments: Optional[RowFragments] = None) -> bytes:
+    """Encode a RecommendationsResponse body from trusted row dicts, without building models"""
+    tail = {"days": days, "current_day": current_day, "session_id": session_id, "next_cursor": next_cursor}
+    if fragments is None:
+        body = {key: results[item_type] for item_type, key in RESPONSE_KEYS.items()}
+        body.update(tail)
+        return dumps(body)
+    parts = [b'"%s":%s' % (key.encode(), fragments.encode(item_type, results[item_type]))
+             for item_type, key in RESPONSE_KEYS.items()]
+    tail = dumps(tail)
+    return b"{" + b",".join(parts) + b"," + tail[1:]
+
+
+def recommendations_response(results: Dict[str, List[dict]], days: int = 1, current_day: int = 1,
+                             session_id: Optional[str] = None, next_cursor: Optional[str] = None,
+                             fragments: Optional[RowFragments] = None) -> Response:
+    """
+    Pre-encoded response for endpoints declared with response_model=RecommendationsResponse.
+
+    Returning a Response makes FastAPI skip validating and re-encoding the body;
+    the response model still documents the schema.
+    """
+    body = recommendations_json(results, days, current_day, session_id, next_cursor, fragments)
+    return Response(content=body, media_type="application/json")
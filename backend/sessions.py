@@ -0,0 +1,109 @@
+"""Server-side chat sessions, so follow-up messages only re-rank cached candidates"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from plan_parser import TravelPlan
+
+
+@dataclass
+class ChatSession:
+    """A parsed plan plus the candidate rows and vectors resolved for its locations"""
+    session_id: str
+    plan: TravelPlan
+    # item type -> (candidate ids, their normalized vectors)
+    candidates: Dict[str, Tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+    # Catalog and embedding versions the candidates were resolved against
+    catalog_version: Optional[Tuple[int, int]] = None
+    last_seen: float = field(default_factory=time.monotonic)
+    # Guards candidates and catalog_version, which concurrent requests of the session update together
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(ids.nbytes + vectors.nbytes for ids, vectors in self.candidates.values())
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+class SessionStore:
+    """Interface for session storage; an out-of-process store (e.g. Redis) can implement it"""
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        raise NotImplementedError
+
+    def put(self, session: ChatSession):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessions held in this process, least recently used first.
+
+    Bounded by session count and by the bytes of cached candidate vectors;
+    sessions idle for longer than idle_seconds are dropped.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_bytes: int = 256 * 2**20, idle_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # Size recorded at put time; sessions are mutated in place and put again
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_seen = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def put(self, session: ChatSession):
+        with self._lock:
+            self._remove(session.session_id)
+            session.last_seen = time.monotonic()
+            self._sessions[session.session_id] = session
+            self._sizes[session.session_id] = session.nbytes
+            self._bytes += session.nbytes
+            self._evict_idle()
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._sessions)))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id: str):
+        if self._sessions.pop(session_id, None) is not None:
+            self._bytes -= self._sizes.pop(session_id)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_seen >= cutoff:
+                break
+            self._remove(oldest.session_id)
@@ -0,0 +1,258 @@
+"""Approximate nearest-neighbour search over catalog embeddings"""
+import copy
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from quantization import QuantizedVectors, with_room
+
+# Below this many vectors an exact scan is faster than probing clusters
+BRUTE_FORCE_THRESHOLD = 2048
+KMEANS_ITERATIONS = 10
+
+# In-memory scoring precision: float32, float16 or int8
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+# Re-score the top k * EMBEDDING_RERANK compact-score candidates in float32 (0 disables)
+EMBEDDING_RERANK = int(os.getenv("EMBEDDING_RERANK", "4"))
+# Re-cluster from scratch once this fraction of an index was assigned to the clusters of an older one
+VECTOR_INDEX_RECLUSTER_FRACTION = float(os.getenv("VECTOR_INDEX_RECLUSTER_FRACTION", "0.2"))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = KMEANS_ITERATIONS,
+                     seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Cluster unit vectors by cosine similarity, returning (centroids, assignments)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Re-seed empty clusters so every list stays usable
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms[empty] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32), assignments
+
+
+def _cluster_lists(assignments: np.ndarray, n_lists: int) -> List[np.ndarray]:
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+
+def _appended(array: np.ndarray, start: int, values: np.ndarray) -> np.ndarray:
+    """array with values written from start on, sharing its storage while it has room"""
+    array = with_room(array, start, start + len(values))
+    array[start:start + len(values)] = values
+    return array
+
+
+class VectorIndex:
+    """
+    Inverted-file (IVF) index over normalized vectors.
+
+    Vectors are grouped into clusters around k-means centroids; a query only
+    scores the members of its n_probe closest clusters. Small indexes skip
+    clustering entirely and are searched exactly.
+
+    Scoring runs on a compact copy (see QuantizedVectors); with a float16 or
+    int8 copy the best candidates are re-scored against the float32 vectors,
+    which stay memory-mapped and are only paged in for those rows.
+
+    Entry i of the index (a slot) is ids[i] with the vector vectors[rows[i]];
+    rows defaults to 0..n-1, and lets an index search the embedding store's
+    whole matrix in place. updated() applies a change without touching the
+    unchanged slots, see there.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, n_lists: Optional[int] = None,
+                 n_probe: int = 16, brute_force_threshold: int = BRUTE_FORCE_THRESHOLD,
+                 dtype: str = EMBEDDING_DTYPE, rerank: int = EMBEDDING_RERANK, rows: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        if rows is None:
+            self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            self.rows = np.arange(len(self.ids), dtype=np.int64)
+            own = self.vectors
+        else:
+            self.vectors = vectors
+            self.rows = np.asarray(rows, dtype=np.int64)
+            own = np.ascontiguousarray(vectors[self.rows], dtype=np.float32)
+        # A float32 copy would only duplicate the vectors, so it scores them directly by row
+        self.compact = QuantizedVectors(self.vectors if dtype == "float32" else own, dtype)
+        self.rerank = rerank
+        self.n_probe = n_probe
+        self.brute_force_threshold = brute_force_threshold
+        # Slots in use, and how many of them hold a current vector
+        self.size = self.count = len(self.ids)
+        self.exact = self.count < brute_force_threshold
+        # id -> slot; shared with the indexes derived by updated(), which only ever add later slots
+        self._positions = {int(item_id): pos for pos, item_id in enumerate(self.ids)}
+        self.live = np.arange(self.size, dtype=np.int64) if self.exact else None
+        self.centroids = None
+        self.assignments = None
+        # Slots assigned to centroids clustered from other vectors
+        self.reassigned = 0
+        self.lists: List[np.ndarray] = []
+        if not self.exact:
+            n_lists = n_lists or max(1, int(np.sqrt(self.count)))
+            self.centroids, self.assignments = spherical_kmeans(own, n_lists)
+            self.lists = _cluster_lists(self.assignments, n_lists)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def updated(self, ids: np.ndarray, rows: np.ndarray, removed: Set[int]) -> Optional["VectorIndex"]:
+        """
+        Index after a change: ids now have the vectors in rows of the same
+        matrix, removed ids are gone. Changed ids get new slots and join their
+        nearest centroid, and only the cluster lists they leave or join are
+        rebuilt, so the cost follows the change rather than the index; this
+        index keeps working. Returns None when a rebuild is due instead: the
+        index would cross brute_force_threshold, or dead slots outnumber live ones.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        positions = self._positions
+        dead = {positions[item_id] for item_id in removed if item_id in positions}
+        dead.update(positions[item_id] for item_id in ids.tolist() if item_id in positions)
+        count = self.count - len(dead) + len(ids)
+        start, end = self.size, self.size + len(ids)
+        if (count < self.brute_force_threshold) != self.exact or end - count > max(count, self.brute_force_threshold):
+            return None
+
+        index = copy.copy(self)
+        index.ids = _appended(self.ids, start, ids)
+        index.rows = _appended(self.rows, start, rows)
+        if self.compact.dtype != "float32":
+            index.compact = self.compact.extended(start, self.vectors[rows])
+        index.size, index.count = end, count
+        for item_id in removed:
+            positions.pop(item_id, None)
+        positions.update(zip(ids.tolist(), range(start, end)))
+
+        dead = np.fromiter(dead, dtype=np.int64, count=len(dead))
+        slots = np.arange(start, end, dtype=np.int64)
+        if self.exact:
+            index.live = np.concatenate([self.live[~np.isin(self.live, dead)], slots])
+            return index
+        assignments = np.argmax(self.vectors[rows] @ self.centroids.T, axis=1) if len(ids) else slots
+        index.assignments = _appended(self.assignments, start, assignments)
+        index.lists = list(self.lists)
+        for cluster in set(self.assignments[dead].tolist()) | set(assignments.tolist()):
+            members = self.lists[cluster]
+            index.lists[cluster] = np.concatenate([members[~np.isin(members, dead)], slots[assignments == cluster]])
+        index.reassigned = self.reassigned + len(ids)
+        return index
+
+    def vectors_for(self, ids: Set[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy out (ids, float32 vectors) for the given ids that are in the index, in id order"""
+        positions = self._allowed_positions(ids)
+        # Slots follow ids only until updated() gives changed ids new slots
+        positions = positions[np.argsort(self.ids[positions], kind="stable")]
+        return self.ids[positions], np.ascontiguousarray(self.vectors[self.rows[positions]])
+
+    def _allowed_positions(self, allowed_ids: Set[int]) -> np.ndarray:
+        # Slots past size belong to indexes derived from this one
+        positions = [pos for pos in map(self._positions.get, allowed_ids) if pos is not None and pos < self.size]
+        return np.array(sorted(positions), dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int, allowed_ids: Optional[Set[int]] = None,
+               n_probe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return up to k (id, score) pairs, best first, restricted to allowed_ids if given"""
+        if self.count == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        allowed_positions = None
+        if allowed_ids is not None:
+            allowed_positions = self._allowed_positions(allowed_ids)
+            # A selective filter leaves few enough rows to score exactly
+            if self.exact or len(allowed_positions) < BRUTE_FORCE_THRESHOLD:
+                return self._score(query, allowed_positions, k)
+        elif self.exact:
+            return self._score(query, self.live, k)
+
+        n_probe = min(n_probe or self.n_probe, len(self.lists))
+        probes = top_k(self.centroids @ query, n_probe)
+        candidates = np.concatenate([self.lists[p] for p in probes])
+        if allowed_positions is not None:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[allowed_positions] = True
+            candidates = candidates[mask[candidates]]
+        return self._score(query, candidates, k)
+
+    def _score(self, query: np.ndarray, positions: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if positions.size == 0:
+            return []
+        if self.compact.dtype == "float32":
+            scores = self.compact.scores(query, self.rows[positions])
+        else:
+            scores = self.compact.scores(query, positions)
+            if self.rerank:
+                shortlist = positions[top_k(scores, k * self.rerank)]
+                positions, scores = shortlist, self.vectors[self.rows[shortlist]] @ query
+        best = top_k(scores, k)
+        return [(int(self.ids[positions[i]]), float(scores[i])) for i in best]
+
+
+class CatalogIndex:
+    """
+    One VectorIndex per item type over the embedding store's matrix, kept in
+    step with the store.
+
+    The ids whose vectors changed since an index was built come from the
+    store (EmbeddingStore.changed_rows) and are applied with
+    VectorIndex.updated, so a catalog update costs its own rows rather than a
+    pass over the catalog. The clusters are rebuilt once
+    VECTOR_INDEX_RECLUSTER_FRACTION of an index was assigned that way, and
+    the whole index when the store can't say what changed (e.g. after it
+    wrote its matrix again).
+    """
+
+    def __init__(self, store: EmbeddingStore, n_probe: int = 16,
+                 recluster_fraction: float = VECTOR_INDEX_RECLUSTER_FRACTION):
+        self.store = store
+        self.n_probe = n_probe
+        self.recluster_fraction = recluster_fraction
+        self._lock = threading.Lock()
+        # item type -> (store version, index)
+        self._indexes: Dict[str, Tuple[int, VectorIndex]] = {}
+
+    def get(self, item_type: str) -> VectorIndex:
+        with self._lock:
+            cached = self._indexes.get(item_type)
+            if cached is not None and cached[0] == self.store.version:
+                return cached[1]
+            index = None
+            if cached is not None:
+                changes = self.store.changed_rows(item_type, cached[0])
+                if changes is not None:
+                    version, ids, rows, removed = changes
+                    index = cached[1].updated(ids, rows, removed) if len(ids) or removed else cached[1]
+                    if index is not None and index.reassigned > self.recluster_fraction * len(index):
+                        index = None
+            if index is None:
+                version, ids, rows, matrix = self.store.layout(item_type)
+                index = VectorIndex(ids, matrix, n_probe=self.n_probe, rows=rows)
+            self._indexes[item_type] = (version, index)
+            return index
+
+    def search(self, item_type: str, query: np.ndarray, k: int,
+               allowed_ids: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        return self.get(item_type).search(query, k, allowed_ids)
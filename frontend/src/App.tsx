@@ -12,6 +12,9 @@ function App() {
   const [currentDay, setCurrentDay] = useState(1);
   const [isLoading, setIsLoading] = useState(false);
   const [chatbotOpen, setChatbotOpen] = useState(false);
+  // Message behind the current results, so "Load more" pages the same query (null: the plan itself)
+  const [lastMessage, setLastMessage] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   const handlePlanSubmit = async (plan: string) => {
     setIsLoading(true);
@@ -19,6 +22,7 @@ function App() {
     try {
       const data = await api.processTravelPlan(plan);
       setRecommendations(data);
+      setLastMessage(null);
       setCurrentDay(1);
     } catch (error) {
       console.error('Error processing travel plan:', error);
@@ -30,13 +34,36 @@ function App() {
 
   const handleChatMessage = async (message: string) => {
     try {
-      const data = await api.chatWithAgent(message, currentPlan);
+      const data = await api.chatWithAgent(message, currentPlan, recommendations?.session_id);
       setRecommendations(data);
+      setLastMessage(message);
     } catch (error) {
       console.error('Error chatting with agent:', error);
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!recommendations?.next_cursor) return;
+    setIsLoadingMore(true);
+    try {
+      const cursor = recommendations.next_cursor;
+      const data = lastMessage === null
+        ? await api.processTravelPlan(currentPlan, undefined, cursor)
+        : await api.chatWithAgent(lastMessage, currentPlan, recommendations.session_id, cursor);
+      setRecommendations({
+        ...recommendations,
+        hotels: [...recommendations.hotels, ...data.hotels],
+        flights: [...recommendations.flights, ...data.flights],
+        attractions: [...recommendations.attractions, ...data.attractions],
+        next_cursor: data.next_cursor,
+      });
+    } catch (error) {
+      console.error('Error loading more recommendations:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleDayChange = async (day: number) => {
     setCurrentDay(day);
     // You can fetch day-specific recommendations here if needed
@@ -80,6 +107,9 @@ function App() {
         days={recommendations.days}
         currentDay={currentDay}
         onDayChange={handleDayChange}
+        hasMore={!!recommendations.next_cursor}
+        isLoadingMore={isLoadingMore}
+        onLoadMore={handleLoadMore}
       />
       <Chatbot
         onMessage={handleChatMessage}
@@ -3,27 +3,30 @@ import type { Recommendations, BookingResponse } from './types';
 const API_BASE_URL = 'http://localhost:8000';
 
 export const api = {
-  async processTravelPlan(plan: string, preferences?: string): Promise<Recommendations> {
+  async processTravelPlan(plan: string, preferences?: string, cursor?: string, limit?: number): Promise<Recommendations> {
     const response = await fetch(`${API_BASE_URL}/api/travel-plan`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ plan, preferences }),
+      body: JSON.stringify({ plan, preferences, cursor, limit }),
     });
     if (!response.ok) {
       throw new Error('Failed to process travel plan');
     }
-    return response.json();
+    const data: Recommendations = await response.json();
+    // The chat session comes in a header, so the body stays the same for every client
+    const sessionId = response.headers.get('X-Session-Id');
+    return sessionId ? { ...data, session_id: sessionId } : data;
   },
 
-  async chatWithAgent(message: string, currentPlan?: string): Promise<Recommendations> {
+  async chatWithAgent(message: string, currentPlan?: string, sessionId?: string, cursor?: string, limit?: number): Promise<Recommendations> {
     const response = await fetch(`${API_BASE_URL}/api/chat`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ message, current_plan: currentPlan }),
+      body: JSON.stringify({ message, current_plan: currentPlan, session_id: sessionId, cursor, limit }),
     });
     if (!response.ok) {
       throw new Error('Failed to chat with agent');
@@ -31,11 +34,17 @@ export const api = {
     return response.json();
   },
 
-  async getRecommendationsForDay(day: number, locations?: string): Promise<Recommendations> {
+  async getRecommendationsForDay(day: number, locations?: string, cursor?: string, limit?: number): Promise<Recommendations> {
     const url = new URL(`${API_BASE_URL}/api/recommendations/day/${day}`);
     if (locations) {
       url.searchParams.append('locations', locations);
     }
+    if (cursor) {
+      url.searchParams.append('cursor', cursor);
+    }
+    if (limit) {
+      url.searchParams.append('limit', String(limit));
+    }
     const response = await fetch(url.toString());
     if (!response.ok) {
       throw new Error('Failed to get recommendations');
@@ -44,17 +53,34 @@ export const api = {
   },
 
   async bookItem(type: 'hotel' | 'flight' | 'attraction', id: number, date?: string): Promise<BookingResponse> {
-    const response = await fetch(`${API_BASE_URL}/api/book`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ type, id, date }),
-    });
-    if (!response.ok) {
-      throw new Error('Failed to book item');
+    // One key for every attempt, so a retry after a lost response can't book twice
+    const idempotencyKey = crypto.randomUUID();
+    for (let attempt = 0; ; attempt++) {
+      let response: Response;
+      try {
+        response = await fetch(`${API_BASE_URL}/api/book`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey,
+          },
+          body: JSON.stringify({ type, id, date }),
+        });
+      } catch (error) {
+        if (attempt >= 2) throw error;
+        await new Promise((resolve) => setTimeout(resolve, 500 * (attempt + 1)));
+        continue;
+      }
+      if (response.status >= 500 && attempt < 2) {
+        await new Promise((resolve) => setTimeout(resolve, 500 * (attempt + 1)));
+        continue;
+      }
+      if (!response.ok) {
+        const error = await response.json().catch(() => null);
+        throw new Error(error?.detail && typeof error.detail === 'string' ? error.detail : 'Failed to book item');
+      }
+      return response.json();
     }
-    return response.json();
   },
 
   async createFlowgladCheckout(hotelId: number, priceSlug?: string, priceId?: string): Promise<{ checkout_url: string; session_id?: string }> {
@@ -10,6 +10,9 @@ interface RecommendationsTabsProps {
   days: number;
   currentDay: number;
   onDayChange: (day: number) => void;
+  hasMore?: boolean;
+  isLoadingMore?: boolean;
+  onLoadMore?: () => void;
 }
 
 export default function RecommendationsTabs({
@@ -18,7 +21,10 @@ export default function RecommendationsTabs({
   attractions,
   days,
   currentDay,
-  onDayChange
+  onDayChange,
+  hasMore = false,
+  isLoadingMore = false,
+  onLoadMore
 }: RecommendationsTabsProps) {
   const [activeTab, setActiveTab] = useState<'hotels' | 'flights' | 'attractions'>('hotels');
   const [selectedItem, setSelectedItem] = useState<{ type: string; item: Hotel | Flight | Attraction } | null>(null);
@@ -155,6 +161,12 @@ export default function RecommendationsTabs({
         )}
       </div>
 
+      {hasMore && onLoadMore && (
+        <button className="load-more-button" onClick={onLoadMore} disabled={isLoadingMore}>
+          {isLoadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
+
       {selectedItem && (
         <div className="modal-overlay" onClick={() => setSelectedItem(null)}>
           <div className="modal-content" onClick={(e) => e.stopPropagation()}>
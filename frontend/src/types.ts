@@ -45,6 +45,8 @@ export interface Recommendations {
   attractions: Attraction[];
   days: number;
   current_day: number;
+  session_id?: string;
+  next_cursor?: string | null;
 }
 
 export interface BookingResponse {